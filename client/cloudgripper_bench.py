@@ -0,0 +1,278 @@
+import argparse
+import contextlib
+import io
+import ipaddress
+import json
+import multiprocessing
+import os
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from client.cloudgripper_client import GripperRobot, decode_image, decode_jpeg
+from client.cloudgripper_fleet import RobotFleet
+from client.cloudgripper_server import StandInServer
+
+
+def _serve(ready, options):
+    server = StandInServer(**options)
+    ready.put(server.url)
+    server.serve_forever()
+
+
+@contextlib.contextmanager
+def stand_in_server(**options):
+    """
+    Run a StandInServer in a separate process, so that it does not compete with the
+    benchmarked client for the GIL
+
+    Args:
+        **options: StandInServer arguments
+
+    Yields:
+        url (str): Base URL of the server
+    """
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(ready, options), daemon=True)
+    process.start()
+    try:
+        yield ready.get(timeout=60)
+    finally:
+        process.terminate()
+        process.join()
+
+
+def is_local(url):
+    """
+    Check whether a server URL points at this machine
+
+    Args:
+        url (str): Base URL of the server
+
+    Returns:
+        local (bool): True for localhost and loopback addresses
+    """
+    host = urlsplit(url).hostname or ''
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _summary(latencies, elapsed, failures=0):
+    latencies = np.asarray(latencies)
+    return {
+        'calls': len(latencies),
+        'failures': failures,
+        'per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000) if len(latencies) else None,
+        'p99_ms': float(np.percentile(latencies, 99) * 1000) if len(latencies) else None,
+        'max_ms': float(latencies.max() * 1000) if len(latencies) else None,
+    }
+
+
+def _timed_calls(call, duration, is_failure):
+    latencies, failures = [], 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        t0 = time.perf_counter()
+        result = call()
+        latencies.append(time.perf_counter() - t0)
+        failures += is_failure(result)
+    return _summary(latencies, time.perf_counter() - start, failures)
+
+
+def bench_commands(robot, duration):
+    """Sequential move_xy commands on one robot"""
+    targets = iter(np.random.default_rng(0).random((1_000_000, 2)))
+    return _timed_calls(lambda: robot.move_xy(*next(targets)), duration, lambda t: t is None)
+
+
+def bench_state(robot, duration):
+    """Sequential get_state calls on one robot"""
+    return _timed_calls(robot.get_state, duration, lambda result: result[0] is None)
+
+
+def bench_frames(robot, duration, **options):
+    """Sequential getImageTop calls on one robot"""
+    return _timed_calls(lambda: robot.getImageTop(**options), duration, lambda result: result[0] is None)
+
+
+def bench_decode(robot, repeats, attempts=5):
+    """Decode cost of a served top camera frame, per decode option"""
+    payload, fetch_failures = None, 0
+    for _ in range(attempts):
+        try:
+            payload = robot._get('/getImageTop')['data']
+            break
+        except Exception:
+            fetch_failures += 1
+    results = {'fetch_failures': fetch_failures}
+    if payload is None:
+        return results
+    jpeg = decode_jpeg(payload)
+    cases = {
+        'base64': lambda: decode_jpeg(payload),
+        'full': lambda: decode_image(jpeg),
+        'reduce_2': lambda: decode_image(jpeg, reduce=2),
+        'reduce_4': lambda: decode_image(jpeg, reduce=4),
+        'reduce_8': lambda: decode_image(jpeg, reduce=8),
+        'grayscale': lambda: decode_image(jpeg, grayscale=True),
+    }
+    for name, case in cases.items():
+        timings, failures = [], 0
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            try:
+                result = case()
+            except Exception:
+                result = None
+            if result is None:
+                failures += 1
+                continue
+            timings.append(time.perf_counter() - t0)
+        results[name] = {'failures': failures}
+        if timings:
+            results[name].update(mean_ms=float(np.mean(timings) * 1000),
+                                 p99_ms=float(np.percentile(timings, 99) * 1000))
+    results['jpeg_bytes'] = len(jpeg)
+    return results
+
+
+def bench_fleet(fleet, duration, command):
+    """Fleet-wide fan-outs of one command"""
+    latencies, failures, calls = [], 0, 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        t0 = time.perf_counter()
+        result = fleet.broadcast(command)
+        latencies.append(time.perf_counter() - t0)
+        calls += len(fleet)
+        failures += len(result.errors) + len(result.timed_out)
+        failures += sum(1 for value in result.results.values() if value[0] is None)
+    summary = _summary(latencies, time.perf_counter() - start, failures)
+    summary['robot_calls_per_second'] = calls / (time.perf_counter() - start)
+    return summary
+
+
+def run(url, duration=3.0, robots=32, decode_repeats=50, workers=32, token='bench', motion=None, fleet=None):
+    """
+    Run the benchmark suite against a CloudGripper API server
+
+    Args:
+        url (str): Base URL of the server
+        duration (float): Seconds spent on each timed workload
+        robots (int): Number of robots in the fleet workloads
+        decode_repeats (int): Number of decodes per decode option
+        workers (int): Maximum concurrent calls of the fleet workloads
+        token (str): API token of the robots
+        motion (bool, optional): Run the move_xy workload, which moves the robot. Defaults
+            to True only for a server on this machine
+        fleet (bool, optional): Run the fleet workloads, which load every robot. Defaults
+            to True only for a server on this machine
+
+    Returns:
+        results (dict): Results of every workload that was run
+    """
+    if motion is None:
+        motion = is_local(url)
+    if fleet is None:
+        fleet = is_local(url)
+    robot = GripperRobot('robot1', token, base_url=url, pool_maxsize=workers)
+    robot_fleet = None
+    results = {}
+    try:
+        if fleet:
+            names = [f'robot{i}' for i in range(1, robots + 1)]
+            robot_fleet = RobotFleet([GripperRobot(name, token, base_url=url, pool_maxsize=workers)
+                                      for name in names], max_workers=workers)
+        with contextlib.redirect_stdout(io.StringIO()):
+            if motion:
+                results['single_commands'] = bench_commands(robot, duration)
+            results['single_get_state'] = bench_state(robot, duration)
+            results['single_frames'] = bench_frames(robot, duration)
+            results['single_frames_reduce_4'] = bench_frames(robot, duration, reduce=4)
+            results['decode'] = bench_decode(robot, decode_repeats)
+            if fleet:
+                results['fleet_get_state'] = bench_fleet(robot_fleet, duration, 'get_state')
+                results['fleet_frames'] = bench_fleet(robot_fleet, duration, 'getImageTop')
+    finally:
+        robot.close()
+        if robot_fleet is not None:
+            robot_fleet.close()
+            for fleet_robot in robot_fleet.robots.values():
+                fleet_robot.close()
+    return results
+
+
+def _ms(value):
+    return f"{value:>10.2f}" if value is not None else f"{'-':>10}"
+
+
+def _print(results):
+    print(f"{'workload':<26}{'calls':>8}{'fail':>6}{'per s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, result in results.items():
+        if name == 'decode':
+            continue
+        print(f"{name:<26}{result['calls']:>8}{result['failures']:>6}{result['per_second']:>10.1f}"
+              f"{_ms(result['p50_ms'])}{_ms(result['p99_ms'])}{_ms(result['max_ms'])}")
+        if 'robot_calls_per_second' in result:
+            print(f"{'':<26}{'robot calls per s:':>24}{result['robot_calls_per_second']:>10.1f}")
+    decode = results['decode']
+    if 'jpeg_bytes' not in decode:
+        print(f"\ndecode skipped, no top frame in {decode['fetch_failures']} attempts")
+        return
+    print(f"\ndecode of a {decode['jpeg_bytes']} byte top frame ({decode['fetch_failures']} failed fetches)")
+    for name, result in decode.items():
+        if name in ('jpeg_bytes', 'fetch_failures'):
+            continue
+        if 'mean_ms' not in result:
+            print(f"{name:<26}{'failed':>10}{result['failures']:>10} failures")
+            continue
+        print(f"{name:<26}{result['mean_ms']:>10.2f} ms mean{result['p99_ms']:>10.2f} ms p99"
+              f"{result['failures']:>10} failures")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CloudGripper client benchmark suite')
+    parser.add_argument('--url', default=None, help='server to benchmark, defaults to a local stand-in server')
+    parser.add_argument('--allow-remote', action='store_true',
+                        help='allow a --url that is not on this machine, e.g. the real robots')
+    parser.add_argument('--motion', action='store_true',
+                        help='also run the move_xy workload against a remote --url (always run locally)')
+    parser.add_argument('--fleet', action='store_true',
+                        help='also run the fleet workloads against a remote --url (always run locally)')
+    parser.add_argument('--token', default=os.environ.get('CLOUDGRIPPER_TOKEN', 'bench'),
+                        help='API token, defaults to the CLOUDGRIPPER_TOKEN environment variable')
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds per workload')
+    parser.add_argument('--robots', type=int, default=32, help='robots in the fleet workloads')
+    parser.add_argument('--workers', type=int, default=32, help='concurrent calls in the fleet workloads')
+    parser.add_argument('--latency', type=float, default=0.02, help='stand-in mean latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.005, help='stand-in latency standard deviation in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='stand-in HTTP 503 probability')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    if args.url is not None:
+        if not is_local(args.url) and not args.allow_remote:
+            parser.error(f'{args.url} is not on this machine, pass --allow-remote to benchmark it')
+        server = contextlib.nullcontext(args.url)
+    else:
+        server = stand_in_server(latency=args.latency, jitter=args.jitter,
+                                 failure_rate=args.failure_rate, seed=args.seed)
+    with server as url:
+        local = is_local(url)
+        results = run(url, args.duration, args.robots, workers=args.workers, token=args.token,
+                      motion=local or args.motion, fleet=local or args.fleet)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print(results)
+
+
+if __name__ == '__main__':
+    main()
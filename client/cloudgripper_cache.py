@@ -0,0 +1,214 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from operator import itemgetter
+
+
+class _Flight:
+    """
+    A fetch in progress that concurrent callers can wait on
+    """
+    __slots__ = ('epoch', 'started', 'done', 'result', 'error')
+
+    def __init__(self, epoch):
+        self.epoch = epoch
+        self.started = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class StateCache:
+    """
+    A TTL cache for get_state that coalesces concurrent requests
+
+    Callers within `ttl` seconds of a fetch get the cached state, and callers arriving
+    while a fetch is in flight wait for it instead of sending their own request. Motion
+    commands call invalidate() before they are sent and after they complete, which
+    discards the cached state and detaches any fetch that overlapped the command, so a
+    caller never gets a state from before its own command.
+
+    Args:
+        ttl (float): Maximum age in seconds of a cached state, measured from the start of its request
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._value = None
+        self._fetched_at = None
+        self._flight = None
+
+    def invalidate(self):
+        """
+        Discard the cached state and any fetch currently in flight
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._epoch += 1
+            self._value = None
+            self._flight = None
+
+    def get(self, fetch):
+        """
+        Get the cached state, or fetch it if the cache is stale
+
+        Args:
+            fetch (callable): Function returning (state, timestamp), called at most once
+                for all concurrent callers
+
+        Returns:
+            state (dict): The robot state
+            timestamp (float): Timestamp of the state in seconds since the epoch
+        """
+        with self._lock:
+            if self._value is not None and time.monotonic() - self._fetched_at <= self.ttl:
+                self.hits += 1
+                return self._value
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = _Flight(self._epoch)
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fetch()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flight is flight:
+                    self._flight = None
+                state = flight.result[0] if flight.result is not None else None
+                if state is not None and flight.epoch == self._epoch:
+                    self._value = flight.result
+                    self._fetched_at = flight.started
+            flight.done.set()
+        return flight.result
+
+
+class Frame(tuple):
+    """
+    An (image, timestamp) pair returned by the image endpoints when a FrameCache is used
+
+    Unpacks like the usual (image, timestamp) tuple and also carries `is_duplicate`, True if
+    the compressed frame was identical to a cached one and its decode was skipped.
+    """
+
+    def __new__(cls, image, timestamp, is_duplicate=False):
+        frame = tuple.__new__(cls, (image, timestamp))
+        frame.is_duplicate = is_duplicate
+        return frame
+
+    image = property(itemgetter(0))
+    timestamp = property(itemgetter(1))
+
+    def __repr__(self):
+        shape = getattr(self[0], 'shape', None)
+        return f"Frame(shape={shape}, timestamp={self[1]}, is_duplicate={self.is_duplicate})"
+
+
+class FrameCache:
+    """
+    A cache of decoded camera frames keyed by a hash of their compressed payload
+
+    A static scene, or polling faster than the camera refreshes, returns byte-identical
+    JPEGs; with a FrameCache they come back from the cache instead of being decoded again.
+    Cached images are read-only because every duplicate shares the same array. One cache can
+    be shared by several robots.
+
+    Args:
+        max_bytes (int): Upper bound on the memory used by the cached images
+        max_entries (int, optional): Upper bound on the number of cached images
+        policy (str): Eviction order when a bound is exceeded, 'lru' evicts the least
+            recently used frame and 'fifo' the oldest inserted one
+    """
+
+    def __init__(self, max_bytes=64 * 2 ** 20, max_entries=None, policy='lru'):
+        if policy not in ('lru', 'fifo'):
+            raise ValueError(f"Unknown policy '{policy}', expected 'lru' or 'fifo'")
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._frames = OrderedDict()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def clear(self):
+        """
+        Drop every cached frame
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._frames.clear()
+            self.bytes = 0
+
+    def get(self, payload, decode, variant=()):
+        """
+        Get the decoded image of a payload, decoding it only if it is not cached
+
+        Args:
+            payload (str or bytes): The compressed (or base64 encoded) frame
+            decode (callable): Function returning the decoded image, called on a miss
+            variant (tuple): Decode options that change the result, e.g. (reduce, grayscale)
+
+        Returns:
+            image (numpy.ndarray): The read-only decoded image, None if decoding failed
+            is_duplicate (bool): True if the image came from the cache
+        """
+        if isinstance(payload, str):
+            payload = payload.encode('ascii')
+        key = (hashlib.blake2b(payload, digest_size=16).digest(),) + tuple(variant)
+        with self._lock:
+            image = self._frames.get(key)
+            if image is not None:
+                self.hits += 1
+                if self.policy == 'lru':
+                    self._frames.move_to_end(key)
+                return image, True
+            self.misses += 1
+
+        image = decode()
+        if image is None or image.nbytes > self.max_bytes:
+            return image, False
+        image.flags.writeable = False
+        with self._lock:
+            if key not in self._frames:
+                self._frames[key] = image
+                self.bytes += image.nbytes
+                while self._frames and (self.bytes > self.max_bytes or
+                                        (self.max_entries is not None and len(self._frames) > self.max_entries)):
+                    _, evicted = self._frames.popitem(last=False)
+                    self.bytes -= evicted.nbytes
+                    self.evictions += 1
+        return image, False
@@ -0,0 +1,256 @@
+import gzip
+import io
+import threading
+import time
+from collections import deque
+from json import dumps as json_dumps
+from json import loads as json_loads
+from urllib.parse import urlsplit
+
+from requests import Session, exceptions
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+FORMAT_VERSION = 1
+
+# Default number of cassette entries a replay holds in memory ahead of the requests
+LOOKAHEAD = 256
+
+
+def _open(path, mode):
+    """
+    Open a cassette for streaming text I/O, gzip compressed if the path ends with .gz
+    """
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _key(method, url):
+    parts = urlsplit(url)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    return f'{method} {path}'
+
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    A transport adapter that sends requests and records them to a cassette
+
+    Every request is written as one JSON line as soon as it completes: the method and path
+    (without host, so a recording can be replayed against any base URL), the status, the
+    response body including base64 image payloads, the response time, and the error for
+    failed requests. Request headers, and so the API token, are not recorded. Paths ending
+    with .gz are gzip compressed.
+
+    Args:
+        path (str): File to write the cassette to
+        flush_every (int): Flush the file after this many entries
+        **adapter_kwargs: HTTPAdapter arguments, e.g. pool_maxsize
+    """
+
+    def __init__(self, path, flush_every=64, **adapter_kwargs):
+        super().__init__(**adapter_kwargs)
+        self.path = path
+        self.flush_every = flush_every
+        self.entries = 0
+        self._file = _open(path, 'w')
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._write({'version': FORMAT_VERSION, 'created': time.time()})
+
+    def _write(self, entry):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(json_dumps(entry, separators=(',', ':')) + '\n')
+            self.entries += 1
+            if self.entries % self.flush_every == 0:
+                self._file.flush()
+
+    def send(self, request, **kwargs):
+        started = time.monotonic()
+        entry = {'key': _key(request.method, request.url), 'offset': started - self._start}
+        try:
+            response = super().send(request, **kwargs)
+            # Read the body here, so that it can be recorded and is still available to the caller
+            content = response.content
+        except exceptions.RequestException as e:
+            entry.update(elapsed=time.monotonic() - started, error=type(e).__name__, message=str(e))
+            self._write(entry)
+            raise
+        entry.update(elapsed=time.monotonic() - started, status=response.status_code,
+                     reason=response.reason, content_type=response.headers.get('Content-Type'),
+                     body=content.decode('utf-8', errors='surrogateescape'))
+        self._write(entry)
+        return response
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        super().close()
+
+
+class ReplayAdapter(HTTPAdapter):
+    """
+    A transport adapter that answers requests from a cassette instead of the network
+
+    Requests are matched to recorded entries by method and path, in recording order, so
+    concurrent requests to different robots and endpoints may arrive in any order. The
+    cassette is read lazily and at most `lookahead` entries are held in memory: a request
+    whose entry is not within that window of the last entry read counts as missing, and
+    unrequested entries that fall behind the window are skipped. Recorded failures are
+    raised again as the same requests exception.
+
+    Args:
+        path (str): The cassette file
+        realtime (bool): Replay the recorded timing: a response is returned no earlier than
+            its request was sent in the recording, relative to the first request, plus its
+            recorded response time. False answers as fast as possible
+        strict (bool): Raise requests.exceptions.ConnectionError for requests missing from the
+            cassette. If False, they are answered with HTTP 404
+        lookahead (int): Maximum number of cassette entries held in memory
+    """
+
+    def __init__(self, path, realtime=False, strict=True, lookahead=LOOKAHEAD):
+        super().__init__()
+        self.path = path
+        self.realtime = realtime
+        self.strict = strict
+        self.lookahead = lookahead
+        self.replayed = 0
+        self.missing = 0
+        self.skipped = 0
+        self._file = _open(path, 'r')
+        self._lock = threading.Lock()
+        self._ahead = {}
+        # (line, key) of the buffered entries in cassette order
+        self._window = deque()
+        self._line = 0
+        self._origin = None
+        header = json_loads(self._file.readline() or '{}')
+        if header.get('version') != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} cassette")
+
+    def _buffer(self, entry):
+        """
+        Hold an entry read ahead, skipping the entries that fall out of the window
+        """
+        entry['line'] = self._line
+        self._ahead.setdefault(entry['key'], deque()).append(entry)
+        self._window.append((self._line, entry['key']))
+        while self._window and self._window[0][0] <= self._line - self.lookahead:
+            line, key = self._window.popleft()
+            entries = self._ahead.get(key)
+            if entries and entries[0]['line'] == line:
+                entries.popleft()
+                self.skipped += 1
+                if not entries:
+                    del self._ahead[key]
+
+    def _next(self, key):
+        """
+        Get the next recorded entry of a key, reading at most `lookahead` entries ahead
+        """
+        with self._lock:
+            entries = self._ahead.get(key)
+            if entries:
+                entry = entries.popleft()
+                if not entries:
+                    del self._ahead[key]
+                return entry
+            for _ in range(self.lookahead):
+                line = self._file.readline() if self._file is not None else ''
+                if not line:
+                    break
+                self._line += 1
+                entry = json_loads(line)
+                if entry['key'] == key:
+                    return entry
+                self._buffer(entry)
+            self.missing += 1
+            return None
+
+    def _delay(self, entry):
+        """
+        Seconds to hold a response to reproduce the recorded timing
+        """
+        now = time.monotonic()
+        offset = entry.get('offset')
+        if offset is None:
+            return entry['elapsed']
+        with self._lock:
+            if self._origin is None:
+                self._origin = now - offset
+            sent = self._origin + offset
+        return max(0.0, sent - now) + entry['elapsed']
+
+    def send(self, request, **kwargs):
+        entry = self._next(_key(request.method, request.url))
+        if entry is None:
+            if self.strict:
+                raise exceptions.ConnectionError(f'{request.method} {request.url} is not in the cassette',
+                                                 request=request)
+            entry = {'status': 404, 'reason': 'Not Found', 'body': '', 'elapsed': 0.0}
+        if self.realtime:
+            delay = self._delay(entry)
+            if delay > 0:
+                time.sleep(delay)
+        self.replayed += 1
+
+        if 'error' in entry:
+            error = getattr(exceptions, entry['error'], exceptions.RequestException)
+            if not (isinstance(error, type) and issubclass(error, exceptions.RequestException)):
+                error = exceptions.RequestException
+            raise error(entry['message'], request=request)
+
+        body = entry['body'].encode('utf-8', errors='surrogateescape')
+        response = Response()
+        response.status_code = entry['status']
+        response.reason = entry.get('reason')
+        response.headers = CaseInsensitiveDict({'Content-Length': str(len(body))})
+        if entry.get('content_type'):
+            response.headers['Content-Type'] = entry['content_type']
+        response.raw = io.BytesIO(body)
+        response._content = body
+        response._content_consumed = True
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        super().close()
+
+
+def cassette_session(path, mode='replay', realtime=False, **adapter_kwargs):
+    """
+    Create a session that records to or replays from a cassette
+
+    Pass it to GripperRobot(..., session=...). Closing the session closes the cassette.
+
+    Args:
+        path (str): The cassette file, gzip compressed if it ends with .gz
+        mode (str): 'record' sends requests and records them, 'replay' answers them from the cassette
+        realtime (bool): When replaying, reproduce the recorded request timing and response times
+        **adapter_kwargs: RecordingAdapter or ReplayAdapter arguments
+
+    Returns:
+        session (requests.Session): The session
+    """
+    if mode == 'record':
+        adapter = RecordingAdapter(path, **adapter_kwargs)
+    elif mode == 'replay':
+        adapter = ReplayAdapter(path, realtime=realtime, **adapter_kwargs)
+    else:
+        raise ValueError(f"Unknown mode '{mode}', expected 'record' or 'replay'")
+    session = Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
@@ -1,291 +1,237 @@
-from requests import put, get, post, exceptions
-import cv2
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import time
-import base64
-import numpy as np
 
-api_address_robots = {f"robot{i}": f"https://cloudgripper.eecs.kth.se:8443/robot{i}/api/v1.1/robot" for i in range(1, 33)}
-
-class GripperRobot:
+from client.cloudgripper_control import (GripperControl, api_address_robots, robot_api_address,
+                                         DEFAULT_TIMEOUT, create_session, get_shared_session)
+from client.cloudgripper_cache import Frame
+from client.cloudgripper_observation import fetch_observation
+
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+# cv2.imdecode flag names for each (reduce, grayscale) combination. cv2 is imported on
+# first decode so that importing the client stays cheap
+_IMREAD_FLAGS = {
+    (1, False): 'IMREAD_COLOR',
+    (2, False): 'IMREAD_REDUCED_COLOR_2',
+    (4, False): 'IMREAD_REDUCED_COLOR_4',
+    (8, False): 'IMREAD_REDUCED_COLOR_8',
+    (1, True): 'IMREAD_GRAYSCALE',
+    (2, True): 'IMREAD_REDUCED_GRAYSCALE_2',
+    (4, True): 'IMREAD_REDUCED_GRAYSCALE_4',
+    (8, True): 'IMREAD_REDUCED_GRAYSCALE_8',
+}
+
+
+def decode_jpeg(data):
     """
-    A class to represent a CloudGripper robot
+    Decode the base64 payload of an image response into the raw JPEG bytes
 
     Args:
-        name (str): The name of the robot
-        token (str): The token of the robot
-    """
-    global api_address_robots
-
-    def __init__(self, name, token):
-        self.name = name
-        self.headers = {"apiKey": token}
-        self.base_api = api_address_robots[name]
-
-    def get_state(self):
-        """
-        Get the current state of the robot
-
-        Args:
-            None
-        
-        Returns:
-            state (dict): current state of the robot:
-                - 'x_norm': Normalized x-coordinate of the robot's position
-                - 'y_norm': Normalized y-coordinate of the robot's position
-                - 'z_norm': Normalized z-coordinate of the robot's position
-                - 'rotation': Current rotation angle of the robot (in degrees)
-                - 'claw_norm': Normalized state of the robot's gripper (0 for closed, 1 for open)
-                - 'z_current': Current in the z-axis servo motor
-                - 'rotation_current': Current in the rotation servo motor
-                - 'claw_current': Current in the claw servo motor
-            timestamp (float): timestamp of the state in seconds since the epoch
-        """
-        try:
-            call_api = get(self.base_api + '/getState',
-                           headers=self.headers).json()
-            return call_api['state'], call_api['timestamp']
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None, None
-
-    def step_forward(self):
-        """
-        Move the robot one step forward (y-direction)
-
-        Args:
-            None
-
-        Returns:
-            timestamp (float): timestamp of the command in seconds since the epoch
-        """
-        try:
-            call_api = get(self.base_api + '/moveUp',
-                           headers=self.headers).json()
-            return call_api['time']
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None
-
-    def step_backward(self):
-        """
-        Move the robot one step backward (y-direction)
-
-        Args:
-            None
-
-        Returns:
-            timestamp (float): timestamp of the command in seconds since the epoch
-        """
-        try:
-            call_api = get(self.base_api + '/moveDown',
-                           headers=self.headers).json()
-            return call_api['time']
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None
-        
-    def step_left(self):
-        """
-        Move the robot one step left (x-direction)
-
-        Args:
-            None
-
-        Returns:
-            timestamp (float): timestamp of the command in seconds since the epoch
-        """
-        try:
-            call_api = get(self.base_api + '/moveLeft',
-                           headers=self.headers).json()
-            return call_api['time']
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None
-        
-    def step_right(self):
-        """
-        Move the robot one step right (x-direction)
+        data (str or bytes): The base64 encoded image
 
-        Args:
-            None
+    Returns:
+        jpeg (bytes): The compressed JPEG image
+    """
+    return base64.b64decode(data)
 
-        Returns:
-            timestamp (float): timestamp of the command in seconds since the epoch
-        """
-        try:
-            call_api = get(self.base_api + '/moveRight',
-                           headers=self.headers).json()
-            return call_api['time']
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None
-
-    def move_gripper(self, angle):
-        """
-        Move the robot's gripper to the specified angle
 
-        Args:
-            angle (float): The desired angle for the gripper (0 for closed, 1 for open)
+def decode_image(data, reduce=1, grayscale=False, out=None):
+    """
+    Decode a base64 encoded JPEG image as returned by the API
 
-        Returns:
-            timestamp (float): Timestamp of the command in seconds since the epoch
-        """
-        self.gripperAngle = angle
-        try:
-            call_api = get(self.base_api + '/grip/' + str(self.gripperAngle),
-                           headers=self.headers).json()
-            return call_api['time']
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None
-
-    def gripper_close(self):
-        """
-        Close the robot's gripper
+    Args:
+        data (str or bytes): The base64 encoded image, or the raw JPEG bytes
+        reduce (int): Downscale factor applied while decoding (1, 2, 4 or 8). Reduced
+            decoding skips most of the JPEG work and is much faster than resizing afterwards
+        grayscale (bool): Decode to a single-channel grayscale image
+        out (numpy.ndarray, optional): Preallocated uint8 array of the decoded shape to
+            write the image into
+
+    Returns:
+        image (numpy.ndarray): The decoded BGR (or grayscale) image, `out` if given
+    """
+    try:
+        flag = _IMREAD_FLAGS[(reduce, bool(grayscale))]
+    except KeyError:
+        raise ValueError(f"reduce must be 1, 2, 4 or 8, got {reduce}")
+    import cv2
+    import numpy as np
+
+    if isinstance(data, str) or data[:2] != b'\xff\xd8':
+        data = decode_jpeg(data)
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), getattr(cv2, flag))
+    if out is None or image is None:
+        return image
+    if out.shape != image.shape:
+        raise ValueError(f"out has shape {out.shape}, decoded image has shape {image.shape}")
+    np.copyto(out, image)
+    return out
+
+
+def _copy_out(decode):
+    """
+    Decode an image and copy it out of the decode pool's shared memory
+    """
+    image = decode()
+    return None if image is None else image.copy()
 
-        Args:
-            None
 
-        Returns:
-            timestamp (float): Timestamp of the command in seconds since the epoch
-        """
-        time_stamp = self.move_gripper(0)
-        return time_stamp
+class GripperRobot(GripperControl):
+    """
+    A class to represent a CloudGripper robot
 
-    def gripper_open(self):
-        """
-        Open the robot's gripper
+    All calls go through a keep-alive connection pool. By default robots on the same
+    host share one pool, so an instance (and several instances) can be used from many
+    threads at once. OpenCV and NumPy are only imported when the first image is decoded;
+    processes that never need images can use GripperControl instead.
 
-        Args:
-            None
+    Args:
+        See GripperControl, and:
+        frame_cache (FrameCache, optional): Keep decoded frames keyed by a hash of their JPEG
+            payload, so that repeated frames are not decoded again. The image endpoints then
+            return Frame tuples with an `is_duplicate` flag. One cache can be shared by several robots
+        decode_pool (DecodePool, optional): Decode images in worker processes into shared
+            memory instead of on the calling thread. One pool can be shared by several robots.
+            Frames kept by a frame cache are copied out of shared memory, so they hold no slot
+    """
 
-        Returns:
-            timestamp (float): Timestamp of the command in seconds since the epoch
-        """
-        time_stamp = self.move_gripper(1)
-        return time_stamp
+    def __init__(self, name, token, *args, frame_cache=None, decode_pool=None, **kwargs):
+        self.frame_cache = frame_cache
+        self.decode_pool = decode_pool
+        super().__init__(name, token, *args, **kwargs)
 
-    def rotate(self, angle):
+    def _decode(self, data, reduce, grayscale, out):
         """
-        Rotate the robot to the specified angle
-
-        Args:
-            angle (float): The desired rotation angle for the robot (in degrees)
+        Decode an image payload, through the frame cache and decode pool if there are
 
         Returns:
-            timestamp (float): Timestamp of the command in seconds since the epoch
-        """
-        self.rotationAngle = angle
-        try:
-            call_api = get(self.base_api + '/rotate/' +
-                           str(angle), headers=self.headers).json()
-            return call_api['time']
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None
-
-    def move_z(self, z):
-        """
-        Move the robot's z-axis to the specified normalized position (z-direction)
+            image (numpy.ndarray): The decoded image
+            is_duplicate (bool): True if the frame was served from the frame cache
+        """
+        if self.decode_pool is not None:
+            decode = partial(self.decode_pool.decode, data, reduce, grayscale)
+            if self.frame_cache is not None:
+                # A cached view would hold its shared memory slot for as long as it is cached
+                decode = partial(_copy_out, decode)
+        elif self.frame_cache is None:
+            decode = partial(decode_image, data, reduce, grayscale, out)
+        else:
+            # Cached images are shared, so they must not be decoded into the caller's array
+            decode = partial(decode_image, data, reduce, grayscale)
+        if self.frame_cache is None:
+            image, is_duplicate = decode(), False
+        else:
+            image, is_duplicate = self.frame_cache.get(data, decode, (reduce, bool(grayscale)))
+        if out is not None and image is not None and image is not out:
+            if out.shape != image.shape:
+                raise ValueError(f"out has shape {out.shape}, decoded image has shape {image.shape}")
+            out[...] = image
+            image = out
+        return image, is_duplicate
+
+    def _get_image(self, endpoint, raw=False, reduce=1, grayscale=False, out=None):
+        """
+        Fetch and decode a camera image
 
         Args:
-            z (float): The desired z-axis position for the robot (0 for fully down, 1 for fully up)
+            endpoint (str): Path of the image endpoint
+            raw (bool): Return the compressed JPEG bytes without decoding them
+            reduce (int): Downscale factor applied while decoding (1, 2, 4 or 8)
+            grayscale (bool): Decode to a single-channel grayscale image
+            out (numpy.ndarray, optional): Preallocated array to decode the image into
 
         Returns:
-            timestamp (float): Timestamp of the command in seconds since the epoch
+            image (numpy.ndarray or bytes): The camera image as a numpy array, or JPEG bytes if raw
+            time_stamp (float): Timestamp of the image in seconds since the epoch
+            A Frame of both, with the `is_duplicate` flag, when the robot has a frame cache
         """
-        self.zaxisAngle = z
         try:
-            call_api = get(self.base_api + '/up_down/' +
-                           str(z), headers=self.headers).json()
-            return call_api['time']
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None
-
-    def move_xy(self, x, y):
-        """
-        Move the robot to the specified normalized x and y coordinates
-
-        Args:
-            x (float): The desired normalized x-coordinate for the robot (0 for leftmost, 1 for rightmost)
-            y (float): The desired normalized y-coordinate for the robot (0 for backmost, 1 for forwardmost)
-
-        Returns:
-            timestamp (float): Timestamp of the command in seconds since the epoch
-        """
-        self.robotPositionX = x
-        self.robotPositionY = y
+            call_api = self._get(endpoint, idempotent=True)
+        except Exception:
+            # Request errors are already counted by the request instrumentation
+            print("Image not available")
+            return self._no_image()
         try:
-            call_api = get(self.base_api + '/gcode/' + str(x) +
-                           '/' + str(y), headers=self.headers).json()
-            return call_api['time']
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None
-
-    def calibrate(self):
+            started = time.perf_counter()
+            is_duplicate = False
+            if raw:
+                source = decode_jpeg(call_api['data'])
+            else:
+                source, is_duplicate = self._decode(call_api['data'], reduce, grayscale, out)
+            if self.metrics is not None:
+                self.metrics.observe(self.name, endpoint, 'decode', started, time.perf_counter() - started)
+            time_stamp = call_api['time']
+        except Exception as e:
+            print("Image not available:", e)
+            if self.metrics is not None:
+                self.metrics.record_error(self.name, endpoint, e)
+            return self._no_image()
+        if self.frame_cache is not None:
+            return Frame(source, time_stamp, is_duplicate)
+        return source, time_stamp
+
+    def _no_image(self):
+        if self.frame_cache is not None:
+            return Frame(None, None)
+        return None, None
+
+    def getImageBase(self, raw=False, reduce=1, grayscale=False, out=None):
         """
-        (INACTIVE) Calibrate the robot's position and orientation
+        Get the base camera image from the robot
 
         Args:
-            None
+            raw (bool): Return the compressed JPEG bytes without decoding them
+            reduce (int): Downscale factor applied while decoding (1, 2, 4 or 8)
+            grayscale (bool): Decode to a single-channel grayscale image
+            out (numpy.ndarray, optional): Preallocated uint8 array of the decoded shape to
+                write the image into, reused across calls to avoid allocating a frame per call
 
         Returns:
-            None
+            image (numpy.ndarray): The base camera image as a numpy array (JPEG bytes if raw)
+            time_stamp (float): Timestamp of the image in seconds since the epoch
         """
-        try:
-            get(self.base_api +
-                '/calibrate', headers=self.headers).json()
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
+        return self._get_image('/getImageBase', raw, reduce, grayscale, out)
 
-    def getImageBase(self):
+    def getImageTop(self, raw=False, reduce=1, grayscale=False, out=None):
         """
-        Get the base camera image from the robot
+        Get the top camera image from the robot
 
         Args:
-            None
+            raw (bool): Return the compressed JPEG bytes without decoding them
+            reduce (int): Downscale factor applied while decoding (1, 2, 4 or 8)
+            grayscale (bool): Decode to a single-channel grayscale image
+            out (numpy.ndarray, optional): Preallocated uint8 array of the decoded shape to
+                write the image into, reused across calls to avoid allocating a frame per call
 
         Returns:
-            image (numpy.ndarray): The base camera image as a numpy array
+            image (numpy.ndarray): The top camera image as a numpy array (JPEG bytes if raw)
             time_stamp (float): Timestamp of the image in seconds since the epoch
         """
-        try:
-            call_api = get(
-                self.base_api+'/getImageBase', headers=self.headers).json()
-            getimage = call_api['data']
-            time_stamp = call_api['time']
-            encode_img = getimage.encode('latin1')
-            img = base64.b64decode(encode_img)
-            npimg = np.frombuffer(img, dtype=np.uint8)
-            source = cv2.imdecode(npimg, 1)
-            return source, time_stamp
-        except:
-            print("Image not available")
-            return None, None
+        return self._get_image('/getImageTop', raw, reduce, grayscale, out)
 
-    def getImageTop(self):
+    def get_observation(self, max_skew=None, max_refetch=2, **image_options):
         """
-        Get the top camera image from the robot
+        Get the top image, base image and state of the robot in one call
+
+        The three requests are sent concurrently, so an observation costs roughly one
+        round trip instead of three.
 
         Args:
-            None
+            max_skew (float, optional): Maximum allowed spread between the component
+                timestamps in seconds. Components that are older than this relative to the
+                newest one (or missing) are fetched again
+            max_refetch (int): Maximum number of refetch rounds when max_skew is exceeded
+            **image_options: Options passed to getImageTop/getImageBase (raw, reduce, grayscale)
 
         Returns:
-            image (numpy.ndarray): The top camera image as a numpy array
-            time_stamp (float): Timestamp of the image in seconds since the epoch
+            observation (Observation): The images, state, their timestamps and the skew between them
         """
-        try:
-            call_api = get(
-                self.base_api+'/getImageTop', headers=self.headers).json()
-            getimage = call_api['data']
-            time_stamp = call_api['time']
-            encode_img = getimage.encode('latin1')
-            img = base64.b64decode(encode_img)
-            npimg = np.frombuffer(img, dtype=np.uint8)
-            source = cv2.imdecode(npimg, 1)
-            return source, time_stamp
-        except:
-            print("Image not available")
-            return None, None
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=3,
+                                                    thread_name_prefix=f'cloudgripper-{self.name}')
+        return fetch_observation(self, self._executor, max_skew, max_refetch, **image_options)
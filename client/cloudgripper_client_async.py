@@ -0,0 +1,391 @@
+import asyncio
+import weakref
+import aiohttp
+
+from client.cloudgripper_client import decode_image, decode_jpeg
+from client.cloudgripper_control import robot_api_address, json_loads, DEFAULT_TIMEOUT
+from client.cloudgripper_observation import fetch_observation_async
+
+# Sessions shared by all robots driven from the same event loop
+_shared_async_sessions = weakref.WeakKeyDictionary()
+
+
+def create_async_session(limit=100, limit_per_host=0, timeout=DEFAULT_TIMEOUT):
+    """
+    Create a keep-alive aiohttp session with a connection pool
+
+    Must be called from a running event loop.
+
+    Args:
+        limit (int): Maximum number of simultaneous connections (0 for no limit)
+        limit_per_host (int): Maximum number of simultaneous connections per host (0 for no limit)
+        timeout (float or tuple): (connect, read) timeout in seconds
+
+    Returns:
+        session (aiohttp.ClientSession): A session that reuses connections between calls
+    """
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host)
+    return aiohttp.ClientSession(connector=connector, timeout=_client_timeout(timeout))
+
+
+async def get_shared_async_session(limit=100):
+    """
+    Get the session shared by all async robots on the running event loop
+
+    Args:
+        limit (int): Maximum number of simultaneous connections, used when the session is created
+
+    Returns:
+        session (aiohttp.ClientSession): The shared session
+    """
+    loop = asyncio.get_running_loop()
+    session = _shared_async_sessions.get(loop)
+    if session is None or session.closed:
+        session = create_async_session(limit=limit)
+        _shared_async_sessions[loop] = session
+    return session
+
+
+async def close_shared_async_session():
+    """
+    Close the shared session of the running event loop
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    session = _shared_async_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+def _client_timeout(timeout):
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+    else:
+        connect = read = timeout
+    return aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read)
+
+
+class AsyncGripperRobot:
+    """
+    An asyncio counterpart of GripperRobot
+
+    Every method of GripperRobot is available as a coroutine with the same arguments and
+    return values. Robots share one pooled session per event loop unless a session is
+    given or sharing is disabled, and images are decoded in the loop's default executor
+    so that decoding does not block other robots.
+
+    Args:
+        name (str): The name of the robot
+        token (str): The token of the robot
+        session (aiohttp.ClientSession, optional): Session to send requests with. It is not
+            closed by close(). Defaults to the shared session of the running event loop
+        share_session (bool): Use the shared session when no session is given. If False,
+            the robot creates its own session on first use and closes it in close()
+        timeout (float or tuple): (connect, read) timeout in seconds for every call
+        base_url (str, optional): Server to send requests to instead of the CloudGripper API
+    """
+
+    def __init__(self, name, token, session=None, share_session=True, timeout=DEFAULT_TIMEOUT, base_url=None):
+        self.name = name
+        self.headers = {"apiKey": token}
+        self.base_api = robot_api_address(name, base_url)
+        self.session = session
+        self.share_session = share_session
+        self._owns_session = session is None and not share_session
+        self.timeout = _client_timeout(timeout)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """
+        Close the robot's session if it created one
+
+        Sessions passed in by the caller are left open, and so is the shared session, which
+        the other robots still use; close it with close_shared_async_session().
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _get(self, endpoint):
+        """
+        Send a GET request to an API endpoint over the pooled session
+
+        Args:
+            endpoint (str): Path of the endpoint relative to the robot's API address
+
+        Returns:
+            response (dict): The decoded JSON response
+        """
+        session = self.session
+        if session is None:
+            if self._owns_session:
+                session = self.session = create_async_session()
+            else:
+                session = await get_shared_async_session()
+        async with session.get(self.base_api + endpoint,
+                               headers=self.headers, timeout=self.timeout) as response:
+            return json_loads(await response.read())
+
+    async def _command(self, endpoint):
+        """
+        Send a command to the robot
+
+        Args:
+            endpoint (str): Path of the command endpoint
+
+        Returns:
+            timestamp (float): Timestamp of the command in seconds since the epoch
+        """
+        try:
+            call_api = await self._get(endpoint)
+            return call_api['time']
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            print('Request failed:', e)
+            return None
+
+    async def _get_image(self, endpoint, raw=False, reduce=1, grayscale=False, out=None):
+        """
+        Fetch a camera image and decode it off the event loop
+
+        Args:
+            endpoint (str): Path of the image endpoint
+            raw (bool): Return the compressed JPEG bytes without decoding them
+            reduce (int): Downscale factor applied while decoding (1, 2, 4 or 8)
+            grayscale (bool): Decode to a single-channel grayscale image
+            out (numpy.ndarray, optional): Preallocated array to decode the image into
+
+        Returns:
+            image (numpy.ndarray or bytes): The camera image as a numpy array, or JPEG bytes if raw
+            time_stamp (float): Timestamp of the image in seconds since the epoch
+        """
+        try:
+            call_api = await self._get(endpoint)
+            loop = asyncio.get_running_loop()
+            if raw:
+                source = await loop.run_in_executor(None, decode_jpeg, call_api['data'])
+            else:
+                source = await loop.run_in_executor(None, decode_image, call_api['data'],
+                                                    reduce, grayscale, out)
+            return source, call_api['time']
+        except Exception:
+            print("Image not available")
+            return None, None
+
+    async def get_state(self):
+        """
+        Get the current state of the robot
+
+        Args:
+            None
+
+        Returns:
+            state (dict): current state of the robot, see GripperRobot.get_state
+            timestamp (float): timestamp of the state in seconds since the epoch
+        """
+        try:
+            call_api = await self._get('/getState')
+            return call_api['state'], call_api['timestamp']
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            print('Request failed:', e)
+            return None, None
+
+    async def step_forward(self):
+        """
+        Move the robot one step forward (y-direction)
+
+        Args:
+            None
+
+        Returns:
+            timestamp (float): timestamp of the command in seconds since the epoch
+        """
+        return await self._command('/moveUp')
+
+    async def step_backward(self):
+        """
+        Move the robot one step backward (y-direction)
+
+        Args:
+            None
+
+        Returns:
+            timestamp (float): timestamp of the command in seconds since the epoch
+        """
+        return await self._command('/moveDown')
+
+    async def step_left(self):
+        """
+        Move the robot one step left (x-direction)
+
+        Args:
+            None
+
+        Returns:
+            timestamp (float): timestamp of the command in seconds since the epoch
+        """
+        return await self._command('/moveLeft')
+
+    async def step_right(self):
+        """
+        Move the robot one step right (x-direction)
+
+        Args:
+            None
+
+        Returns:
+            timestamp (float): timestamp of the command in seconds since the epoch
+        """
+        return await self._command('/moveRight')
+
+    async def move_gripper(self, angle):
+        """
+        Move the robot's gripper to the specified angle
+
+        Args:
+            angle (float): The desired angle for the gripper (0 for closed, 1 for open)
+
+        Returns:
+            timestamp (float): Timestamp of the command in seconds since the epoch
+        """
+        self.gripperAngle = angle
+        return await self._command('/grip/' + str(angle))
+
+    async def gripper_close(self):
+        """
+        Close the robot's gripper
+
+        Args:
+            None
+
+        Returns:
+            timestamp (float): Timestamp of the command in seconds since the epoch
+        """
+        return await self.move_gripper(0)
+
+    async def gripper_open(self):
+        """
+        Open the robot's gripper
+
+        Args:
+            None
+
+        Returns:
+            timestamp (float): Timestamp of the command in seconds since the epoch
+        """
+        return await self.move_gripper(1)
+
+    async def rotate(self, angle):
+        """
+        Rotate the robot to the specified angle
+
+        Args:
+            angle (float): The desired rotation angle for the robot (in degrees)
+
+        Returns:
+            timestamp (float): Timestamp of the command in seconds since the epoch
+        """
+        self.rotationAngle = angle
+        return await self._command('/rotate/' + str(angle))
+
+    async def move_z(self, z):
+        """
+        Move the robot's z-axis to the specified normalized position (z-direction)
+
+        Args:
+            z (float): The desired z-axis position for the robot (0 for fully down, 1 for fully up)
+
+        Returns:
+            timestamp (float): Timestamp of the command in seconds since the epoch
+        """
+        self.zaxisAngle = z
+        return await self._command('/up_down/' + str(z))
+
+    async def move_xy(self, x, y):
+        """
+        Move the robot to the specified normalized x and y coordinates
+
+        Args:
+            x (float): The desired normalized x-coordinate for the robot (0 for leftmost, 1 for rightmost)
+            y (float): The desired normalized y-coordinate for the robot (0 for backmost, 1 for forwardmost)
+
+        Returns:
+            timestamp (float): Timestamp of the command in seconds since the epoch
+        """
+        self.robotPositionX = x
+        self.robotPositionY = y
+        return await self._command('/gcode/' + str(x) + '/' + str(y))
+
+    async def calibrate(self):
+        """
+        (INACTIVE) Calibrate the robot's position and orientation
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        await self._command('/calibrate')
+
+    async def getImageBase(self, raw=False, reduce=1, grayscale=False, out=None):
+        """
+        Get the base camera image from the robot
+
+        Args:
+            raw (bool): Return the compressed JPEG bytes without decoding them
+            reduce (int): Downscale factor applied while decoding (1, 2, 4 or 8)
+            grayscale (bool): Decode to a single-channel grayscale image
+            out (numpy.ndarray, optional): Preallocated uint8 array to write the image into
+
+        Returns:
+            image (numpy.ndarray): The base camera image as a numpy array (JPEG bytes if raw)
+            time_stamp (float): Timestamp of the image in seconds since the epoch
+        """
+        return await self._get_image('/getImageBase', raw, reduce, grayscale, out)
+
+    async def getImageTop(self, raw=False, reduce=1, grayscale=False, out=None):
+        """
+        Get the top camera image from the robot
+
+        Args:
+            raw (bool): Return the compressed JPEG bytes without decoding them
+            reduce (int): Downscale factor applied while decoding (1, 2, 4 or 8)
+            grayscale (bool): Decode to a single-channel grayscale image
+            out (numpy.ndarray, optional): Preallocated uint8 array to write the image into
+
+        Returns:
+            image (numpy.ndarray): The top camera image as a numpy array (JPEG bytes if raw)
+            time_stamp (float): Timestamp of the image in seconds since the epoch
+        """
+        return await self._get_image('/getImageTop', raw, reduce, grayscale, out)
+
+    async def get_observation(self, max_skew=None, max_refetch=2, **image_options):
+        """
+        Get the top image, base image and state of the robot concurrently
+
+        Args:
+            max_skew (float, optional): Maximum allowed spread between the component
+                timestamps in seconds. Components that are older than this relative to the
+                newest one (or missing) are fetched again
+            max_refetch (int): Maximum number of refetch rounds when max_skew is exceeded
+            **image_options: Options passed to getImageTop/getImageBase (raw, reduce, grayscale)
+
+        Returns:
+            observation (Observation): The images, state, their timestamps and the skew between them
+        """
+        return await fetch_observation_async(self, max_skew, max_refetch, **image_options)
@@ -1,21 +1,137 @@
+import asyncio
+import math
 import numpy as np
 import time
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from requests import exceptions
 
+from client.cloudgripper_control import STEP_SIZE
+from client.cloudgripper_observation import fetch_observation, fetch_observation_async
+from client.cloudgripper_trajectory import execute_trajectory
+
 api_address_robots = {f"robot{i}": f"https://cloudgripper.eecs.kth.se:8443/robot{i}/api/v1.1/robot" for i in range(1, 33)}
 
+# Default axis speeds in normalized units (degrees for rotation) per second
+DEFAULT_SPEEDS = {'x': 0.25, 'y': 0.25, 'z': 0.5, 'rotation': 90.0, 'claw': 2.0}
+
+# Camera resolutions (height, width) of the real robots
+TOP_SHAPE = (720, 1280)
+BASE_SHAPE = (480, 640)
+
+
+def _format_image(source, raw=False, reduce=1, grayscale=False, out=None):
+    """
+    Apply the getImageTop/getImageBase output options to a mock BGR image
+
+    Args:
+        source (numpy.ndarray): Full resolution BGR image
+        raw (bool): Encode the image to JPEG bytes
+        reduce (int): Downscale factor (1, 2, 4 or 8)
+        grayscale (bool): Convert to a single-channel grayscale image
+        out (numpy.ndarray, optional): Preallocated array to write the image into
+
+    Returns:
+        image (numpy.ndarray or bytes): The formatted image
+    """
+    if raw:
+        import cv2
+        return cv2.imencode('.jpg', source)[1].tobytes()
+    if reduce not in (1, 2, 4, 8):
+        raise ValueError(f"reduce must be 1, 2, 4 or 8, got {reduce}")
+    image = source[::reduce, ::reduce]
+    if grayscale:
+        # ITU-R BT.601 luma, as used by cv2.IMREAD_GRAYSCALE
+        image = (image @ np.array([0.114, 0.587, 0.299])).astype(np.uint8)
+    if out is None:
+        return np.ascontiguousarray(image)
+    if out.shape != image.shape:
+        raise ValueError(f"out has shape {out.shape}, image has shape {image.shape}")
+    np.copyto(out, image)
+    return out
+
+
+def _draw_disc(image, cx, cy, radius, color):
+    """
+    Fill a disc in place, clipped to the image
+    """
+    height, width = image.shape[:2]
+    x0, x1 = max(0, int(cx - radius)), min(width, int(cx + radius) + 1)
+    y0, y1 = max(0, int(cy - radius)), min(height, int(cy + radius) + 1)
+    if x0 >= x1 or y0 >= y1:
+        return
+    ys, xs = np.ogrid[y0:y1, x0:x1]
+    mask = (xs - cx) ** 2 + (ys - cy) ** 2 <= radius ** 2
+    image[y0:y1, x0:x1][mask] = color
+
+
+def _draw_box(image, x0, y0, x1, y1, color):
+    """
+    Fill an axis-aligned box in place, clipped to the image
+    """
+    height, width = image.shape[:2]
+    x0, x1 = max(0, int(x0)), min(width, int(x1))
+    y0, y1 = max(0, int(y0)), min(height, int(y1))
+    if x0 < x1 and y0 < y1:
+        image[y0:y1, x0:x1] = color
+
+
+class _Axis:
+    """
+    A single axis moving towards its target at constant speed
+    """
+    __slots__ = ('start', 'target', 'started', 'speed')
+
+    def __init__(self, position, speed):
+        self.start = position
+        self.target = position
+        self.started = 0.0
+        self.speed = speed
+
+    def position(self, now):
+        distance = self.target - self.start
+        travelled = self.speed * (now - self.started)
+        if travelled >= abs(distance):
+            return self.target
+        return self.start + math.copysign(travelled, distance)
+
+    def moving(self, now):
+        return self.position(now) != self.target
+
+    def move_to(self, target, now):
+        self.start = self.position(now)
+        self.target = target
+        self.started = now
+
+
 class GripperRobotMock:
     """
     A class to mock the CloudGripper class
 
+    The mock keeps a kinematic state: commands set axis targets and the axes move towards
+    them at configurable speeds, get_state reports the current positions, and the cameras
+    render synthetic images of the gripper at the real resolutions (1280x720 top, 640x480
+    base). Calls can be delayed by simulated command and response latencies.
+
+    Latencies are given as None (no delay), a number of seconds, a (mean, standard
+    deviation) tuple of a normal distribution, or a callable returning seconds.
+
     Args:
         name (str): The name of the robot
         token (str): The token of the robot
+        speeds (dict, optional): Axis speeds overriding DEFAULT_SPEEDS, with keys 'x', 'y',
+            'z', 'rotation' and 'claw', in normalized units (degrees for rotation) per second
+        command_latency: Delay before a command reaches the mock robot
+        response_latency: Delay between the mock robot acting and the call returning
+        step_size (float): Normalized distance covered by the step commands
+        seed (int, optional): Seed of the latency distributions and simulated failures
     """
     global api_address_robots
 
-    def __init__(self, name, token):
+    def __init__(self, name, token, speeds=None, command_latency=None, response_latency=None,
+                 step_size=STEP_SIZE, seed=None):
         self.name = name
         self.headers = {"apiKey": token}
         self.base_api = api_address_robots[name]
@@ -23,6 +139,146 @@ class GripperRobotMock:
         # Mock 1% probability of request failure
         self.failure_rate = 0.01
 
+        self.command_latency = command_latency
+        self.response_latency = response_latency
+        self.step_size = step_size
+        self._random = random.Random(seed)
+
+        speeds = dict(DEFAULT_SPEEDS, **(speeds or {}))
+        self._lock = threading.Lock()
+        self._axes = {
+            'x': _Axis(0.5, speeds['x']),
+            'y': _Axis(0.5, speeds['y']),
+            'z': _Axis(1.0, speeds['z']),
+            'rotation': _Axis(0.0, speeds['rotation']),
+            'claw': _Axis(1.0, speeds['claw']),
+        }
+
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _latency(self, latency):
+        if latency is None:
+            return 0.0
+        if callable(latency):
+            return max(0.0, latency())
+        if isinstance(latency, tuple):
+            mean, std = latency
+            return max(0.0, self._random.gauss(mean, std))
+        return latency
+
+    def _simulate(self, effect=None):
+        """
+        Simulate a round trip to the mock robot
+
+        Args:
+            effect (callable, optional): Called with the current monotonic time when the
+                request reaches the robot; its return value is passed through
+
+        Returns:
+            result: The return value of `effect`
+            timestamp (float): Time the robot handled the request in seconds since the epoch
+        """
+        delay = self._latency(self.command_latency)
+        if delay:
+            time.sleep(delay)
+        if self._random.random() > self.failure_rate:
+            with self._lock:
+                result = effect(time.monotonic()) if effect is not None else None
+            timestamp = time.time()
+        else:
+            result, timestamp = None, None
+        delay = self._latency(self.response_latency)
+        if delay:
+            time.sleep(delay)
+        if timestamp is None:
+            raise exceptions.RequestException("Simulated request failure")
+        return result, timestamp
+
+    def _command(self, targets):
+        """
+        Send a command setting axis targets
+
+        Args:
+            targets (callable): Called with the current monotonic time, returns a dict of
+                new axis targets
+
+        Returns:
+            timestamp (float): Timestamp of the command in seconds since the epoch
+        """
+        def effect(now):
+            for axis, target in targets(now).items():
+                self._axes[axis].move_to(target, now)
+
+        try:
+            _, timestamp = self._simulate(effect)
+            return timestamp
+        except exceptions.RequestException as e:
+            print('Request failed:', e)
+            return None
+
+    def _step(self, axis, delta):
+        def targets(now):
+            target = min(1.0, max(0.0, self._axes[axis].target + delta))
+            return {axis: target}
+        return self._command(targets)
+
+    def _positions(self, now):
+        return {axis: state.position(now) for axis, state in self._axes.items()}
+
+    def _read_state(self, now):
+        positions = self._positions(now)
+        axes = self._axes
+        # Servo currents rise while an axis moves and while the claw is squeezed shut
+        claw_current = 0.3 if axes['claw'].moving(now) else (0.15 if positions['claw'] < 0.05 else 0.02)
+        return {'x_norm': positions['x'],
+                'y_norm': positions['y'],
+                'z_norm': positions['z'],
+                'rotation': positions['rotation'],
+                'claw_norm': positions['claw'],
+                'z_current': 0.4 if axes['z'].moving(now) else 0.05,
+                'rotation_current': 0.3 if axes['rotation'].moving(now) else 0.03,
+                'claw_current': claw_current}
+
+    def _render_top(self, positions):
+        """
+        Render the top camera: the work area seen from above with the gripper drawn at its
+        x/y position, larger when raised, and its jaws opened and rotated
+        """
+        height, width = TOP_SHAPE
+        image = np.empty((height, width, 3), dtype=np.uint8)
+        image[:] = (70, 90, 100)
+        _draw_box(image, 160, 60, 1120, 660, (150, 160, 165))
+        cx = 160 + positions['x'] * 960
+        cy = 660 - positions['y'] * 600
+        radius = 18 + 22 * positions['z']
+        _draw_disc(image, cx, cy, radius, (40, 40, 40))
+        angle = math.radians(positions['rotation'])
+        opening = radius * (0.6 + 1.2 * positions['claw'])
+        for side in (-1, 1):
+            jx = cx + side * opening * math.cos(angle)
+            jy = cy - side * opening * math.sin(angle)
+            _draw_disc(image, jx, jy, radius * 0.35, (30, 30, 200))
+        return image
+
+    def _render_base(self, positions):
+        """
+        Render the base camera: the gripper seen from the front at its x/z position
+        """
+        height, width = BASE_SHAPE
+        image = np.empty((height, width, 3), dtype=np.uint8)
+        image[:] = (110, 100, 90)
+        _draw_box(image, 0, 400, width, height, (60, 70, 80))
+        cx = 80 + positions['x'] * 480
+        bottom = 400 - positions['z'] * 300
+        _draw_box(image, cx - 6, 0, cx + 6, bottom - 20, (50, 50, 50))
+        _draw_box(image, cx - 30, bottom - 20, cx + 30, bottom - 8, (40, 40, 40))
+        opening = 4 + 22 * positions['claw']
+        for side in (-1, 1):
+            jaw = cx + side * opening
+            _draw_box(image, jaw - 4, bottom - 8, jaw + 4, bottom + 20, (30, 30, 200))
+        return image
+
     def get_state(self):
         """
         Get the current state of the robot
@@ -42,21 +298,8 @@ class GripperRobotMock:
                 - 'claw_current': Current in the claw servo motor
             timestamp (float): timestamp of the state in seconds since the epoch
         """
-        state = {'x_norm': 0.5, 
-                 'y_norm': 0.5, 
-                 'z_norm': 0.5, 
-                 'rotation': 0,
-                 'claw_norm': 0.5,
-                 'z_current': 0,
-                 'rotation_current': 0,
-                 'claw_current': 0}
-        
-        timestamp = time.time()
         try:
-            if random.random() > self.failure_rate:
-                return state, timestamp
-            else:
-                raise exceptions.RequestException("Simulated request failure")
+            return self._simulate(self._read_state)
         except exceptions.RequestException as e:
             print('Request failed:', e)
             return None, None
@@ -71,15 +314,7 @@ class GripperRobotMock:
         Returns:
             timestamp (float): timestamp of the command in seconds since the epoch
         """
-        
-        try:
-            if random.random() > self.failure_rate:
-                return time.time()
-            else:
-                raise exceptions.RequestException("Simulated request failure")
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None
+        return self._step('y', self.step_size)
 
     def step_backward(self):
         """
@@ -91,14 +326,7 @@ class GripperRobotMock:
         Returns:
             timestamp (float): timestamp of the command in seconds since the epoch
         """
-        try:
-            if random.random() > self.failure_rate:
-                return time.time()
-            else:
-                raise exceptions.RequestException("Simulated request failure")
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None
+        return self._step('y', -self.step_size)
 
     def step_left(self):
         """
@@ -110,14 +338,7 @@ class GripperRobotMock:
         Returns:
             timestamp (float): timestamp of the command in seconds since the epoch
         """
-        try:
-            if random.random() > self.failure_rate:
-                return time.time()
-            else:
-                raise exceptions.RequestException("Simulated request failure")
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None
+        return self._step('x', -self.step_size)
 
     def step_right(self):
         """
@@ -129,14 +350,7 @@ class GripperRobotMock:
         Returns:
             timestamp (float): timestamp of the command in seconds since the epoch
         """
-        try:
-            if random.random() > self.failure_rate:
-                return time.time()
-            else:
-                raise exceptions.RequestException("Simulated request failure")
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None
+        return self._step('x', self.step_size)
 
     def move_gripper(self, angle):
         """
@@ -149,14 +363,7 @@ class GripperRobotMock:
             timestamp (float): Timestamp of the command in seconds since the epoch
         """
         self.gripperAngle = angle
-        try:
-            if random.random() > self.failure_rate:  
-                return time.time()
-            else:
-                raise exceptions.RequestException("Simulated request failure")
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None
+        return self._command(lambda now: {'claw': float(angle)})
 
     def gripper_close(self):
         """
@@ -195,14 +402,7 @@ class GripperRobotMock:
             timestamp (float): Timestamp of the command in seconds since the epoch
         """
         self.rotationAngle = angle
-        try:
-            if random.random() > self.failure_rate:
-                return time.time()
-            else:
-                raise exceptions.RequestException("Simulated request failure")
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None
+        return self._command(lambda now: {'rotation': float(angle)})
 
     def move_z(self, z):
         """
@@ -215,14 +415,7 @@ class GripperRobotMock:
             timestamp (float): Timestamp of the command in seconds since the epoch
         """
         self.zaxisAngle = z
-        try:
-            if random.random() > self.failure_rate:
-                return time.time()
-            else:
-                raise exceptions.RequestException("Simulated request failure")
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None
+        return self._command(lambda now: {'z': float(z)})
 
     def move_xy(self, x, y):
         """
@@ -237,14 +430,7 @@ class GripperRobotMock:
         """
         self.robotPositionX = x
         self.robotPositionY = y
-        try:
-            if random.random() > self.failure_rate:
-                return time.time()
-            else:
-                raise exceptions.RequestException("Simulated request failure")
-        except exceptions.RequestException as e:
-            print('Request failed:', e)
-            return None
+        return self._command(lambda now: {'x': float(x), 'y': float(y)})
         
     def calibrate(self):
         """
@@ -257,53 +443,243 @@ class GripperRobotMock:
             None
         """
         try:
-            if random.random() > self.failure_rate:
-                return
-            else:
-                raise exceptions.RequestException("Simulated request failure")
+            self._simulate()
         except exceptions.RequestException as e:
             print('Request failed:', e)
 
-    def getImageBase(self):
+    def getImageBase(self, raw=False, reduce=1, grayscale=False, out=None):
         """
         Get the base camera image from the mock robot
 
         Args:
-            None
+            raw (bool): Return the image as compressed JPEG bytes
+            reduce (int): Downscale factor of the returned image (1, 2, 4 or 8)
+            grayscale (bool): Return a single-channel grayscale image
+            out (numpy.ndarray, optional): Preallocated uint8 array to write the image into
 
         Returns:
-            image (numpy.ndarray): The base camera image as a numpy array
+            image (numpy.ndarray): The base camera image as a numpy array (JPEG bytes if raw)
             time_stamp (float): Timestamp of the image in seconds since the epoch
         """
         try:
-            if random.random() > self.failure_rate:
-                source = np.zeros((480, 640, 3), dtype=np.uint8)  # Create black image
-                time_stamp = time.time()
-                return source, time_stamp
-            else:
-                raise exceptions.RequestException("Simulated request failure")
+            positions, time_stamp = self._simulate(self._positions)
+            source = _format_image(self._render_base(positions), raw, reduce, grayscale, out)
+            return source, time_stamp
         except:
             print("Image not available")
             return None, None
 
-    def getImageTop(self):
+    def getImageTop(self, raw=False, reduce=1, grayscale=False, out=None):
         """
         Get the top camera image from the mock robot
 
         Args:
-            None
+            raw (bool): Return the image as compressed JPEG bytes
+            reduce (int): Downscale factor of the returned image (1, 2, 4 or 8)
+            grayscale (bool): Return a single-channel grayscale image
+            out (numpy.ndarray, optional): Preallocated uint8 array to write the image into
 
         Returns:
-            image (numpy.ndarray): The top camera image as a numpy array
+            image (numpy.ndarray): The top camera image as a numpy array (JPEG bytes if raw)
             time_stamp (float): Timestamp of the image in seconds since the epoch
         """
         try:
-            if random.random() > self.failure_rate:
-                source = np.zeros((720, 1280, 3), dtype=np.uint8)  # Create black image
-                time_stamp = time.time()
-                return source, time_stamp
-            else:
-                raise exceptions.RequestException("Simulated request failure")
+            positions, time_stamp = self._simulate(self._positions)
+            source = _format_image(self._render_top(positions), raw, reduce, grayscale, out)
+            return source, time_stamp
         except:
             print("Image not available")
             return None, None
+
+    def get_observation(self, max_skew=None, max_refetch=2, **image_options):
+        """
+        Get the top image, base image and state of the mock robot in one call
+
+        The three requests are sent concurrently, so an observation costs roughly one
+        round trip instead of three.
+
+        Args:
+            max_skew (float, optional): Maximum allowed spread between the component
+                timestamps in seconds. Components that are older than this relative to the
+                newest one (or missing) are fetched again
+            max_refetch (int): Maximum number of refetch rounds when max_skew is exceeded
+            **image_options: Options passed to getImageTop/getImageBase (raw, reduce, grayscale)
+
+        Returns:
+            observation (Observation): The images, state, their timestamps and the skew between them
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=3,
+                                                    thread_name_prefix=f'cloudgripper-{self.name}')
+        return fetch_observation(self, self._executor, max_skew, max_refetch, **image_options)
+
+    def execute_trajectory(self, waypoints, rate_hz=None, max_in_flight=4, skip_unchanged=True):
+        """
+        Move the mock robot through a sequence of waypoints
+
+        Commands for different axes and consecutive waypoints are pipelined over the
+        connection pool instead of waiting for each response, and axes whose target did
+        not change are skipped.
+
+        Args:
+            waypoints (iterable): Waypoints as (x, y, z, rotation, gripper) tuples or dicts with
+                those keys. Trailing values may be left out and None leaves an axis unchanged
+            rate_hz (float, optional): Rate at which waypoints are sent. None sends them as
+                fast as the pipeline allows
+            max_in_flight (int): Maximum number of waypoints with outstanding commands
+            skip_unchanged (bool): Skip commands whose target equals the last acknowledged target
+
+        Returns:
+            report (list of dict): Timing of each waypoint, see cloudgripper_trajectory.execute_trajectory
+        """
+        return execute_trajectory(self, waypoints, rate_hz, max_in_flight, skip_unchanged)
+
+
+class AsyncGripperRobotMock:
+    """
+    An asyncio counterpart of GripperRobotMock
+
+    Every method of GripperRobotMock is available as a coroutine. Calls sleep on the
+    event loop for the simulated round trip and then run the mock, including the image
+    rendering, in the loop's default executor, so thousands of concurrent calls can be
+    exercised without a network and without blocking the loop.
+
+    Args:
+        name (str): The name of the robot
+        token (str): The token of the robot
+        latency (float): Simulated round-trip time of every call in seconds
+        **options: GripperRobotMock arguments such as speeds or step_size. Latencies are
+            simulated with `latency`; command_latency and response_latency are rejected,
+            because they would sleep on an executor thread
+    """
+
+    def __init__(self, name, token, latency=0.0, **options):
+        for option in ('command_latency', 'response_latency'):
+            if options.get(option) is not None:
+                raise ValueError(f"{option} is not supported by AsyncGripperRobotMock, use latency")
+        self.name = name
+        self.latency = latency
+        self.robot = GripperRobotMock(name, token, **options)
+
+    @property
+    def failure_rate(self):
+        return self.robot.failure_rate
+
+    @failure_rate.setter
+    def failure_rate(self, value):
+        self.robot.failure_rate = value
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """
+        No-op, the mock robot holds no connections
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+    async def _call(self, method, *args):
+        await asyncio.sleep(self.latency)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(getattr(self.robot, method), *args))
+
+    async def get_state(self):
+        """
+        Get the current state of the mock robot, see GripperRobotMock.get_state
+        """
+        return await self._call('get_state')
+
+    async def step_forward(self):
+        """
+        Move the mock robot one step forward (y-direction)
+        """
+        return await self._call('step_forward')
+
+    async def step_backward(self):
+        """
+        Move the mock robot one step backward (y-direction)
+        """
+        return await self._call('step_backward')
+
+    async def step_left(self):
+        """
+        Move the mock robot one step left (x-direction)
+        """
+        return await self._call('step_left')
+
+    async def step_right(self):
+        """
+        Move the mock robot one step right (x-direction)
+        """
+        return await self._call('step_right')
+
+    async def move_gripper(self, angle):
+        """
+        Move the mock robot's gripper to the specified angle (0 for closed, 1 for open)
+        """
+        return await self._call('move_gripper', angle)
+
+    async def gripper_close(self):
+        """
+        Close the mock robot's gripper
+        """
+        return await self.move_gripper(0)
+
+    async def gripper_open(self):
+        """
+        Open the mock robot's gripper
+        """
+        return await self.move_gripper(1)
+
+    async def rotate(self, angle):
+        """
+        Rotate the mock robot to the specified angle (in degrees)
+        """
+        return await self._call('rotate', angle)
+
+    async def move_z(self, z):
+        """
+        Move the mock robot's z-axis to the specified normalized position
+        """
+        return await self._call('move_z', z)
+
+    async def move_xy(self, x, y):
+        """
+        Move the mock robot to the specified normalized x and y coordinates
+        """
+        return await self._call('move_xy', x, y)
+
+    async def calibrate(self):
+        """
+        (INACTIVE) Calibrate the mock robot's position and orientation
+        """
+        return await self._call('calibrate')
+
+    async def getImageBase(self, raw=False, reduce=1, grayscale=False, out=None):
+        """
+        Get the base camera image from the mock robot, see GripperRobotMock.getImageBase
+        """
+        return await self._call('getImageBase', raw, reduce, grayscale, out)
+
+    async def get_observation(self, max_skew=None, max_refetch=2, **image_options):
+        """
+        Get the top image, base image and state of the mock robot, see GripperRobotMock.get_observation
+
+        The three components are awaited concurrently, so the event loop is never blocked.
+        """
+        return await fetch_observation_async(self, max_skew, max_refetch, **image_options)
+
+    async def getImageTop(self, raw=False, reduce=1, grayscale=False, out=None):
+        """
+        Get the top camera image from the mock robot, see GripperRobotMock.getImageTop
+        """
+        return await self._call('getImageTop', raw, reduce, grayscale, out)
@@ -0,0 +1,583 @@
+from requests import Session, exceptions
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from contextlib import contextmanager
+from functools import partial
+import threading
+import time
+
+from client.cloudgripper_cache import StateCache
+from client.cloudgripper_metrics import endpoint_label
+from client.cloudgripper_observation import RobotState
+from client.cloudgripper_retry import LatencyTracker, call_idempotent
+from client.cloudgripper_scheduler import request_priority
+from client.cloudgripper_trajectory import execute_trajectory
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+api_address_robots = {f"robot{i}": f"https://cloudgripper.eecs.kth.se:8443/robot{i}/api/v1.1/robot" for i in range(1, 33)}
+
+
+def robot_api_address(name, base_url=None):
+    """
+    Get the API address of a robot
+
+    Args:
+        name (str): The name of the robot
+        base_url (str, optional): Server to use instead of the CloudGripper API, e.g.
+            'http://127.0.0.1:8080' for a local stand-in server
+
+    Returns:
+        address (str): The robot's API address
+    """
+    if base_url is None:
+        return api_address_robots[name]
+    return f"{base_url.rstrip('/')}/{name}/api/v1.1/robot"
+
+
+# Default (connect, read) timeout in seconds for every API call
+DEFAULT_TIMEOUT = (5, 30)
+
+# Normalized distance covered by the step commands
+STEP_SIZE = 0.05
+
+# Sessions shared by all robots behind the same host, keyed by scheme://host:port
+_shared_sessions = {}
+_shared_sessions_lock = threading.Lock()
+
+
+def create_session(pool_connections=4, pool_maxsize=32, pool_block=False):
+    """
+    Create a keep-alive HTTP session with a connection pool
+
+    Args:
+        pool_connections (int): Number of hosts to keep connection pools for
+        pool_maxsize (int): Maximum number of connections kept alive per host
+        pool_block (bool): Block when the pool is exhausted instead of opening extra connections
+
+    Returns:
+        session (requests.Session): A session that reuses TCP+TLS connections between calls
+    """
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections,
+                          pool_maxsize=pool_maxsize,
+                          pool_block=pool_block)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_shared_session(url, pool_connections=4, pool_maxsize=32, pool_block=False):
+    """
+    Get the process-wide session for the host of the given URL, creating it on first use
+
+    The pool settings only apply when the session is created; later callers for the
+    same host share the existing pool.
+
+    Args:
+        url (str): Any URL on the host
+        pool_connections (int): Number of hosts to keep connection pools for
+        pool_maxsize (int): Maximum number of connections kept alive per host
+        pool_block (bool): Block when the pool is exhausted instead of opening extra connections
+
+    Returns:
+        session (requests.Session): The shared session for the host
+    """
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    with _shared_sessions_lock:
+        session = _shared_sessions.get(key)
+        if session is None:
+            session = create_session(pool_connections, pool_maxsize, pool_block)
+            _shared_sessions[key] = session
+        return session
+
+
+def _bounded_request(request, endpoint, deadline, timeout=None):
+    """
+    Send a request with at most the time left until a deadline as its timeout
+
+    Args:
+        request (callable): GripperControl._request of the robot
+        endpoint (str): Path of the endpoint relative to the robot's API address
+        deadline (float): time.monotonic() value after which the request fails
+        timeout (float, optional): Tighter bound, e.g. from a retry deadline
+
+    Returns:
+        response (dict): The decoded JSON response
+    """
+    remaining = deadline - time.monotonic()
+    if timeout is not None:
+        remaining = min(remaining, timeout)
+    return request(endpoint, timeout=remaining)
+
+
+class GripperControl:
+    """
+    A CloudGripper robot without camera access
+
+    Sends motion commands and reads the state without importing OpenCV or NumPy, so it
+    suits short-lived worker processes that never touch images. GripperRobot adds the
+    camera endpoints on top of it.
+
+    All calls go through a keep-alive connection pool. By default robots on the same
+    host share one pool, so an instance (and several instances) can be used from many
+    threads at once.
+
+    Args:
+        name (str): The name of the robot
+        token (str): The token of the robot
+        session (requests.Session, optional): Session to send requests with. Defaults to
+            the shared session for the robot's host
+        share_session (bool): Use the shared per-host session when no session is given.
+            If False the robot opens (and closes) a pool of its own
+        pool_maxsize (int): Maximum number of kept-alive connections per host, used when
+            the session is created
+        timeout (float or tuple): (connect, read) timeout in seconds for every call
+        prewarm (bool): Open a connection to the robot at construction, with one getState
+            request, so that the first command does not pay the TCP+TLS handshake. Off by
+            default, so that constructing robots never touches the network
+        state_ttl (float, optional): Enable the get_state cache: states younger than this many
+            seconds are served from the cache and concurrent calls share one request.
+            Motion commands invalidate the cache
+        retry (RetryPolicy, optional): Retry failed getState/getImageTop/getImageBase requests
+            with jittered backoff. Motion commands are never retried
+        hedge (HedgePolicy, optional): Send a second getState/getImageTop/getImageBase request
+            when the first is slower than a latency percentile, and use whichever answers first.
+            Motion commands are never hedged
+        metrics (ClientMetrics, optional): Record per-endpoint latency, payload and error
+            metrics. One instance can be shared by several robots
+        base_url (str, optional): Server to send requests to instead of the CloudGripper API,
+            e.g. a local stand-in server
+        compact_state (bool): Return states from get_state as read-only RobotState objects
+            instead of dicts. They support the same dict-style reads with less overhead
+        scheduler (RequestScheduler, optional): Adaptive admission control shared by the robots
+            behind one gateway: limits requests in flight and serves motion commands first
+    """
+    global api_address_robots
+
+    def __init__(self, name, token, session=None, share_session=True, pool_maxsize=32,
+                 timeout=DEFAULT_TIMEOUT, prewarm=False, state_ttl=None, retry=None, hedge=None,
+                 metrics=None, base_url=None, compact_state=False, scheduler=None):
+        self.name = name
+        self.headers = {"apiKey": token}
+        self.base_api = robot_api_address(name, base_url)
+        self.timeout = timeout
+        self._owns_session = session is None and not share_session
+        if session is None:
+            if share_session:
+                session = get_shared_session(self.base_api, pool_maxsize=pool_maxsize)
+            else:
+                session = create_session(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session = session
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._deadline = threading.local()
+        self.state_cache = StateCache(state_ttl) if state_ttl is not None else None
+        self.retry = retry
+        self.hedge = hedge
+        self.latency = LatencyTracker() if hedge is not None else None
+        self.metrics = metrics
+        self.compact_state = compact_state
+        self.scheduler = scheduler
+
+        if prewarm:
+            self.prewarm()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Release the robot's worker threads, and its connections if it owns its session
+
+        Shared sessions stay open for the other robots using them.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        if self._owns_session:
+            self.session.close()
+
+    def stats(self):
+        """
+        Get the request metrics of the robot
+
+        Args:
+            None
+
+        Returns:
+            stats (dict): Metrics per endpoint, see ClientMetrics.stats. Empty if the robot
+                was created without metrics
+        """
+        if self.metrics is None:
+            return {}
+        return self.metrics.stats(self.name)
+
+    def prewarm(self):
+        """
+        Open a kept-alive connection to the robot's host
+
+        Sends one getState request through the scheduler and metrics like any other call.
+
+        Args:
+            None
+
+        Returns:
+            success (bool): True if the connection could be established
+        """
+        try:
+            self._request('/getState')
+            return True
+        except exceptions.RequestException:
+            return False
+
+    @contextmanager
+    def deadline(self, seconds):
+        """
+        Bound every request the calling thread sends inside the block
+
+        Requests started after the deadline fail with requests.exceptions.Timeout, and the
+        others get at most the remaining time as their timeout.
+
+        Args:
+            seconds (float, optional): Time left for the block in seconds (None for no bound)
+
+        Returns:
+            context (contextmanager): Restores the previous deadline on exit
+        """
+        previous = getattr(self._deadline, 'at', None)
+        if seconds is not None:
+            at = time.monotonic() + seconds
+            self._deadline.at = at if previous is None else min(at, previous)
+        try:
+            yield
+        finally:
+            self._deadline.at = previous
+
+    def _get(self, endpoint, idempotent=False):
+        """
+        Send a GET request to an API endpoint over the pooled session
+
+        Args:
+            endpoint (str): Path of the endpoint relative to the robot's API address
+            idempotent (bool): The endpoint is read-only and may be retried and hedged
+
+        Returns:
+            response (dict): The decoded JSON response
+        """
+        send = partial(self._request, endpoint)
+        deadline = getattr(self._deadline, 'at', None)
+        if deadline is not None:
+            send = partial(_bounded_request, self._request, endpoint, deadline)
+        if idempotent and (self.retry is not None or self.hedge is not None):
+            return call_idempotent(send, endpoint, self.retry, self.hedge, self.latency)
+        return send()
+
+    def _request(self, endpoint, timeout=None):
+        """
+        Send a single GET request
+
+        Args:
+            endpoint (str): Path of the endpoint relative to the robot's API address
+            timeout (float, optional): Upper bound on the configured timeouts in seconds
+
+        Returns:
+            response (dict): The decoded JSON response
+        """
+        request_timeout = self.timeout
+        if timeout is not None:
+            if timeout <= 0:
+                raise exceptions.Timeout(f'Deadline exceeded before requesting {endpoint}')
+            if isinstance(request_timeout, tuple):
+                request_timeout = tuple(min(t, timeout) for t in request_timeout)
+            else:
+                request_timeout = min(request_timeout, timeout)
+        metrics = self.metrics
+        scheduler = self.scheduler
+        if metrics is not None or scheduler is not None:
+            label = endpoint_label(endpoint)
+        if scheduler is not None:
+            queued_at = time.perf_counter()
+            admitted = scheduler.acquire(self.name, request_priority(label))
+            if metrics is not None:
+                metrics.observe(self.name, label, 'queue', queued_at, time.perf_counter() - queued_at)
+        if metrics is not None:
+            metrics.request_started(self.name, label)
+        try:
+            start = time.perf_counter()
+            response = self.session.get(self.base_api + endpoint, headers=self.headers,
+                                        timeout=request_timeout, stream=True)
+            headers_at = time.perf_counter()
+            content = response.content
+            transferred_at = time.perf_counter()
+            try:
+                result = json_loads(content)
+            except ValueError as e:
+                raise exceptions.InvalidJSONError(f'Invalid JSON response from {endpoint}: {e}',
+                                                  response=response) from e
+            parsed_at = time.perf_counter()
+        except Exception as e:
+            if scheduler is not None:
+                scheduler.release(self.name, label, admitted, error=e)
+            if metrics is not None:
+                metrics.request_finished(self.name, label, error=e)
+            raise
+
+        if scheduler is not None:
+            scheduler.release(self.name, label, admitted)
+        if self.latency is not None:
+            self.latency.record(endpoint, parsed_at - start)
+        if metrics is not None:
+            metrics.request_finished(self.name, label, len(content))
+            metrics.observe(self.name, label, 'connect', start, headers_at - start)
+            metrics.observe(self.name, label, 'transfer', headers_at, transferred_at - headers_at)
+            metrics.observe(self.name, label, 'parse', transferred_at, parsed_at - transferred_at)
+            metrics.observe(self.name, label, 'total', start, parsed_at - start)
+        return result
+
+    def _command(self, endpoint):
+        """
+        Send a command to the robot
+
+        Args:
+            endpoint (str): Path of the command endpoint
+
+        Returns:
+            timestamp (float): Timestamp of the command in seconds since the epoch
+        """
+        if self.state_cache is not None:
+            self.state_cache.invalidate()
+        try:
+            return self._get(endpoint)['time']
+        except exceptions.RequestException as e:
+            print('Request failed:', e)
+            return None
+        finally:
+            if self.state_cache is not None:
+                self.state_cache.invalidate()
+
+    def get_state(self):
+        """
+        Get the current state of the robot
+
+        Args:
+            None
+        
+        Returns:
+            state (dict): current state of the robot:
+                - 'x_norm': Normalized x-coordinate of the robot's position
+                - 'y_norm': Normalized y-coordinate of the robot's position
+                - 'z_norm': Normalized z-coordinate of the robot's position
+                - 'rotation': Current rotation angle of the robot (in degrees)
+                - 'claw_norm': Normalized state of the robot's gripper (0 for closed, 1 for open)
+                - 'z_current': Current in the z-axis servo motor
+                - 'rotation_current': Current in the rotation servo motor
+                - 'claw_current': Current in the claw servo motor
+            timestamp (float): timestamp of the state in seconds since the epoch
+            With compact_state, the state is a RobotState with the same fields
+        """
+        if self.state_cache is None:
+            return self._fetch_state()
+        state, timestamp = self.state_cache.get(self._fetch_state)
+        # The cached dict is shared between callers; RobotState is read-only
+        if state is not None and not self.compact_state:
+            state = dict(state)
+        return state, timestamp
+
+    def _fetch_state(self):
+        """
+        Request the current state of the robot, bypassing the cache
+
+        Args:
+            None
+
+        Returns:
+            state (dict): current state of the robot
+            timestamp (float): timestamp of the state in seconds since the epoch
+        """
+        try:
+            call_api = self._get('/getState', idempotent=True)
+            if self.compact_state:
+                return RobotState.from_dict(call_api['state']), call_api['timestamp']
+            return call_api['state'], call_api['timestamp']
+        except exceptions.RequestException as e:
+            print('Request failed:', e)
+            return None, None
+
+    def step_forward(self):
+        """
+        Move the robot one step forward (y-direction)
+
+        Args:
+            None
+
+        Returns:
+            timestamp (float): timestamp of the command in seconds since the epoch
+        """
+        return self._command('/moveUp')
+
+    def step_backward(self):
+        """
+        Move the robot one step backward (y-direction)
+
+        Args:
+            None
+
+        Returns:
+            timestamp (float): timestamp of the command in seconds since the epoch
+        """
+        return self._command('/moveDown')
+        
+    def step_left(self):
+        """
+        Move the robot one step left (x-direction)
+
+        Args:
+            None
+
+        Returns:
+            timestamp (float): timestamp of the command in seconds since the epoch
+        """
+        return self._command('/moveLeft')
+        
+    def step_right(self):
+        """
+        Move the robot one step right (x-direction)
+
+        Args:
+            None
+
+        Returns:
+            timestamp (float): timestamp of the command in seconds since the epoch
+        """
+        return self._command('/moveRight')
+
+    def move_gripper(self, angle):
+        """
+        Move the robot's gripper to the specified angle
+
+        Args:
+            angle (float): The desired angle for the gripper (0 for closed, 1 for open)
+
+        Returns:
+            timestamp (float): Timestamp of the command in seconds since the epoch
+        """
+        self.gripperAngle = angle
+        return self._command('/grip/' + str(self.gripperAngle))
+
+    def gripper_close(self):
+        """
+        Close the robot's gripper
+
+        Args:
+            None
+
+        Returns:
+            timestamp (float): Timestamp of the command in seconds since the epoch
+        """
+        time_stamp = self.move_gripper(0)
+        return time_stamp
+
+    def gripper_open(self):
+        """
+        Open the robot's gripper
+
+        Args:
+            None
+
+        Returns:
+            timestamp (float): Timestamp of the command in seconds since the epoch
+        """
+        time_stamp = self.move_gripper(1)
+        return time_stamp
+
+    def rotate(self, angle):
+        """
+        Rotate the robot to the specified angle
+
+        Args:
+            angle (float): The desired rotation angle for the robot (in degrees)
+
+        Returns:
+            timestamp (float): Timestamp of the command in seconds since the epoch
+        """
+        self.rotationAngle = angle
+        return self._command('/rotate/' + str(angle))
+
+    def move_z(self, z):
+        """
+        Move the robot's z-axis to the specified normalized position (z-direction)
+
+        Args:
+            z (float): The desired z-axis position for the robot (0 for fully down, 1 for fully up)
+
+        Returns:
+            timestamp (float): Timestamp of the command in seconds since the epoch
+        """
+        self.zaxisAngle = z
+        return self._command('/up_down/' + str(z))
+
+    def move_xy(self, x, y):
+        """
+        Move the robot to the specified normalized x and y coordinates
+
+        Args:
+            x (float): The desired normalized x-coordinate for the robot (0 for leftmost, 1 for rightmost)
+            y (float): The desired normalized y-coordinate for the robot (0 for backmost, 1 for forwardmost)
+
+        Returns:
+            timestamp (float): Timestamp of the command in seconds since the epoch
+        """
+        self.robotPositionX = x
+        self.robotPositionY = y
+        return self._command('/gcode/' + str(x) + '/' + str(y))
+
+    def calibrate(self):
+        """
+        (INACTIVE) Calibrate the robot's position and orientation
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        try:
+            self._get('/calibrate')
+        except exceptions.RequestException as e:
+            print('Request failed:', e)
+
+    def execute_trajectory(self, waypoints, rate_hz=None, max_in_flight=4, skip_unchanged=True):
+        """
+        Move the robot through a sequence of waypoints
+
+        Commands for different axes and consecutive waypoints are pipelined over the
+        connection pool instead of waiting for each response, and axes whose target did
+        not change are skipped.
+
+        Args:
+            waypoints (iterable): Waypoints as (x, y, z, rotation, gripper) tuples or dicts with
+                those keys. Trailing values may be left out and None leaves an axis unchanged
+            rate_hz (float, optional): Rate at which waypoints are sent. None sends them as
+                fast as the pipeline allows
+            max_in_flight (int): Maximum number of waypoints with outstanding commands
+            skip_unchanged (bool): Skip commands whose target equals the last acknowledged target
+
+        Returns:
+            report (list of dict): Timing of each waypoint, see cloudgripper_trajectory.execute_trajectory
+        """
+        return execute_trajectory(self, waypoints, rate_hz, max_in_flight, skip_unchanged)
@@ -0,0 +1,204 @@
+import multiprocessing
+import threading
+import weakref
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Bytes of the largest frame the API serves, a 1280x720 BGR top camera image
+FRAME_BYTES = 1280 * 720 * 3
+
+# Default seconds decode() waits for a free slot before decoding in the calling process
+DECODE_TIMEOUT = 1.0
+
+# Shared memory block attached by each worker process
+_worker_memory = None
+
+
+def _attach(name):
+    global _worker_memory
+    try:
+        _worker_memory = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no `track`. Workers share the parent's resource tracker, so
+        # registering the block again is harmless and the parent still unlinks it
+        _worker_memory = shared_memory.SharedMemory(name=name)
+
+
+def _decode_into(data, reduce, grayscale, offset, capacity):
+    """
+    Decode an image in a worker process and copy it into the shared memory block
+
+    Returns:
+        shape (tuple): Shape of the decoded image, None if it could not be decoded
+    """
+    from client.cloudgripper_client import decode_image
+
+    image = decode_image(data, reduce, grayscale)
+    if image is None:
+        return None
+    if image.nbytes > capacity:
+        raise ValueError(f"Decoded image of {image.nbytes} bytes does not fit a {capacity} byte slot")
+    view = np.ndarray(image.shape, dtype=np.uint8, buffer=_worker_memory.buf, offset=offset)
+    view[...] = image
+    return image.shape
+
+
+class DecodePool:
+    """
+    Decode images in worker processes into shared memory
+
+    Decoding all cameras of a fleet in one process saturates a single core. A DecodePool
+    spreads base64 and JPEG decoding over worker processes, which write the images into
+    slots of one preallocated shared memory block. The caller gets NumPy views of the
+    slots, without copying the pixels back.
+
+    A slot is in use from submission until the returned view, and every array derived from
+    it, is garbage collected; copy() an image to keep it longer without holding a slot.
+    When all slots are in use, submit() blocks until one is released, which bounds both
+    memory and the number of decodes in flight. decode() waits at most `timeout` for a
+    slot and then decodes in the calling process instead, so callers that hold on to many
+    images slow down rather than deadlock.
+
+    Args:
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs
+        slots (int): Number of images that can be in flight or held by the caller at once
+        slot_bytes (int): Size of a slot, the largest decoded image it can hold
+    """
+
+    def __init__(self, workers=None, slots=64, slot_bytes=FRAME_BYTES):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self._memory = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self._free = list(range(slots))
+        self._available = threading.Condition()
+        # Forking a multithreaded client can copy locks held by other threads into the
+        # workers, so they are started from a clean process instead
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+        else:
+            context = multiprocessing.get_context('spawn')
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                             initializer=_attach, initargs=(self._memory.name,))
+        self._closed = False
+        # Number of decode() calls that found no free slot and decoded in the calling process
+        self.fallbacks = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def in_use(self):
+        """Number of slots held by decodes in flight or by live images"""
+        with self._available:
+            return self.slots - len(self._free)
+
+    def _acquire(self, timeout):
+        with self._available:
+            if not self._available.wait_for(lambda: self._free or self._closed, timeout):
+                raise TimeoutError(f"No free decode slot within {timeout} seconds")
+            if self._closed:
+                raise RuntimeError("DecodePool is closed")
+            return self._free.pop()
+
+    def _release(self, slot):
+        with self._available:
+            self._free.append(slot)
+            self._available.notify()
+
+    def submit(self, data, reduce=1, grayscale=False, timeout=None):
+        """
+        Start decoding an image
+
+        Args:
+            data (str or bytes): The base64 encoded image, or the raw JPEG bytes
+            reduce (int): Downscale factor applied while decoding (1, 2, 4 or 8)
+            grayscale (bool): Decode to a single-channel grayscale image
+            timeout (float, optional): Seconds to wait for a free slot. None waits indefinitely
+
+        Returns:
+            future (concurrent.futures.Future): Resolves to the decoded image, a read-only
+                view of shared memory, or None if the payload could not be decoded
+        """
+        slot = self._acquire(timeout)
+        offset = slot * self.slot_bytes
+        try:
+            decoding = self._executor.submit(_decode_into, data, reduce, grayscale, offset, self.slot_bytes)
+        except BaseException:
+            self._release(slot)
+            raise
+        future = Future()
+
+        def done(decoding):
+            try:
+                shape = decoding.result()
+            except BaseException as e:
+                self._release(slot)
+                future.set_exception(e)
+                return
+            if shape is None:
+                self._release(slot)
+                future.set_result(None)
+                return
+            image = np.ndarray(shape, dtype=np.uint8, buffer=self._memory.buf, offset=offset)
+            image.flags.writeable = False
+            weakref.finalize(image, self._release, slot)
+            future.set_result(image)
+
+        decoding.add_done_callback(done)
+        return future
+
+    def decode(self, data, reduce=1, grayscale=False, timeout=DECODE_TIMEOUT):
+        """
+        Decode an image in a worker process and wait for it
+
+        Args:
+            data (str or bytes): The base64 encoded image, or the raw JPEG bytes
+            reduce (int): Downscale factor applied while decoding (1, 2, 4 or 8)
+            grayscale (bool): Decode to a single-channel grayscale image
+            timeout (float, optional): Seconds to wait for a free slot before decoding in
+                the calling process. None waits indefinitely
+
+        Returns:
+            image (numpy.ndarray): The decoded image as a read-only view of shared memory,
+                or an ordinary array if it was decoded in the calling process
+        """
+        try:
+            future = self.submit(data, reduce, grayscale, timeout)
+        except TimeoutError:
+            from client.cloudgripper_client import decode_image
+
+            with self._available:
+                self.fallbacks += 1
+            return decode_image(data, reduce, grayscale)
+        return future.result()
+
+    def close(self):
+        """
+        Stop the worker processes and free the shared memory
+
+        Images still referenced keep their part of the block mapped until they are
+        garbage collected.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with self._available:
+            if self._closed:
+                return
+            self._closed = True
+            self._available.notify_all()
+        self._executor.shutdown(wait=True)
+        try:
+            self._memory.close()
+        except BufferError:
+            # Views handed out are still alive; the mapping goes away with them
+            pass
+        self._memory.unlink()
@@ -0,0 +1,291 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from client.cloudgripper_observation import COMPONENTS, STATE_FIELDS
+
+# Default discrete actions: an action index selects a robot method called without arguments
+DISCRETE_ACTIONS = ('step_forward', 'step_backward', 'step_left', 'step_right',
+                    'gripper_open', 'gripper_close')
+
+# Continuous action axes -> (robot method, lower bounds, upper bounds)
+CONTINUOUS_AXES = {
+    'xy': ('move_xy', (0.0, 0.0), (1.0, 1.0)),
+    'z': ('move_z', (0.0,), (1.0,)),
+    'rotation': ('rotate', (0.0,), (180.0,)),
+    'gripper': ('move_gripper', (0.0,), (1.0,)),
+}
+
+
+class Discrete:
+    """
+    A finite set of actions {0, ..., n - 1}, with the attributes of a Gym Discrete space
+
+    Args:
+        n (int): Number of actions
+        seed (int, optional): Seed of sample()
+    """
+
+    def __init__(self, n, seed=None):
+        self.n = n
+        self.shape = ()
+        self.dtype = np.int64
+        self._rng = np.random.default_rng(seed)
+
+    def sample(self):
+        return int(self._rng.integers(self.n))
+
+    def contains(self, action):
+        return isinstance(action, (int, np.integer)) and 0 <= action < self.n
+
+    def __repr__(self):
+        return f'Discrete({self.n})'
+
+
+class Box:
+    """
+    A box of real vectors, with the attributes of a Gym Box space
+
+    Args:
+        low (sequence of float): Lower bounds
+        high (sequence of float): Upper bounds
+        seed (int, optional): Seed of sample()
+    """
+
+    def __init__(self, low, high, seed=None):
+        self.low = np.asarray(low, dtype=np.float32)
+        self.high = np.asarray(high, dtype=np.float32)
+        self.shape = self.low.shape
+        self.dtype = np.float32
+        self._rng = np.random.default_rng(seed)
+
+    def sample(self):
+        return self._rng.uniform(self.low, self.high).astype(np.float32)
+
+    def contains(self, action):
+        action = np.asarray(action)
+        return action.shape == self.shape and bool(np.all(action >= self.low) and np.all(action <= self.high))
+
+    def __repr__(self):
+        return f'Box({self.low.tolist()}, {self.high.tolist()})'
+
+
+class GripperEnv:
+    """
+    A Gym-style environment around a GripperRobot or GripperRobotMock
+
+    Every step sends the action's commands and fetches the next observation concurrently,
+    so a step costs about one round trip instead of one per request, and steps start on
+    a fixed control period. The API follows Gymnasium: reset() returns
+    (observation, info) and step() returns (observation, reward, terminated, truncated, info).
+
+    Observations are dicts with 'state', a float32 array in STATE_FIELDS order (NaN if the
+    state could not be fetched), and 'image_top'/'image_base' for the configured cameras
+    (None if the image could not be fetched).
+
+    Args:
+        robot (GripperRobot): The robot, or a GripperRobotMock
+        action_type (str): 'discrete' or 'continuous'
+        actions (sequence, optional): Discrete actions, each a method name or a
+            (method name, *args) tuple. Defaults to DISCRETE_ACTIONS
+        axes (sequence of str): Continuous action axes, keys of CONTINUOUS_AXES. The action
+            vector holds their values in this order
+        control_hz (float, optional): Control frequency. Steps wait for the next period
+            boundary before sending their action. None steps as fast as possible
+        cameras (sequence of str): Cameras in the observation, 'top' and/or 'base'
+        image_options (dict, optional): Options passed to getImageTop/getImageBase
+            (reduce, grayscale)
+        reward_fn (callable, optional): reward_fn(observation, action, info) -> float.
+            Defaults to a reward of 0
+        terminated_fn (callable, optional): terminated_fn(observation, info) -> bool
+        max_episode_steps (int, optional): Steps after which episodes are truncated
+        home (sequence of float, optional): (x, y, z, rotation, gripper) sent on reset
+        reset_wait (float): Seconds to wait after sending `home` on reset
+        seed (int, optional): Seed of the action space sampling
+    """
+
+    def __init__(self, robot, action_type='discrete', actions=None, axes=('xy', 'z', 'rotation', 'gripper'),
+                 control_hz=None, cameras=('top',), image_options=None, reward_fn=None, terminated_fn=None,
+                 max_episode_steps=None, home=None, reset_wait=1.0, seed=None):
+        if action_type not in ('discrete', 'continuous'):
+            raise ValueError(f"Unknown action_type '{action_type}', expected 'discrete' or 'continuous'")
+        for camera in cameras:
+            if camera not in ('top', 'base'):
+                raise ValueError(f"Unknown camera '{camera}', expected 'top' or 'base'")
+        self.robot = robot
+        self.action_type = action_type
+        self.period = 1.0 / control_hz if control_hz else None
+        self.cameras = tuple(cameras)
+        self.image_options = dict(image_options or {})
+        self.reward_fn = reward_fn
+        self.terminated_fn = terminated_fn
+        self.max_episode_steps = max_episode_steps
+        self.home = home
+        self.reset_wait = reset_wait
+
+        if action_type == 'discrete':
+            self.actions = [(action,) if isinstance(action, str) else tuple(action)
+                            for action in (actions or DISCRETE_ACTIONS)]
+            self.action_space = Discrete(len(self.actions), seed)
+            commands = 1
+        else:
+            for axis in axes:
+                if axis not in CONTINUOUS_AXES:
+                    raise ValueError(f"Unknown axis '{axis}', expected one of {list(CONTINUOUS_AXES)}")
+            self.axes = tuple(axes)
+            low = [bound for axis in self.axes for bound in CONTINUOUS_AXES[axis][1]]
+            high = [bound for axis in self.axes for bound in CONTINUOUS_AXES[axis][2]]
+            self.action_space = Box(low, high, seed)
+            commands = len(self.axes)
+
+        self._executor = ThreadPoolExecutor(max_workers=commands + len(self.cameras) + 1,
+                                            thread_name_prefix=f'cloudgripper-env-{robot.name}')
+        self._next_tick = None
+        self._steps = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Stop the worker threads. The robot itself is left open
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self._executor.shutdown(wait=True)
+
+    def _commands(self, action):
+        """
+        Map an action to a list of (robot method, args) calls
+        """
+        if self.action_type == 'discrete':
+            method, *args = self.actions[int(action)]
+            return [(method, args)]
+        action = np.clip(np.asarray(action, dtype=np.float64), self.action_space.low, self.action_space.high)
+        calls, offset = [], 0
+        for axis in self.axes:
+            method, low, _ = CONTINUOUS_AXES[axis]
+            calls.append((method, [float(value) for value in action[offset:offset + len(low)]]))
+            offset += len(low)
+        return calls
+
+    def _submit_observation(self):
+        futures = {'state': self._executor.submit(self.robot.get_state)}
+        for camera in self.cameras:
+            futures[camera] = self._executor.submit(getattr(self.robot, COMPONENTS[camera][0]), **self.image_options)
+        return futures
+
+    def _collect_observation(self, futures, info):
+        state, timestamp = futures['state'].result()
+        vector = np.full(len(STATE_FIELDS), np.nan, dtype=np.float32)
+        if state is not None:
+            vector[:] = [state[field] for field in STATE_FIELDS]
+        observation = {'state': vector}
+        timestamps = {'state': timestamp}
+        for camera in self.cameras:
+            image, timestamp = futures[camera].result()
+            observation['image_' + camera] = image
+            timestamps[camera] = timestamp
+        info['timestamps'] = timestamps
+        return observation
+
+    def _wait_tick(self):
+        """
+        Sleep until the next control period boundary
+
+        Returns:
+            overrun (float): Seconds the step started after its boundary, when the previous
+                step took longer than a period
+        """
+        if self.period is None:
+            return 0.0
+        now = time.monotonic()
+        if self._next_tick is None:
+            self._next_tick = now
+        delay = self._next_tick - now
+        if delay > 0:
+            time.sleep(delay)
+            overrun = 0.0
+        else:
+            overrun = -delay
+            # Start the schedule again from now instead of bursting to catch up
+            self._next_tick = now
+        self._next_tick += self.period
+        return overrun
+
+    def reset(self, seed=None, options=None):
+        """
+        Start an episode
+
+        Args:
+            seed (int, optional): Reseed the action space sampling
+            options (dict, optional): 'home' overrides the home position of this reset
+
+        Returns:
+            observation (dict): The first observation
+            info (dict): 'timestamps' of the observation components
+        """
+        if seed is not None:
+            self.action_space._rng = np.random.default_rng(seed)
+        home = (options or {}).get('home', self.home)
+        if home is not None:
+            x, y, z, rotation, gripper = home
+            calls = [('move_xy', (x, y)), ('move_z', (z,)), ('rotate', (rotation,)), ('move_gripper', (gripper,))]
+            for future in [self._executor.submit(getattr(self.robot, method), *args) for method, args in calls]:
+                future.result()
+            time.sleep(self.reset_wait)
+        self._steps = 0
+        self._next_tick = None
+        info = {}
+        observation = self._collect_observation(self._submit_observation(), info)
+        return observation, info
+
+    def step(self, action):
+        """
+        Send an action and fetch the next observation
+
+        The action's commands and the observation requests are in flight together.
+
+        Args:
+            action: An index into the discrete actions, or a vector of the continuous axes
+
+        Returns:
+            observation (dict): The next observation
+            reward (float): reward_fn(observation, action, info), 0 without reward_fn
+            terminated (bool): terminated_fn(observation, info), False without terminated_fn
+            truncated (bool): True when max_episode_steps is reached
+            info (dict):
+                - 'timestamps': Timestamps of the observation components
+                - 'command_timestamps': Timestamps of the sent commands, None for failed ones
+                - 'command_ok': True if every command was acknowledged
+                - 'overrun': Seconds the step started late on the control period
+                - 'step_time': Seconds from sending the action to receiving the observation
+        """
+        overrun = self._wait_tick()
+        start = time.monotonic()
+        commands = [self._executor.submit(getattr(self.robot, method), *args)
+                    for method, args in self._commands(action)]
+        observation_futures = self._submit_observation()
+
+        command_timestamps = [future.result() for future in commands]
+        info = {
+            'command_timestamps': command_timestamps,
+            'command_ok': all(timestamp is not None for timestamp in command_timestamps),
+            'overrun': overrun,
+        }
+        observation = self._collect_observation(observation_futures, info)
+        info['step_time'] = time.monotonic() - start
+
+        self._steps += 1
+        reward = float(self.reward_fn(observation, action, info)) if self.reward_fn is not None else 0.0
+        terminated = bool(self.terminated_fn(observation, info)) if self.terminated_fn is not None else False
+        truncated = self.max_episode_steps is not None and self._steps >= self.max_episode_steps
+        return observation, reward, terminated, truncated, info
@@ -0,0 +1,233 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from client.cloudgripper_client import GripperRobot, api_address_robots
+
+
+class RobotCallError(RuntimeError):
+    """A robot call that returned the client's failure value instead of raising"""
+
+
+def _call(robot, method, args, kwargs, deadline):
+    """
+    Call a robot method within what is left of a fan-out's deadline
+
+    Args:
+        robot (GripperRobot): The robot to call
+        method (str): Name of the robot method
+        args (tuple): Positional arguments for the method
+        kwargs (dict): Keyword arguments for the method
+        deadline (float, optional): time.monotonic() value the call must finish by
+
+    Returns:
+        result: Return value of the method
+    """
+    command = getattr(robot, method)
+    if deadline is None or not hasattr(robot, 'deadline'):
+        result = command(*args, **kwargs)
+    else:
+        with robot.deadline(deadline - time.monotonic()):
+            result = command(*args, **kwargs)
+    if result is None or (isinstance(result, tuple) and result and result[0] is None):
+        raise RobotCallError(f'{method} failed on {robot.name}')
+    return result
+
+
+class FleetResult:
+    """
+    The outcome of a command sent to several robots
+
+    Args:
+        results (dict): Return value of the command for each robot that answered in time
+        errors (dict): Exception for each robot whose call raised or reported a failure
+            (a None return, or None in place of the state or image)
+        timed_out (list): Names of the robots that did not answer before the deadline
+        elapsed (float): Wall-clock duration of the fan-out in seconds
+    """
+
+    def __init__(self, results, errors, timed_out, elapsed):
+        self.results = results
+        self.errors = errors
+        self.timed_out = timed_out
+        self.elapsed = elapsed
+
+    @property
+    def complete(self):
+        """True if every robot answered in time without raising"""
+        return not self.errors and not self.timed_out
+
+    def __getitem__(self, name):
+        return self.results[name]
+
+    def __repr__(self):
+        return (f"FleetResult(results={len(self.results)}, errors={len(self.errors)}, "
+                f"timed_out={len(self.timed_out)}, elapsed={self.elapsed:.3f})")
+
+
+class RobotFleet:
+    """
+    Send commands to and gather observations from several robots concurrently
+
+    Works with any robot exposing the GripperRobot API (GripperRobot, GripperRobotMock).
+    Calls run on a bounded thread pool, so a fleet-wide sweep costs roughly one round
+    trip instead of one per robot. With a deadline, the requests of each robot get at most
+    the time left as their timeout, so late calls end instead of holding a worker.
+
+    Args:
+        robots (dict or list): Robots keyed by name, or a list of robots with a `name` attribute
+        max_workers (int): Maximum number of calls in flight at once
+        timeout (float, optional): Default deadline of a fan-out in seconds (None waits forever)
+    """
+
+    def __init__(self, robots, max_workers=32, timeout=None):
+        if not isinstance(robots, dict):
+            robots = {robot.name: robot for robot in robots}
+        self.robots = robots
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='cloudgripper-fleet')
+
+    @classmethod
+    def from_names(cls, token, names=None, robot_class=None, max_workers=32, timeout=None, **robot_kwargs):
+        """
+        Create a fleet by constructing one robot per name
+
+        Args:
+            token (str): The token of the robots
+            names (list, optional): Robot names. Defaults to every robot in api_address_robots
+            robot_class (type, optional): Robot class to instantiate. Defaults to GripperRobot
+            max_workers (int): Maximum number of calls in flight at once
+            timeout (float, optional): Default deadline of a fan-out in seconds
+            **robot_kwargs: Extra keyword arguments for the robot class
+
+        Returns:
+            fleet (RobotFleet): The new fleet
+        """
+        if robot_class is None:
+            robot_class = GripperRobot
+        if names is None:
+            names = list(api_address_robots)
+        robots = {name: robot_class(name, token, **robot_kwargs) for name in names}
+        return cls(robots, max_workers=max_workers, timeout=timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.robots)
+
+    def close(self):
+        """
+        Stop the fleet's worker threads
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, calls, timeout):
+        """
+        Run one call per robot and collect whatever finishes before the deadline
+
+        Args:
+            calls (dict): (method name, args, kwargs) for each robot name
+            timeout (float, optional): Deadline in seconds, defaults to the fleet's timeout
+
+        Returns:
+            result (FleetResult): The collected results
+        """
+        if timeout is None:
+            timeout = self.timeout
+        start = time.perf_counter()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        futures = {}
+        for name, (method, args, kwargs) in calls.items():
+            future = self._executor.submit(_call, self.robots[name], method, args, kwargs, deadline)
+            futures[future] = name
+        done, pending = wait(futures, timeout=timeout)
+
+        results, errors = {}, {}
+        for future in done:
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors[name] = e
+        timed_out = []
+        for future in pending:
+            future.cancel()
+            timed_out.append(futures[future])
+        return FleetResult(results, errors, sorted(timed_out), time.perf_counter() - start)
+
+    def broadcast(self, command, *args, robots=None, timeout=None, **kwargs):
+        """
+        Send the same command to all robots or a subset of them
+
+        Args:
+            command (str): Name of the robot method, e.g. 'move_xy' or 'gripper_open'
+            *args: Positional arguments for the command
+            robots (list, optional): Names of the robots to address. Defaults to the whole fleet
+            timeout (float, optional): Deadline in seconds, late robots are reported as timed out
+            **kwargs: Keyword arguments for the command
+
+        Returns:
+            result (FleetResult): Return value of the command for each robot
+        """
+        if robots is None:
+            robots = self.robots
+        return self._run({name: (command, args, kwargs) for name in robots}, timeout)
+
+    def dispatch(self, commands, timeout=None):
+        """
+        Send a different command to each robot
+
+        Args:
+            commands (dict): For each robot name, a tuple of the method name followed by
+                its arguments, e.g. {'robot1': ('move_xy', 0.2, 0.4), 'robot2': ('gripper_close',)}
+            timeout (float, optional): Deadline in seconds, late robots are reported as timed out
+
+        Returns:
+            result (FleetResult): Return value of the command for each robot
+        """
+        calls = {name: (command[0], command[1:], {}) for name, command in commands.items()}
+        return self._run(calls, timeout)
+
+    def get_states(self, robots=None, timeout=None):
+        """
+        Get the state of several robots at once
+
+        Args:
+            robots (list, optional): Names of the robots to query. Defaults to the whole fleet
+            timeout (float, optional): Deadline in seconds, late robots are reported as timed out
+
+        Returns:
+            result (FleetResult): (state, timestamp) for each robot
+        """
+        return self.broadcast('get_state', robots=robots, timeout=timeout)
+
+    def get_images(self, camera='top', robots=None, timeout=None, **image_options):
+        """
+        Get a camera image from several robots at once
+
+        Args:
+            camera (str): 'top' or 'base'
+            robots (list, optional): Names of the robots to query. Defaults to the whole fleet
+            timeout (float, optional): Deadline in seconds, late robots are reported as timed out
+            **image_options: Options passed to getImageTop/getImageBase (raw, reduce, grayscale)
+
+        Returns:
+            result (FleetResult): (image, timestamp) for each robot
+        """
+        if camera == 'top':
+            command = 'getImageTop'
+        elif camera == 'base':
+            command = 'getImageBase'
+        else:
+            raise ValueError(f"Unknown camera '{camera}', expected 'top' or 'base'")
+        return self.broadcast(command, robots=robots, timeout=timeout, **image_options)
@@ -0,0 +1,192 @@
+import threading
+
+import numpy as np
+
+from client.cloudgripper_observation import STATE_FIELDS, RobotState
+
+# Fields holding servo currents
+CURRENT_FIELDS = ('z_current', 'rotation_current', 'claw_current')
+
+# Fields holding positions
+POSITION_FIELDS = ('x_norm', 'y_norm', 'z_norm', 'rotation', 'claw_norm')
+
+_COLUMNS = {field: i for i, field in enumerate(STATE_FIELDS)}
+
+
+class StateHistory:
+    """
+    A fixed-capacity ring buffer of robot states
+
+    States and timestamps are stored in preallocated NumPy columns, so recording a state
+    allocates nothing and queries over a window of recent states are vectorized. Once
+    full, new states overwrite the oldest ones. Appends and queries may run on different
+    threads.
+
+    Args:
+        capacity (int): Number of states kept
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self._states = np.full((capacity, len(STATE_FIELDS)), np.nan)
+        self._timestamps = np.full(capacity, np.nan)
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, state, timestamp):
+        """
+        Record a state
+
+        Args:
+            state (dict, RobotState or sequence): The state, as returned by get_state, or its
+                values in STATE_FIELDS order. None (a failed poll) is not recorded
+            timestamp (float): Timestamp of the state in seconds since the epoch
+
+        Returns:
+            recorded (bool): True if the state was recorded
+        """
+        if state is None or timestamp is None:
+            return False
+        if isinstance(state, RobotState):
+            values = state.as_tuple()
+        elif isinstance(state, dict):
+            values = [state.get(field, np.nan) for field in STATE_FIELDS]
+        else:
+            values = state
+        with self._lock:
+            self._states[self._next] = values
+            self._timestamps[self._next] = timestamp
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+        return True
+
+    def record(self, robot):
+        """
+        Poll a robot's state and record it
+
+        Args:
+            robot (GripperRobot): The robot to poll
+
+        Returns:
+            recorded (bool): True if the poll succeeded and the state was recorded
+        """
+        return self.append(*robot.get_state())
+
+    def clear(self):
+        """
+        Forget every recorded state
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._next = 0
+            self._count = 0
+
+    def window(self, seconds=None, last=None, fields=None):
+        """
+        Get recent states in chronological order
+
+        Args:
+            seconds (float, optional): Only states at most this many seconds older than the newest one
+            last (int, optional): Only the `last` most recent states
+            fields (sequence of str, optional): Columns to return. Defaults to STATE_FIELDS
+
+        Returns:
+            timestamps (numpy.ndarray): (n,) timestamps
+            states (numpy.ndarray): (n, len(fields)) state values
+        """
+        columns = slice(None) if fields is None else [_COLUMNS[field] for field in fields]
+        with self._lock:
+            count = self._count if last is None else min(last, self._count)
+            rows = (self._next - count + np.arange(count)) % self.capacity
+            timestamps = self._timestamps[rows]
+            states = self._states[rows][:, columns]
+        if seconds is not None and count:
+            start = np.searchsorted(timestamps, timestamps[-1] - seconds, side='left')
+            timestamps, states = timestamps[start:], states[start:]
+        return timestamps, states
+
+    def _reduce(self, reduction, fields, seconds, last):
+        single = isinstance(fields, str)
+        names = (fields,) if single else tuple(fields)
+        _, states = self.window(seconds, last, names)
+        if not len(states):
+            values = np.full(len(names), np.nan)
+        else:
+            values = reduction(states, axis=0)
+        if single:
+            return float(values[0])
+        return dict(zip(names, values.tolist()))
+
+    def mean(self, fields=CURRENT_FIELDS, seconds=None, last=None):
+        """
+        Mean of fields over a window of recent states
+
+        Args:
+            fields (str or sequence of str): Field or fields to average
+            seconds (float, optional): Window length in seconds, see window()
+            last (int, optional): Window length in states, see window()
+
+        Returns:
+            mean (float or dict): The mean of a single field, or a dict of means per field.
+                NaN if the window is empty
+        """
+        return self._reduce(np.nanmean, fields, seconds, last)
+
+    def max(self, fields=CURRENT_FIELDS, seconds=None, last=None):
+        """
+        Maximum of fields over a window of recent states
+
+        Args:
+            fields (str or sequence of str): Field or fields
+            seconds (float, optional): Window length in seconds, see window()
+            last (int, optional): Window length in states, see window()
+
+        Returns:
+            max (float or dict): The maximum of a single field, or a dict of maxima per field.
+                NaN if the window is empty
+        """
+        return self._reduce(np.nanmax, fields, seconds, last)
+
+    def velocity(self, fields=POSITION_FIELDS, seconds=None, last=None):
+        """
+        Estimate the rate of change of fields over a window of recent states
+
+        The estimate is the least-squares slope of each field against time, which is less
+        sensitive to noise and uneven polling than the difference of the last two states.
+
+        Args:
+            fields (str or sequence of str): Field or fields, e.g. 'claw_norm'
+            seconds (float, optional): Window length in seconds, see window()
+            last (int, optional): Window length in states, see window(). Defaults to
+                the last 10 states when no window is given
+
+        Returns:
+            velocity (float or dict): Units per second of a single field, or a dict per
+                field. NaN with fewer than two states in the window
+        """
+        if seconds is None and last is None:
+            last = 10
+        single = isinstance(fields, str)
+        names = (fields,) if single else tuple(fields)
+        timestamps, states = self.window(seconds, last, names)
+        if len(timestamps) < 2:
+            slopes = np.full(len(names), np.nan)
+        else:
+            t = timestamps - timestamps.mean()
+            denominator = (t * t).sum()
+            if denominator == 0:
+                slopes = np.full(len(names), np.nan)
+            else:
+                slopes = t @ (states - states.mean(axis=0)) / denominator
+        if single:
+            return float(slopes[0])
+        return dict(zip(names, slopes.tolist()))
@@ -0,0 +1,309 @@
+import bisect
+import threading
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Phases of a request:
+#   - 'queue': waiting for admission by a RequestScheduler
+#   - 'connect': until the response headers arrive (connection setup, request and server time)
+#   - 'transfer': reading the response body
+#   - 'parse': parsing the JSON body
+#   - 'decode': base64 and JPEG decoding of images
+#   - 'total': the whole request, without decoding
+PHASES = ('queue', 'connect', 'transfer', 'parse', 'decode', 'total')
+
+
+def endpoint_label(endpoint):
+    """
+    Strip the arguments from an endpoint path, e.g. '/gcode/0.1/0.2' -> '/gcode'
+
+    Args:
+        endpoint (str): Path of the endpoint
+
+    Returns:
+        label (str): The endpoint name used in metrics
+    """
+    return '/' + endpoint.split('/', 2)[1]
+
+
+class Histogram:
+    """
+    A cumulative latency histogram with fixed buckets
+
+    Args:
+        buckets (tuple of float): Sorted upper bounds of the buckets in seconds
+    """
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Estimate a quantile as the upper bound of the bucket containing it
+
+        Args:
+            q (float): The quantile as a fraction, e.g. 0.99
+
+        Returns:
+            value (float): The estimate in seconds, inf if it lies above the last bucket,
+                None if the histogram is empty
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        """
+        Summarize the histogram
+
+        Returns:
+            summary (dict): 'count', 'sum', 'mean', 'p50', 'p95' and 'p99' in seconds
+                (quantiles are bucket upper bounds), None if the histogram is empty
+        """
+        if not self.count:
+            return None
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+        }
+
+
+class _EndpointMetrics:
+    __slots__ = ('phases', 'requests', 'errors', 'in_flight', 'bytes')
+
+    def __init__(self, buckets):
+        self.phases = {phase: Histogram(buckets) for phase in PHASES}
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.bytes = 0
+
+
+class MetricsHook:
+    """
+    Base class for tracing hooks. Subclass it and override the methods you need
+    """
+
+    def on_phase(self, robot, endpoint, phase, start, duration):
+        """
+        Called when a request phase finishes
+
+        Args:
+            robot (str): Name of the robot
+            endpoint (str): Endpoint label, e.g. '/getImageTop'
+            phase (str): One of PHASES
+            start (float): perf_counter() time the phase started at
+            duration (float): Duration of the phase in seconds
+        """
+
+    def on_error(self, robot, endpoint, error):
+        """
+        Called when a request fails
+
+        Args:
+            robot (str): Name of the robot
+            endpoint (str): Endpoint label
+            error (Exception): The error
+        """
+
+
+class ClientMetrics:
+    """
+    Per-robot, per-endpoint request instrumentation
+
+    Records latency histograms for every request phase, payload bytes, request and error
+    counts, and in-flight requests. One instance can be shared by many robots.
+
+    Args:
+        buckets (tuple of float): Upper bounds of the latency histogram buckets in seconds
+        hooks (list of MetricsHook, optional): Tracing hooks notified of every phase and error
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, hooks=None):
+        self.buckets = tuple(sorted(buckets))
+        self.hooks = list(hooks or [])
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        """
+        Register a tracing hook
+
+        Args:
+            hook (MetricsHook): The hook
+
+        Returns:
+            None
+        """
+        self.hooks.append(hook)
+
+    def _metrics(self, robot, endpoint):
+        key = (robot, endpoint)
+        metrics = self._endpoints.get(key)
+        if metrics is None:
+            metrics = self._endpoints[key] = _EndpointMetrics(self.buckets)
+        return metrics
+
+    def request_started(self, robot, endpoint):
+        with self._lock:
+            metrics = self._metrics(robot, endpoint)
+            metrics.requests += 1
+            metrics.in_flight += 1
+
+    def request_finished(self, robot, endpoint, payload_bytes=0, error=None):
+        with self._lock:
+            metrics = self._metrics(robot, endpoint)
+            metrics.in_flight -= 1
+            metrics.bytes += payload_bytes
+            if error is not None:
+                metrics.errors += 1
+        if error is not None:
+            self.record_error(robot, endpoint, error, count=False)
+
+    def record_error(self, robot, endpoint, error, count=True):
+        """
+        Count an error that happened outside the request itself, e.g. while decoding
+
+        Args:
+            robot (str): Name of the robot
+            endpoint (str): Endpoint label
+            error (Exception): The error
+            count (bool): Increment the error counter
+
+        Returns:
+            None
+        """
+        if count:
+            with self._lock:
+                self._metrics(robot, endpoint).errors += 1
+        for hook in self.hooks:
+            hook.on_error(robot, endpoint, error)
+
+    def observe(self, robot, endpoint, phase, start, duration):
+        """
+        Record the duration of a request phase
+
+        Args:
+            robot (str): Name of the robot
+            endpoint (str): Endpoint label
+            phase (str): One of PHASES
+            start (float): perf_counter() time the phase started at
+            duration (float): Duration of the phase in seconds
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._metrics(robot, endpoint).phases[phase].observe(duration)
+        for hook in self.hooks:
+            hook.on_phase(robot, endpoint, phase, start, duration)
+
+    def stats(self, robot=None):
+        """
+        Get a snapshot of the metrics
+
+        Args:
+            robot (str, optional): Only return the metrics of this robot
+
+        Returns:
+            stats (dict): For each robot and endpoint label:
+                - 'requests', 'errors', 'in_flight', 'bytes': Counters
+                - 'phases': For each phase, 'count', 'sum', 'mean', 'p50', 'p95' and 'p99'
+                  in seconds (quantiles are bucket upper bounds)
+        """
+        stats = {}
+        with self._lock:
+            for (name, endpoint), metrics in self._endpoints.items():
+                if robot is not None and name != robot:
+                    continue
+                phases = {phase: histogram.summary() for phase, histogram in metrics.phases.items()
+                          if histogram.count}
+                stats.setdefault(name, {})[endpoint] = {
+                    'requests': metrics.requests,
+                    'errors': metrics.errors,
+                    'in_flight': metrics.in_flight,
+                    'bytes': metrics.bytes,
+                    'phases': phases,
+                }
+        if robot is not None:
+            return stats.get(robot, {})
+        return stats
+
+    def reset(self):
+        """
+        Clear all recorded metrics
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._endpoints = {}
+
+    def to_prometheus(self, prefix='cloudgripper'):
+        """
+        Export the metrics in the Prometheus text exposition format
+
+        Args:
+            prefix (str): Prefix of the metric names
+
+        Returns:
+            text (str): The metrics, ready to be served on a /metrics endpoint
+        """
+        lines = [
+            f'# HELP {prefix}_request_phase_seconds Duration of request phases.',
+            f'# TYPE {prefix}_request_phase_seconds histogram',
+        ]
+        counters = []
+        with self._lock:
+            for (robot, endpoint), metrics in sorted(self._endpoints.items()):
+                labels = f'robot="{_escape(robot)}",endpoint="{_escape(endpoint)}"'
+                for phase, histogram in metrics.phases.items():
+                    if not histogram.count:
+                        continue
+                    phase_labels = f'{labels},phase="{phase}"'
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{prefix}_request_phase_seconds_bucket{{{phase_labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{prefix}_request_phase_seconds_bucket{{{phase_labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f'{prefix}_request_phase_seconds_sum{{{phase_labels}}} {histogram.sum}')
+                    lines.append(f'{prefix}_request_phase_seconds_count{{{phase_labels}}} {histogram.count}')
+                counters.append((labels, metrics.requests, metrics.errors, metrics.bytes, metrics.in_flight))
+
+        for name, kind, description, column in (
+                ('requests_total', 'counter', 'Number of requests sent.', 1),
+                ('errors_total', 'counter', 'Number of failed requests.', 2),
+                ('response_bytes_total', 'counter', 'Bytes of response payloads received.', 3),
+                ('in_flight_requests', 'gauge', 'Number of requests waiting for a response.', 4)):
+            lines.append(f'# HELP {prefix}_{name} {description}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+            for row in counters:
+                lines.append(f'{prefix}_{name}{{{row[0]}}} {row[column]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,226 @@
+import asyncio
+from collections.abc import Mapping
+
+# Fields of the state returned by get_state, in a fixed order for array storage
+STATE_FIELDS = ('x_norm', 'y_norm', 'z_norm', 'rotation', 'claw_norm',
+                'z_current', 'rotation_current', 'claw_current')
+
+
+class RobotState(Mapping):
+    """
+    A compact, read-only robot state
+
+    Stores the STATE_FIELDS in slots instead of a dict, and reads like the dict returned
+    by get_state: state['claw_current'], state.get(...), keys(), items() and dict(state)
+    all work, as does attribute access (state.claw_current). Being immutable, one instance
+    can be shared between threads without copying.
+
+    Args:
+        *values (float): The field values in STATE_FIELDS order
+    """
+    __slots__ = STATE_FIELDS
+
+    def __init__(self, *values):
+        if len(values) != len(STATE_FIELDS):
+            raise TypeError(f"RobotState takes {len(STATE_FIELDS)} values, got {len(values)}")
+        for field, value in zip(STATE_FIELDS, values):
+            object.__setattr__(self, field, value)
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Build a RobotState from a state dict, ignoring unknown fields
+
+        Args:
+            state (dict): The state as returned by the API. Missing fields are None
+
+        Returns:
+            state (RobotState): The compact state
+        """
+        return cls(*[state.get(field) for field in STATE_FIELDS])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RobotState is read-only")
+
+    def __getitem__(self, field):
+        if field not in STATE_FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __iter__(self):
+        return iter(STATE_FIELDS)
+
+    def __len__(self):
+        return len(STATE_FIELDS)
+
+    def __contains__(self, field):
+        return field in STATE_FIELDS
+
+    def __reduce__(self):
+        return RobotState, self.as_tuple()
+
+    def as_tuple(self):
+        """The field values in STATE_FIELDS order"""
+        return tuple(getattr(self, field) for field in STATE_FIELDS)
+
+    def __repr__(self):
+        fields = ', '.join(f'{field}={getattr(self, field)!r}' for field in STATE_FIELDS)
+        return f'RobotState({fields})'
+
+
+class Observation:
+    """
+    The top image, base image and state of a robot fetched together
+
+    Args:
+        image_top (numpy.ndarray): The top camera image
+        image_base (numpy.ndarray): The base camera image
+        state (dict): The robot state, see GripperRobot.get_state
+        timestamp_top (float): Timestamp of the top image in seconds since the epoch
+        timestamp_base (float): Timestamp of the base image in seconds since the epoch
+        timestamp_state (float): Timestamp of the state in seconds since the epoch
+        refetches (int): Number of components fetched again to meet the skew bound
+    """
+    __slots__ = ('image_top', 'image_base', 'state',
+                 'timestamp_top', 'timestamp_base', 'timestamp_state', 'refetches')
+
+    def __init__(self, image_top, image_base, state, timestamp_top, timestamp_base, timestamp_state,
+                 refetches=0):
+        self.image_top = image_top
+        self.image_base = image_base
+        self.state = state
+        self.timestamp_top = timestamp_top
+        self.timestamp_base = timestamp_base
+        self.timestamp_state = timestamp_state
+        self.refetches = refetches
+
+    def _timestamps(self):
+        return [t for t in (self.timestamp_top, self.timestamp_base, self.timestamp_state)
+                if t is not None]
+
+    @property
+    def complete(self):
+        """True if all three components were fetched"""
+        return (self.image_top is not None and self.image_base is not None
+                and self.state is not None)
+
+    @property
+    def timestamp(self):
+        """Newest timestamp of the fetched components, None if nothing was fetched"""
+        timestamps = self._timestamps()
+        return max(timestamps) if timestamps else None
+
+    @property
+    def skew(self):
+        """Spread between the oldest and newest component timestamps in seconds"""
+        timestamps = self._timestamps()
+        return max(timestamps) - min(timestamps) if timestamps else 0.0
+
+    def __repr__(self):
+        return (f"Observation(timestamp={self.timestamp}, skew={self.skew:.4f}, "
+                f"complete={self.complete}, refetches={self.refetches})")
+
+
+# Observation component -> (robot method fetching it, Observation value attribute,
+# Observation timestamp attribute)
+COMPONENTS = {
+    'top': ('getImageTop', 'image_top', 'timestamp_top'),
+    'base': ('getImageBase', 'image_base', 'timestamp_base'),
+    'state': ('get_state', 'state', 'timestamp_state'),
+}
+
+
+def fetch_observation(robot, executor, max_skew=None, max_refetch=2, **image_options):
+    """
+    Fetch the top image, base image and state of a robot concurrently
+
+    Args:
+        robot (GripperRobot): The robot to observe
+        executor (concurrent.futures.Executor): Executor the three requests run on
+        max_skew (float, optional): Maximum allowed spread between the component timestamps
+            in seconds. Components older than this relative to the newest one are fetched again
+        max_refetch (int): Maximum number of refetch rounds when max_skew is exceeded
+        **image_options: Options passed to getImageTop/getImageBase (raw, reduce, grayscale)
+
+    Returns:
+        observation (Observation): The fetched observation
+    """
+    observation = Observation(None, None, None, None, None, None)
+    components = list(COMPONENTS)
+    for attempt in range(max_refetch + 1):
+        futures = {}
+        for component in components:
+            method = getattr(robot, COMPONENTS[component][0])
+            kwargs = image_options if component != 'state' else {}
+            futures[component] = executor.submit(method, **kwargs)
+        for component, future in futures.items():
+            _, value_attr, time_attr = COMPONENTS[component]
+            value, timestamp = future.result()
+            setattr(observation, value_attr, value)
+            setattr(observation, time_attr, timestamp)
+        if attempt:
+            observation.refetches += len(components)
+
+        components = _stale_components(observation, max_skew)
+        if not components:
+            break
+    return observation
+
+
+async def fetch_observation_async(robot, max_skew=None, max_refetch=2, **image_options):
+    """
+    Fetch the top image, base image and state of an asyncio robot concurrently
+
+    The coroutine counterpart of fetch_observation, for AsyncGripperRobot and AsyncGripperRobotMock.
+
+    Args:
+        robot (AsyncGripperRobot): The robot to observe
+        max_skew (float, optional): Maximum allowed spread between the component timestamps
+            in seconds. Components older than this relative to the newest one are fetched again
+        max_refetch (int): Maximum number of refetch rounds when max_skew is exceeded
+        **image_options: Options passed to getImageTop/getImageBase (raw, reduce, grayscale)
+
+    Returns:
+        observation (Observation): The fetched observation
+    """
+    observation = Observation(None, None, None, None, None, None)
+    components = list(COMPONENTS)
+    for attempt in range(max_refetch + 1):
+        calls = []
+        for component in components:
+            method = getattr(robot, COMPONENTS[component][0])
+            kwargs = image_options if component != 'state' else {}
+            calls.append(method(**kwargs))
+        results = await asyncio.gather(*calls)
+        for component, (value, timestamp) in zip(components, results):
+            _, value_attr, time_attr = COMPONENTS[component]
+            setattr(observation, value_attr, value)
+            setattr(observation, time_attr, timestamp)
+        if attempt:
+            observation.refetches += len(components)
+
+        components = _stale_components(observation, max_skew)
+        if not components:
+            break
+    return observation
+
+
+def _stale_components(observation, max_skew):
+    """
+    Get the components to fetch again so that the observation meets max_skew
+
+    Returns:
+        components (list of str): Missing components and those older than max_skew
+            relative to the newest one, empty if the observation is good or cannot improve
+    """
+    if max_skew is None or (observation.complete and observation.skew <= max_skew):
+        return []
+    newest = observation.timestamp
+    if newest is None:
+        return []
+    components = []
+    for component, (_, _, time_attr) in COMPONENTS.items():
+        timestamp = getattr(observation, time_attr)
+        if timestamp is None or newest - timestamp > max_skew:
+            components.append(component)
+    return components
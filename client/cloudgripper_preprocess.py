@@ -0,0 +1,219 @@
+import cv2
+import numpy as np
+
+from client.cloudgripper_observation import STATE_FIELDS
+
+# Color conversions from the BGR (or grayscale) images returned by the client
+_CONVERSIONS = {
+    ('bgr', 3): None,
+    ('rgb', 3): cv2.COLOR_BGR2RGB,
+    ('gray', 3): cv2.COLOR_BGR2GRAY,
+    ('bgr', 2): cv2.COLOR_GRAY2BGR,
+    ('rgb', 2): cv2.COLOR_GRAY2RGB,
+    ('gray', 2): None,
+}
+
+
+class ImagePreprocessor:
+    """
+    Crop, resize, convert and normalize a batch of camera images into a reused array
+
+    Images are cropped with views, resized and color converted by OpenCV straight into a
+    preallocated uint8 staging batch, and then normalized for the whole batch with one
+    vectorized pass into the float output. The staging and output buffers are allocated
+    once per batch size and reused, so the returned array is overwritten by the next call
+    with the same batch size; copy it to keep it.
+
+    Args:
+        size (tuple of int): Output (width, height)
+        roi (tuple of int, optional): (x, y, width, height) region cropped before resizing
+        color (str): Output channels, 'bgr', 'rgb' or 'gray'
+        scale (float): Factor applied to the pixel values before normalization, e.g. 1 / 255
+        mean (sequence of float, optional): Per-channel mean subtracted after scaling
+        std (sequence of float, optional): Per-channel standard deviation divided by after scaling
+        layout (str): 'hwc' or 'chw' (channels first, as most PyTorch models expect)
+        dtype: Output dtype
+        interpolation (int): OpenCV interpolation used for resizing
+    """
+
+    def __init__(self, size, roi=None, color='rgb', scale=1 / 255, mean=None, std=None, layout='chw',
+                 dtype=np.float32, interpolation=cv2.INTER_AREA):
+        if color not in ('bgr', 'rgb', 'gray'):
+            raise ValueError(f"Unknown color '{color}', expected 'bgr', 'rgb' or 'gray'")
+        if layout not in ('hwc', 'chw'):
+            raise ValueError(f"Unknown layout '{layout}', expected 'hwc' or 'chw'")
+        self.size = tuple(size)
+        self.roi = roi
+        self.color = color
+        self.channels = 1 if color == 'gray' else 3
+        self.scale = scale
+        self.layout = layout
+        self.dtype = dtype
+        self.interpolation = interpolation
+        self.mean = None if mean is None else np.asarray(mean, dtype=dtype).reshape(self._channel_shape())
+        self.std = None if std is None else np.asarray(std, dtype=dtype).reshape(self._channel_shape())
+        self._buffers = {}
+
+    def _channel_shape(self):
+        return (1, self.channels, 1, 1) if self.layout == 'chw' else (1, 1, 1, self.channels)
+
+    @property
+    def shape(self):
+        """Shape of one output image"""
+        width, height = self.size
+        if self.layout == 'chw':
+            return (self.channels, height, width)
+        return (height, width, self.channels)
+
+    def _allocate(self, batch_size):
+        buffers = self._buffers.get(batch_size)
+        if buffers is None:
+            width, height = self.size
+            staging = np.empty((batch_size, height, width, self.channels), dtype=np.uint8)
+            scratch = {3: np.empty((height, width, 3), dtype=np.uint8),
+                       2: np.empty((height, width), dtype=np.uint8)}
+            output = np.empty((batch_size,) + self.shape, dtype=self.dtype)
+            buffers = self._buffers[batch_size] = (staging, scratch, output)
+        return buffers
+
+    def _stage(self, image, staging, scratch):
+        """
+        Crop, resize and color convert one image into its staging slot
+        """
+        if self.roi is not None:
+            x, y, width, height = self.roi
+            image = image[y:y + height, x:x + width]
+        conversion = _CONVERSIONS[(self.color, image.ndim)]
+        # OpenCV writes into `dst` only when it has the exact output shape, so single-channel
+        # results go into a 2D view of the slot
+        target = staging[..., 0] if self.channels == 1 else staging
+        if conversion is None:
+            cv2.resize(image, self.size, dst=target, interpolation=self.interpolation)
+            return
+        resized = scratch[image.ndim]
+        cv2.resize(image, self.size, dst=resized, interpolation=self.interpolation)
+        cv2.cvtColor(resized, conversion, dst=target)
+
+    def __call__(self, images, out=None):
+        """
+        Preprocess a batch of images
+
+        Args:
+            images (sequence of numpy.ndarray): BGR or grayscale images, e.g. one per robot or
+                camera. None entries (failed camera calls) give all-zero outputs
+            out (numpy.ndarray, optional): Array of shape (len(images),) + shape and the
+                output dtype to write into instead of the internal buffer
+
+        Returns:
+            batch (numpy.ndarray): The preprocessed images, (n, c, h, w) or (n, h, w, c)
+            valid (numpy.ndarray): (n,) bool, False for None entries
+        """
+        staging, scratch, output = self._allocate(len(images))
+        if out is not None:
+            output = out
+        valid = np.empty(len(images), dtype=bool)
+        for i, image in enumerate(images):
+            valid[i] = image is not None
+            if image is None:
+                staging[i] = 0
+            else:
+                self._stage(image, staging[i], scratch)
+
+        source = staging.transpose(0, 3, 1, 2) if self.layout == 'chw' else staging
+        np.multiply(source, self.dtype(self.scale), out=output, casting='unsafe')
+        if self.mean is not None:
+            output -= self.mean
+        if self.std is not None:
+            output /= self.std
+        if not valid.all():
+            output[~valid] = 0
+        return output, valid
+
+
+class StateVectorizer:
+    """
+    Stack the states of many robots into a reused float array
+
+    Args:
+        fields (sequence of str): State fields to keep, in output order
+        offset (sequence of float, optional): Subtracted from each field
+        scale (sequence of float, optional): Multiplied with each field after the offset
+        dtype: Output dtype
+    """
+
+    def __init__(self, fields=STATE_FIELDS, offset=None, scale=None, dtype=np.float32):
+        self.fields = tuple(fields)
+        self.dtype = dtype
+        self.offset = None if offset is None else np.asarray(offset, dtype=dtype)
+        self.scale = None if scale is None else np.asarray(scale, dtype=dtype)
+        self._buffers = {}
+
+    def __call__(self, states, out=None):
+        """
+        Vectorize a batch of states
+
+        Args:
+            states (sequence): States as returned by get_state (dicts or RobotState), None
+                for failed calls
+            out (numpy.ndarray, optional): (len(states), len(fields)) array to write into
+                instead of the internal buffer
+
+        Returns:
+            batch (numpy.ndarray): (n, len(fields)) values, NaN rows for None entries
+            valid (numpy.ndarray): (n,) bool, False for None entries
+        """
+        if out is None:
+            out = self._buffers.get(len(states))
+            if out is None:
+                out = self._buffers[len(states)] = np.empty((len(states), len(self.fields)), dtype=self.dtype)
+        valid = np.empty(len(states), dtype=bool)
+        for i, state in enumerate(states):
+            valid[i] = state is not None
+            if state is None:
+                out[i] = np.nan
+            else:
+                out[i] = [state[field] for field in self.fields]
+        if self.offset is not None:
+            out -= self.offset
+        if self.scale is not None:
+            out *= self.scale
+        return out, valid
+
+
+class ObservationPreprocessor:
+    """
+    Preprocess a batch of observations, e.g. one per robot, into model inputs
+
+    Args:
+        cameras (dict): ImagePreprocessor for each camera to keep, keys 'top' and/or 'base'
+        state (StateVectorizer, optional): Vectorizer of the states, None to leave them out
+    """
+
+    def __init__(self, cameras, state=None):
+        for camera in cameras:
+            if camera not in ('top', 'base'):
+                raise ValueError(f"Unknown camera '{camera}', expected 'top' or 'base'")
+        self.cameras = dict(cameras)
+        self.state = state
+
+    def __call__(self, observations):
+        """
+        Preprocess a batch of observations
+
+        Args:
+            observations (sequence of Observation): Observations from get_observation
+
+        Returns:
+            batch (dict): For each camera, 'image_<camera>', and 'state' if vectorized
+            valid (numpy.ndarray): (n,) bool, True for observations with every kept component
+        """
+        batch = {}
+        valid = np.ones(len(observations), dtype=bool)
+        for camera, preprocess in self.cameras.items():
+            images = [getattr(observation, 'image_' + camera) for observation in observations]
+            batch['image_' + camera], ok = preprocess(images)
+            valid &= ok
+        if self.state is not None:
+            batch['state'], ok = self.state([observation.state for observation in observations])
+            valid &= ok
+        return batch, valid
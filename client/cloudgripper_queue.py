@@ -0,0 +1,323 @@
+import threading
+
+from client.cloudgripper_control import STEP_SIZE
+
+# Lane -> (robot method, state fields of its target)
+LANES = {
+    'xy': ('move_xy', ('x_norm', 'y_norm')),
+    'z': ('move_z', ('z_norm',)),
+    'rotation': ('rotate', ('rotation',)),
+    'gripper': ('move_gripper', ('claw_norm',)),
+}
+
+
+class _Lane:
+    """
+    The newest unsent target of one axis and what was last sent to the robot
+    """
+    __slots__ = ('name', 'method', 'pending', 'in_flight', 'sent', 'thread')
+
+    def __init__(self, name, method):
+        self.name = name
+        self.method = method
+        self.pending = None
+        self.in_flight = None
+        self.sent = None
+        self.thread = None
+
+    def latest(self):
+        """Target the robot ends at if nothing else is queued"""
+        if self.pending is not None:
+            return self.pending
+        if self.in_flight is not None:
+            return self.in_flight
+        return self.sent
+
+
+class CommandQueue:
+    """
+    A per-robot motion command queue where the newest target of each axis wins
+
+    Each axis (xy, z, rotation, gripper) holds at most one unsent target and has one
+    command in flight at a time. A new target replaces the unsent one, so bursts of
+    commands collapse into the most recent target instead of each becoming a round trip
+    the robot works through. Step commands are turned into absolute move_xy targets from
+    the tracked position, and targets equal to what the robot is already moving to are
+    dropped. Different axes are sent concurrently.
+
+    Commands return immediately; failures are counted in stats() and printed, and a
+    failed command does not stop its axis.
+
+    Args:
+        robot (GripperRobot): The robot to send commands to, or a GripperRobotMock
+        step_size (float): Normalized distance of the step commands
+        tolerance (float): Targets closer than this to the current target are dropped
+    """
+
+    def __init__(self, robot, step_size=STEP_SIZE, tolerance=1e-6):
+        self.robot = robot
+        self.step_size = step_size
+        self.tolerance = tolerance
+        self.sent = 0
+        self.superseded = 0
+        self.dropped = 0
+        self.failed = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._lanes = {name: _Lane(name, method) for name, (method, _) in LANES.items()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _same(self, a, b):
+        return a is not None and b is not None and all(abs(x - y) <= self.tolerance for x, y in zip(a, b))
+
+    def sync(self):
+        """
+        Take the robot's current position as the target of axes that have none yet
+
+        Called automatically by the first step command.
+
+        Args:
+            None
+
+        Returns:
+            success (bool): True if the robot's state could be read
+        """
+        state, _ = self.robot.get_state()
+        if state is None:
+            return False
+        with self._condition:
+            for name, (_, fields) in LANES.items():
+                lane = self._lanes[name]
+                if lane.latest() is None:
+                    lane.sent = tuple(float(state[field]) for field in fields)
+        return True
+
+    def _submit(self, name, target):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("CommandQueue is closed")
+            lane = self._lanes[name]
+            if self._same(lane.latest(), target):
+                self.dropped += 1
+                return False
+            if lane.pending is not None:
+                self.superseded += 1
+            base = lane.in_flight if lane.in_flight is not None else lane.sent
+            # Going back to the target already in flight needs no new command
+            lane.pending = None if self._same(base, target) else target
+            if lane.thread is None:
+                lane.thread = threading.Thread(target=self._run, args=(lane,), daemon=True,
+                                               name=f'cloudgripper-queue-{self.robot.name}-{name}')
+                lane.thread.start()
+            self._condition.notify_all()
+            return True
+
+    def _run(self, lane):
+        method = getattr(self.robot, lane.method)
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: lane.pending is not None or self._closed)
+                if lane.pending is None:
+                    return
+                target, lane.pending = lane.pending, None
+                lane.in_flight = target
+            timestamp = None
+            try:
+                timestamp = method(*target)
+            except Exception as e:
+                # Keep the lane alive: the next target of the axis must still be sent
+                print('Command failed:', e)
+            finally:
+                with self._condition:
+                    lane.in_flight = None
+                    if timestamp is not None:
+                        lane.sent = target
+                        self.sent += 1
+                    else:
+                        self.failed += 1
+                    self._condition.notify_all()
+
+    def _step(self, dx, dy):
+        with self._condition:
+            synced = self._lanes['xy'].latest() is not None
+        if not synced and not self.sync():
+            return False
+        # Read the target and submit the step under one lock, so concurrent steps add up
+        with self._condition:
+            current = self._lanes['xy'].latest()
+            x = min(1.0, max(0.0, current[0] + dx * self.step_size))
+            y = min(1.0, max(0.0, current[1] + dy * self.step_size))
+            return self._submit('xy', (x, y))
+
+    def step_forward(self):
+        """
+        Queue one step forward (y-direction) from the newest xy target
+
+        Returns:
+            queued (bool): False if the command changed nothing and was dropped
+        """
+        return self._step(0, 1)
+
+    def step_backward(self):
+        """
+        Queue one step backward (y-direction) from the newest xy target
+
+        Returns:
+            queued (bool): False if the command changed nothing and was dropped
+        """
+        return self._step(0, -1)
+
+    def step_left(self):
+        """
+        Queue one step left (x-direction) from the newest xy target
+
+        Returns:
+            queued (bool): False if the command changed nothing and was dropped
+        """
+        return self._step(-1, 0)
+
+    def step_right(self):
+        """
+        Queue one step right (x-direction) from the newest xy target
+
+        Returns:
+            queued (bool): False if the command changed nothing and was dropped
+        """
+        return self._step(1, 0)
+
+    def move_xy(self, x, y):
+        """
+        Queue a move to normalized x and y coordinates, replacing any unsent xy target
+
+        Args:
+            x (float): The desired normalized x-coordinate (0 for leftmost, 1 for rightmost)
+            y (float): The desired normalized y-coordinate (0 for backmost, 1 for forwardmost)
+
+        Returns:
+            queued (bool): False if the command changed nothing and was dropped
+        """
+        return self._submit('xy', (float(x), float(y)))
+
+    def move_z(self, z):
+        """
+        Queue a z-axis move, replacing any unsent z target
+
+        Args:
+            z (float): The desired normalized z-axis position (0 for fully down, 1 for fully up)
+
+        Returns:
+            queued (bool): False if the command changed nothing and was dropped
+        """
+        return self._submit('z', (float(z),))
+
+    def rotate(self, angle):
+        """
+        Queue a rotation, replacing any unsent rotation target
+
+        Args:
+            angle (float): The desired rotation angle in degrees
+
+        Returns:
+            queued (bool): False if the command changed nothing and was dropped
+        """
+        return self._submit('rotation', (float(angle),))
+
+    def move_gripper(self, angle):
+        """
+        Queue a gripper move, replacing any unsent gripper target
+
+        Args:
+            angle (float): The desired gripper angle (0 for closed, 1 for open)
+
+        Returns:
+            queued (bool): False if the command changed nothing and was dropped
+        """
+        return self._submit('gripper', (float(angle),))
+
+    def gripper_open(self):
+        """
+        Queue opening the gripper
+
+        Returns:
+            queued (bool): False if the command changed nothing and was dropped
+        """
+        return self.move_gripper(1)
+
+    def gripper_close(self):
+        """
+        Queue closing the gripper
+
+        Returns:
+            queued (bool): False if the command changed nothing and was dropped
+        """
+        return self.move_gripper(0)
+
+    @property
+    def targets(self):
+        """Newest target of each axis, None for axes never commanded or synced"""
+        with self._condition:
+            return {name: lane.latest() for name, lane in self._lanes.items()}
+
+    def stats(self):
+        """
+        Get the queue counters
+
+        Args:
+            None
+
+        Returns:
+            stats (dict):
+                - 'sent': Commands acknowledged by the robot
+                - 'superseded': Unsent targets replaced by a newer one
+                - 'dropped': Commands dropped because they changed nothing
+                - 'failed': Commands the robot did not acknowledge
+                - 'pending': Axes with an unsent target
+                - 'in_flight': Axes with a command in flight
+        """
+        with self._condition:
+            return {
+                'sent': self.sent,
+                'superseded': self.superseded,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'pending': sum(lane.pending is not None for lane in self._lanes.values()),
+                'in_flight': sum(lane.in_flight is not None for lane in self._lanes.values()),
+            }
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued target has been sent
+
+        Args:
+            timeout (float, optional): Maximum time to wait in seconds
+
+        Returns:
+            done (bool): True if the queue is empty, False on timeout
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: all(lane.pending is None and lane.in_flight is None for lane in self._lanes.values()),
+                timeout)
+
+    def close(self, timeout=None):
+        """
+        Send the queued targets and stop the queue
+
+        Args:
+            timeout (float, optional): Maximum time to wait for the queued targets in seconds
+
+        Returns:
+            None
+        """
+        self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for lane in self._lanes.values():
+            if lane.thread is not None:
+                lane.thread.join(timeout)
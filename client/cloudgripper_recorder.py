@@ -0,0 +1,393 @@
+import json
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+from client.cloudgripper_observation import STATE_FIELDS
+
+FORMAT_VERSION = 1
+CAMERAS = ('top', 'base')
+
+# Column order of the per-step timestamps array
+TIMESTAMP_FIELDS = ('step', 'top', 'base', 'state')
+
+_STOP = object()
+
+
+def _chunk_dir(path, index):
+    return os.path.join(path, f'chunk_{index:06d}')
+
+
+class EpisodeRecorder:
+    """
+    Stream observations, actions and timestamps of an episode to disk
+
+    Steps are handed to a background writer and flushed in fixed-size chunks, so memory
+    use stays bounded on long episodes. Each chunk directory holds:
+        - '<camera>.jpg.bin' and '<camera>_index.npy': the concatenated JPEG frames and
+          their (offset, length) in the blob
+        - 'state.npy': float64 array of shape (n, 8) in STATE_FIELDS order
+        - 'timestamps.npy': float64 array of shape (n, 4) in TIMESTAMP_FIELDS order
+        - 'action.npy': float64 array of shape (n, action_dim)
+    'meta.json' is rewritten after every chunk, so the flushed part of an episode can be
+    read while it is recorded; its 'complete' flag is set by close().
+    Missing values are stored as NaN (zero-length frames for images). JPEG bytes, e.g.
+    from get_observation(raw=True), are written as-is; decoded images are encoded to JPEG
+    on the writer thread.
+
+    Args:
+        path (str): Directory of the episode, created if needed
+        chunk_size (int): Number of steps per chunk
+        queue_size (int): Maximum number of steps waiting for the writer. record() blocks
+            when the writer falls this far behind
+        jpeg_quality (int): JPEG quality used for decoded images
+        metadata (dict, optional): Extra JSON-serializable information stored with the episode
+    """
+
+    def __init__(self, path, chunk_size=256, queue_size=64, jpeg_quality=90, metadata=None):
+        if os.path.exists(os.path.join(path, 'meta.json')):
+            raise FileExistsError(f"An episode is already recorded in {path}")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk_size = chunk_size
+        self.jpeg_quality = jpeg_quality
+        self.metadata = metadata or {}
+        self.num_steps = 0
+        self.action_dim = None
+        self.error = None
+
+        self._chunks = []
+        self._pending = self._empty_chunk()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name='cloudgripper-recorder')
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, observation=None, action=None, timestamp=None, image_top=None, image_base=None,
+               state=None, timestamp_top=None, timestamp_base=None, timestamp_state=None):
+        """
+        Queue one step for writing
+
+        Either pass an Observation, or the components individually.
+
+        Args:
+            observation (Observation, optional): Observation from get_observation
+            action (sequence of float, optional): The action taken at this step
+            timestamp (float, optional): Time of the step in seconds since the epoch. Defaults to now
+            image_top (numpy.ndarray or bytes, optional): Top camera image or its JPEG bytes
+            image_base (numpy.ndarray or bytes, optional): Base camera image or its JPEG bytes
+            state (dict, optional): Robot state as returned by get_state
+            timestamp_top (float, optional): Timestamp of the top image
+            timestamp_base (float, optional): Timestamp of the base image
+            timestamp_state (float, optional): Timestamp of the state
+
+        Returns:
+            None
+        """
+        if self._closed:
+            raise RuntimeError("The recorder is closed")
+        if self.error is not None:
+            raise RuntimeError("The recorder's writer failed") from self.error
+        if observation is not None:
+            image_top, image_base, state = observation.image_top, observation.image_base, observation.state
+            timestamp_top = observation.timestamp_top
+            timestamp_base = observation.timestamp_base
+            timestamp_state = observation.timestamp_state
+        if timestamp is None:
+            timestamp = time.time()
+        # The writer runs later: copy what the caller may reuse, e.g. a frame decoded into `out`
+        if state is not None:
+            state = [state[field] for field in STATE_FIELDS]
+        if action is not None:
+            action = np.array(action, dtype=np.float64, copy=True)
+        self._queue.put((timestamp, action, _snapshot(image_top), _snapshot(image_base), state,
+                         timestamp_top, timestamp_base, timestamp_state))
+
+    def close(self):
+        """
+        Flush the queued steps and finalize the episode
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self.error is not None:
+            raise RuntimeError("The recorder's writer failed") from self.error
+
+    def _empty_chunk(self):
+        chunk = {camera: [] for camera in CAMERAS}
+        chunk.update(state=[], timestamps=[], action=[])
+        return chunk
+
+    def _run(self):
+        while True:
+            step = self._queue.get()
+            if step is _STOP:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self._append(*step)
+                if len(self._pending['timestamps']) >= self.chunk_size:
+                    self._flush()
+            except Exception as e:
+                self.error = e
+        try:
+            if self.error is None:
+                if self._pending['timestamps']:
+                    self._flush()
+                self._write_meta(complete=True)
+        except Exception as e:
+            self.error = e
+
+    def _append(self, timestamp, action, image_top, image_base, state,
+                timestamp_top, timestamp_base, timestamp_state):
+        chunk = self._pending
+        for camera, image in (('top', image_top), ('base', image_base)):
+            chunk[camera].append(self._encode(image))
+        if state is None:
+            chunk['state'].append([np.nan] * len(STATE_FIELDS))
+        else:
+            chunk['state'].append(state)
+        chunk['timestamps'].append([_nan(timestamp), _nan(timestamp_top),
+                                    _nan(timestamp_base), _nan(timestamp_state)])
+        if action is not None:
+            action = np.asarray(action, dtype=np.float64).reshape(-1)
+            if self.action_dim is None:
+                self.action_dim = len(action)
+            elif len(action) != self.action_dim:
+                raise ValueError(f"Action has {len(action)} values, expected {self.action_dim}")
+        chunk['action'].append(action)
+
+    def _encode(self, image):
+        if image is None:
+            return b''
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return bytes(image)
+        import cv2
+        ok, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise ValueError("Could not encode image")
+        return jpeg.tobytes()
+
+    def _flush(self):
+        chunk = self._pending
+        directory = _chunk_dir(self.path, len(self._chunks))
+        os.makedirs(directory, exist_ok=True)
+        for camera in CAMERAS:
+            frames = chunk[camera]
+            lengths = np.array([len(frame) for frame in frames], dtype=np.int64)
+            offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+            with open(os.path.join(directory, f'{camera}.jpg.bin'), 'wb') as f:
+                for frame in frames:
+                    f.write(frame)
+            np.save(os.path.join(directory, f'{camera}_index.npy'), np.stack([offsets, lengths], axis=1))
+        np.save(os.path.join(directory, 'state.npy'), np.array(chunk['state'], dtype=np.float64))
+        np.save(os.path.join(directory, 'timestamps.npy'), np.array(chunk['timestamps'], dtype=np.float64))
+        action_dim = self.action_dim or 0
+        actions = [a if a is not None else np.full(action_dim, np.nan) for a in chunk['action']]
+        np.save(os.path.join(directory, 'action.npy'),
+                np.array(actions, dtype=np.float64).reshape(len(actions), action_dim))
+
+        size = len(chunk['timestamps'])
+        self._chunks.append(size)
+        self.num_steps += size
+        self._pending = self._empty_chunk()
+        # Keep the flushed chunks readable while the episode is still being recorded
+        self._write_meta(complete=False)
+
+    def _write_meta(self, complete):
+        meta = {
+            'version': FORMAT_VERSION,
+            'num_steps': self.num_steps,
+            'chunk_size': self.chunk_size,
+            'chunks': self._chunks,
+            'cameras': list(CAMERAS),
+            'state_fields': list(STATE_FIELDS),
+            'timestamp_fields': list(TIMESTAMP_FIELDS),
+            'action_dim': self.action_dim or 0,
+            'metadata': self.metadata,
+            'complete': complete,
+        }
+        path = os.path.join(self.path, 'meta.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(path + '.tmp', path)
+
+
+def _snapshot(image):
+    if isinstance(image, np.ndarray):
+        return np.array(image, copy=True)
+    if isinstance(image, (bytearray, memoryview)):
+        return bytes(image)
+    return image
+
+
+def _nan(value):
+    return np.nan if value is None else value
+
+
+class EpisodeReader:
+    """
+    Random access to an episode written by EpisodeRecorder
+
+    Arrays and JPEG blobs are memory-mapped, so opening an episode is cheap and only
+    the requested steps are read from disk.
+
+    Args:
+        path (str): Directory of the episode
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported episode format version {self.meta['version']}")
+        self.path = path
+        self.action_dim = self.meta['action_dim']
+        # False while the episode is still being recorded: only its flushed chunks are visible
+        self.complete = self.meta.get('complete', True)
+        self._starts = np.concatenate([[0], np.cumsum(self.meta['chunks'])]).astype(np.int64)
+        self._chunks = [self._open_chunk(i) for i in range(len(self.meta['chunks']))]
+
+    def _open_chunk(self, index):
+        directory = _chunk_dir(self.path, index)
+        chunk = {}
+        for name in ('state', 'timestamps', 'action'):
+            chunk[name] = np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+        for camera in self.meta['cameras']:
+            chunk[f'{camera}_index'] = np.load(os.path.join(directory, f'{camera}_index.npy'))
+            blob = os.path.join(directory, f'{camera}.jpg.bin')
+            if os.path.getsize(blob):
+                chunk[camera] = np.memmap(blob, dtype=np.uint8, mode='r')
+            else:
+                chunk[camera] = np.empty(0, dtype=np.uint8)
+        return chunk
+
+    def __len__(self):
+        return self.meta['num_steps']
+
+    def _locate(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        if indices.size and (indices.min() < -len(self) or indices.max() >= len(self)):
+            raise IndexError("Step index out of range")
+        indices = np.where(indices < 0, indices + len(self), indices)
+        chunks = np.searchsorted(self._starts, indices, side='right') - 1
+        return indices, chunks, indices - self._starts[chunks]
+
+    def _gather(self, name, width, indices):
+        indices, chunks, offsets = self._locate(indices)
+        out = np.full((len(indices), width), np.nan)
+        for chunk in np.unique(chunks):
+            mask = chunks == chunk
+            values = self._chunks[chunk][name]
+            # Chunks flushed before the first action was recorded have no action columns
+            if values.shape[1] == width:
+                out[mask] = values[offsets[mask]]
+        return out
+
+    def states(self, indices):
+        """
+        Get the states of several steps
+
+        Args:
+            indices (array-like of int): Step indices
+
+        Returns:
+            states (numpy.ndarray): float64 array of shape (len(indices), 8) in STATE_FIELDS order
+        """
+        return self._gather('state', len(STATE_FIELDS), indices)
+
+    def timestamps(self, indices):
+        """
+        Get the timestamps of several steps
+
+        Args:
+            indices (array-like of int): Step indices
+
+        Returns:
+            timestamps (numpy.ndarray): float64 array of shape (len(indices), 4) in TIMESTAMP_FIELDS order
+        """
+        return self._gather('timestamps', len(TIMESTAMP_FIELDS), indices)
+
+    def actions(self, indices):
+        """
+        Get the actions of several steps
+
+        Args:
+            indices (array-like of int): Step indices
+
+        Returns:
+            actions (numpy.ndarray): float64 array of shape (len(indices), action_dim)
+        """
+        return self._gather('action', self.action_dim, indices)
+
+    def jpeg(self, camera, index):
+        """
+        Get the compressed frame of one step
+
+        Args:
+            camera (str): 'top' or 'base'
+            index (int): Step index
+
+        Returns:
+            jpeg (numpy.ndarray): uint8 view of the JPEG bytes, empty if the frame is missing
+        """
+        _, chunks, offsets = self._locate([index])
+        chunk = self._chunks[chunks[0]]
+        start, length = chunk[f'{camera}_index'][offsets[0]]
+        return chunk[camera][start:start + length]
+
+    def images(self, camera, indices, reduce=1, grayscale=False):
+        """
+        Decode the frames of several steps
+
+        Args:
+            camera (str): 'top' or 'base'
+            indices (array-like of int): Step indices
+            reduce (int): Downscale factor applied while decoding (1, 2, 4 or 8)
+            grayscale (bool): Decode to single-channel grayscale images
+
+        Returns:
+            images (list of numpy.ndarray): The decoded images, None for missing frames
+        """
+        from client.cloudgripper_client import decode_image
+        images = []
+        for index in np.asarray(indices, dtype=np.int64):
+            jpeg = self.jpeg(camera, index)
+            images.append(decode_image(jpeg.tobytes(), reduce, grayscale) if len(jpeg) else None)
+        return images
+
+    def batch(self, indices, cameras=CAMERAS, reduce=1, grayscale=False):
+        """
+        Load a training batch
+
+        Args:
+            indices (array-like of int): Step indices
+            cameras (tuple of str): Cameras to decode
+            reduce (int): Downscale factor applied while decoding (1, 2, 4 or 8)
+            grayscale (bool): Decode to single-channel grayscale images
+
+        Returns:
+            batch (dict): 'state', 'action' and 'timestamps' arrays, and a list of images per camera
+        """
+        batch = {'state': self.states(indices), 'action': self.actions(indices),
+                 'timestamps': self.timestamps(indices)}
+        for camera in cameras:
+            batch[camera] = self.images(camera, indices, reduce, grayscale)
+        return batch
@@ -0,0 +1,181 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests import exceptions
+
+# Threads that run hedged requests, shared by all robots
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor():
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix='cloudgripper-hedge')
+        return _hedge_executor
+
+
+class LatencyTracker:
+    """
+    Recent request latencies per endpoint
+
+    Args:
+        window (int): Number of recent latencies kept per endpoint
+    """
+
+    def __init__(self, window=256):
+        self.window = window
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        """
+        Record the latency of a successful request
+
+        Args:
+            key (str): The endpoint
+            seconds (float): The request latency
+
+        Returns:
+            None
+        """
+        with self._lock:
+            latencies = self._latencies.get(key)
+            if latencies is None:
+                latencies = self._latencies[key] = deque(maxlen=self.window)
+            latencies.append(seconds)
+
+    def percentile(self, key, q, min_samples=1):
+        """
+        Get a latency percentile of an endpoint
+
+        Args:
+            key (str): The endpoint
+            q (float): The percentile as a fraction, e.g. 0.95
+            min_samples (int): Minimum number of recorded latencies needed for an estimate
+
+        Returns:
+            latency (float): The percentile in seconds, or None if there are too few samples
+        """
+        with self._lock:
+            latencies = self._latencies.get(key)
+            if latencies is None or len(latencies) < min_samples:
+                return None
+            ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class RetryPolicy:
+    """
+    Deadline-bounded retries with jittered exponential backoff
+
+    Only used for read-only endpoints (getState, getImageTop, getImageBase).
+
+    Args:
+        attempts (int): Maximum number of attempts, including the first one
+        deadline (float, optional): Maximum total time in seconds spent on a call, including
+            backoff. Attempts are given at most the remaining time as their read timeout
+        backoff (float): Base backoff in seconds, doubled after every failed attempt
+        max_backoff (float): Upper bound of the backoff in seconds
+    """
+
+    def __init__(self, attempts=3, deadline=None, backoff=0.05, max_backoff=1.0):
+        self.attempts = attempts
+        self.deadline = deadline
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt):
+        """
+        Backoff before the next attempt, with full jitter
+
+        Args:
+            attempt (int): Number of failed attempts so far
+
+        Returns:
+            delay (float): Seconds to wait
+        """
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+
+class HedgePolicy:
+    """
+    Send a second request when the first is slower than usual
+
+    Only used for read-only endpoints (getState, getImageTop, getImageBase).
+
+    Args:
+        percentile (float): Latency percentile of the endpoint after which the hedge is sent
+        min_delay (float): Lower bound of the hedge delay in seconds
+        min_samples (int): Number of recorded latencies needed before hedging starts
+    """
+
+    def __init__(self, percentile=0.95, min_delay=0.005, min_samples=20):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+
+
+def _hedged(send, timeout, delay):
+    """
+    Run send(timeout), and a second copy if the first has not answered after `delay` seconds
+
+    Returns the first successful result, or raises the last error if both fail.
+    """
+    executor = _get_hedge_executor()
+    first = executor.submit(send, timeout)
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+    pending = {first, executor.submit(send, timeout)}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def call_idempotent(send, key, retry=None, hedge=None, latency=None):
+    """
+    Call a read-only endpoint with optional hedging and retries
+
+    Must never be used for motion commands: a hedge or retry would send them twice.
+
+    Args:
+        send (callable): Function sending the request, called with the read timeout in
+            seconds (None for the default)
+        key (str): The endpoint, used to look up its latency percentile
+        retry (RetryPolicy, optional): Retry policy
+        hedge (HedgePolicy, optional): Hedging policy, requires `latency`
+        latency (LatencyTracker, optional): Latencies recorded by `send`
+
+    Returns:
+        result: The return value of the first successful call
+    """
+    start = time.monotonic()
+    attempt = 0
+    while True:
+        timeout = None
+        if retry is not None and retry.deadline is not None:
+            timeout = retry.deadline - (time.monotonic() - start)
+        try:
+            delay = None
+            if hedge is not None:
+                delay = latency.percentile(key, hedge.percentile, hedge.min_samples)
+            if delay is None:
+                return send(timeout)
+            return _hedged(send, timeout, max(delay, hedge.min_delay))
+        except exceptions.RequestException:
+            attempt += 1
+            if retry is None or attempt >= retry.attempts:
+                raise
+            pause = retry.delay(attempt)
+            if retry.deadline is not None and time.monotonic() - start + pause >= retry.deadline:
+                raise
+            time.sleep(pause)
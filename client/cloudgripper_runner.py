@@ -0,0 +1,374 @@
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from client.cloudgripper_metrics import DEFAULT_BUCKETS, Histogram
+from client.cloudgripper_observation import COMPONENTS, Observation
+from client.cloudgripper_queue import CommandQueue
+from client.cloudgripper_retry import LatencyTracker
+
+# Timed phases of a control tick:
+#   - 'fetch': round trip of an observation fetch, from launch to the last response
+#   - 'wait': time the tick blocked waiting for an observation
+#   - 'policy': the policy call
+#   - 'dispatch': handing the policy's commands to the command queue
+#   - 'tick': the whole tick, from its start to the commands being queued
+#   - 'lateness': how far after its scheduled time the tick started
+#   - 'age': age of the observation given to the policy, measured from its fetch launch
+RUNNER_PHASES = ('fetch', 'wait', 'policy', 'dispatch', 'tick', 'lateness', 'age')
+
+# Commands a policy may return, see CommandQueue
+COMMANDS = ('move_xy', 'move_z', 'rotate', 'move_gripper', 'gripper_open', 'gripper_close',
+            'step_forward', 'step_backward', 'step_left', 'step_right')
+
+
+class _Fetch:
+    """
+    An observation fetch in flight
+    """
+    __slots__ = ('launched', 'future')
+
+    def __init__(self, launched, future):
+        self.launched = launched
+        self.future = future
+
+
+class ControlRunner:
+    """
+    Run a policy in a closed loop against a robot at a fixed rate
+
+    Ticks are scheduled on a fixed grid of `1 / rate_hz` periods, so the loop does not drift
+    the way sleep-based loops do. Observation fetches are launched ahead of their tick by
+    the measured round-trip latency (a high quantile of the recent fetches), so that a
+    fresh observation is usually waiting when the tick starts, and several fetches overlap
+    when the round trip is longer than a period. At each tick the policy gets the newest
+    observation that arrived; older ones are skipped, as are observations older than
+    `max_age`. The policy's commands go through a CommandQueue, so sending them never
+    blocks the loop and superseded targets are merged.
+
+    A tick that ends after the next one should have started is a deadline miss. Ticks the
+    loop fell a whole period behind on are skipped, and counted as misses, instead of being
+    run in a burst.
+
+    The policy is called as policy(observation) with an Observation holding the state and
+    the configured cameras (None for components that failed). It returns None, one command
+    as a (method, *args) tuple such as ('move_xy', 0.5, 0.5), or a list of them. Methods
+    are the ones in COMMANDS.
+
+    Args:
+        robot (GripperRobot): The robot, or a GripperRobotMock
+        policy (callable): policy(observation) -> command(s) or None
+        rate_hz (float): Control frequency
+        cameras (sequence of str): Cameras fetched for the policy, 'top' and/or 'base'
+        image_options (dict, optional): Options passed to getImageTop/getImageBase
+            (reduce, grayscale)
+        max_age (float, optional): Observations older than this many seconds at their tick
+            are skipped. Defaults to the current lead plus one period
+        max_wait (float, optional): Longest a tick waits for an observation before it is
+            skipped. Defaults to half a period
+        lead_quantile (float): Quantile of the recent fetch round trips used as the lead
+        lead_margin (float): Seconds added to the lead
+        max_in_flight (int): Maximum number of overlapping observation fetches
+        window (int): Number of recent round trips the lead is estimated from
+        buckets (tuple of float): Upper bounds of the timing histogram buckets in seconds
+    """
+
+    def __init__(self, robot, policy, rate_hz, cameras=('top',), image_options=None, max_age=None,
+                 max_wait=None, lead_quantile=0.9, lead_margin=0.002, max_in_flight=4, window=50,
+                 buckets=DEFAULT_BUCKETS):
+        for camera in cameras:
+            if camera not in ('top', 'base'):
+                raise ValueError(f"Unknown camera '{camera}', expected 'top' or 'base'")
+        if rate_hz <= 0:
+            raise ValueError("rate_hz must be positive")
+        self.robot = robot
+        self.policy = policy
+        self.period = 1.0 / rate_hz
+        self.cameras = tuple(cameras)
+        self.image_options = dict(image_options or {})
+        self.max_age = max_age
+        self.max_wait = self.period / 2 if max_wait is None else max_wait
+        self.lead_quantile = lead_quantile
+        self.lead_margin = lead_margin
+        self.max_in_flight = max_in_flight
+        self.lead = self.period
+
+        self.commands = CommandQueue(robot)
+        self._fetchers = ThreadPoolExecutor(max_workers=max_in_flight,
+                                            thread_name_prefix=f'cloudgripper-runner-{robot.name}')
+        # The state is fetched on the fetcher thread, the cameras on this pool
+        self._requests = ThreadPoolExecutor(max_workers=max_in_flight * len(self.cameras) or 1,
+                                            thread_name_prefix=f'cloudgripper-runner-{robot.name}-camera')
+        self._round_trips = LatencyTracker(window)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.buckets = tuple(sorted(buckets))
+        self.reset_stats()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def reset_stats(self):
+        """
+        Clear the counters and timing histograms
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._phases = {phase: Histogram(self.buckets) for phase in RUNNER_PHASES}
+            self._counters = dict.fromkeys(('ticks', 'policy_calls', 'deadline_misses', 'skipped_ticks',
+                                            'superseded', 'stale', 'missing', 'failed_fetches'), 0)
+            # Running sums of the measured periods, for the mean and standard deviation
+            self._periods = [0, 0.0, 0.0, 0.0]
+
+    def _observe(self, phase, duration):
+        with self._lock:
+            self._phases[phase].observe(duration)
+
+    def _count(self, counter, n=1):
+        with self._lock:
+            self._counters[counter] += n
+
+    def _fetch(self, launched):
+        """
+        Fetch the state and cameras concurrently; runs on a fetcher thread
+        """
+        observation = Observation(None, None, None, None, None, None)
+        futures = {camera: self._requests.submit(getattr(self.robot, COMPONENTS[camera][0]), **self.image_options)
+                   for camera in self.cameras}
+        observation.state, observation.timestamp_state = self.robot.get_state()
+        for camera, future in futures.items():
+            _, value_attr, time_attr = COMPONENTS[camera]
+            value, timestamp = future.result()
+            setattr(observation, value_attr, value)
+            setattr(observation, time_attr, timestamp)
+
+        round_trip = time.monotonic() - launched
+        self._observe('fetch', round_trip)
+        self._round_trips.record('fetch', round_trip)
+        estimate = self._round_trips.percentile('fetch', self.lead_quantile)
+        with self._lock:
+            self.lead = min(estimate + self.lead_margin, self.max_in_flight * self.period)
+        return observation
+
+    def _newest(self, fetches, used):
+        """
+        Take the newest completed fetch launched after the last used one, dropping the older ones
+
+        Returns:
+            fetch (_Fetch): The newest completed fetch, None if none has completed
+        """
+        newest = None
+        for fetch in list(fetches):
+            if fetch.launched <= used:
+                if fetch.future.done():
+                    fetches.remove(fetch)
+                    self._count('superseded')
+                continue
+            if fetch.future.done() and (newest is None or fetch.launched > newest.launched):
+                newest = fetch
+        if newest is None:
+            return None
+        for fetch in list(fetches):
+            if fetch.future.done() and fetch.launched < newest.launched:
+                fetches.remove(fetch)
+                self._count('superseded')
+        fetches.remove(newest)
+        return newest
+
+    def _dispatch(self, action):
+        if action is None:
+            return
+        if isinstance(action, tuple) and action and isinstance(action[0], str):
+            action = [action]
+        for method, *args in action:
+            if method not in COMMANDS:
+                raise ValueError(f"Unknown command '{method}', expected one of {list(COMMANDS)}")
+            getattr(self.commands, method)(*args)
+
+    def _tick(self, fetches, used, start):
+        """
+        Run one tick: pick an observation, call the policy and queue its commands
+
+        Returns:
+            used (float): Launch time of the observation given to the policy, or the
+                previous value if the tick was skipped
+        """
+        fetch = self._newest(fetches, used)
+        if fetch is None:
+            pending = [other.future for other in fetches if other.launched > used]
+            wait_until = start + self.max_wait
+            while fetch is None and pending:
+                remaining = wait_until - time.monotonic()
+                if remaining <= 0:
+                    break
+                wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                fetch = self._newest(fetches, used)
+                pending = [other.future for other in fetches if other.launched > used]
+            self._observe('wait', time.monotonic() - start)
+        if fetch is None:
+            self._count('missing')
+            return used
+
+        try:
+            observation = fetch.future.result()
+        except Exception as e:
+            print('Observation fetch failed:', e)
+            self._count('failed_fetches')
+            return fetch.launched
+        now = time.monotonic()
+        age = now - fetch.launched
+        max_age = self.lead + self.period if self.max_age is None else self.max_age
+        if age > max_age:
+            self._count('stale')
+            return fetch.launched
+        self._observe('age', age)
+
+        action = self.policy(observation)
+        policy_end = time.monotonic()
+        self._observe('policy', policy_end - now)
+        self._dispatch(action)
+        end = time.monotonic()
+        self._observe('dispatch', end - policy_end)
+        self._count('policy_calls')
+        return fetch.launched
+
+    def run(self, duration=None, ticks=None):
+        """
+        Run the control loop until stop() is called or a limit is reached
+
+        Args:
+            duration (float, optional): Maximum run time in seconds
+            ticks (int, optional): Maximum number of ticks, skipped ones included
+
+        Returns:
+            stats (dict): The runner statistics, see stats()
+        """
+        self._stop.clear()
+        fetches = []
+        used = -math.inf
+        origin = time.monotonic() + self.lead
+        end = origin + duration if duration is not None else math.inf
+        tick = 0
+        next_fetch = 0
+        previous_start = None
+
+        while not self._stop.is_set() and (ticks is None or tick < ticks):
+            now = time.monotonic()
+            scheduled = origin + tick * self.period
+            if scheduled >= end:
+                break
+
+            # Launch the fetches due by now, each `lead` ahead of the tick it is meant for
+            next_fetch = max(next_fetch, tick)
+            while (len(fetches) < self.max_in_flight and next_fetch <= tick + self.max_in_flight
+                   and origin + next_fetch * self.period - self.lead <= now):
+                # Each launch gets its own time, so fetches launched together still order strictly
+                launched = time.monotonic()
+                fetches.append(_Fetch(launched, self._fetchers.submit(self._fetch, launched)))
+                next_fetch += 1
+            if now < scheduled:
+                wake = scheduled
+                if len(fetches) < self.max_in_flight:
+                    wake = min(wake, origin + next_fetch * self.period - self.lead)
+                time.sleep(max(0.0, wake - now))
+                continue
+
+            lateness = now - scheduled
+            if lateness >= self.period:
+                # Too far behind: skip to the latest tick boundary instead of bursting to catch up
+                skipped = int(lateness // self.period)
+                self._count('skipped_ticks', skipped)
+                self._count('deadline_misses', skipped)
+                tick += skipped
+                scheduled += skipped * self.period
+                lateness = now - scheduled
+            self._observe('lateness', lateness)
+            if previous_start is not None:
+                interval = now - previous_start
+                with self._lock:
+                    self._periods[0] += 1
+                    self._periods[1] += interval
+                    self._periods[2] += interval * interval
+                    self._periods[3] = max(self._periods[3], abs(interval - self.period))
+            previous_start = now
+
+            used = self._tick(fetches, used, now)
+            finished = time.monotonic()
+            self._observe('tick', finished - now)
+            self._count('ticks')
+            if finished > scheduled + self.period:
+                self._count('deadline_misses')
+            tick += 1
+        return self.stats()
+
+    def stop(self):
+        """
+        Stop a running loop after its current tick. Can be called from any thread or the policy
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self._stop.set()
+
+    def stats(self):
+        """
+        Get the loop statistics
+
+        Args:
+            None
+
+        Returns:
+            stats (dict):
+                - 'ticks': Ticks run
+                - 'policy_calls': Ticks the policy was called on
+                - 'deadline_misses': Ticks that ended after the next tick's start, plus skipped ticks
+                - 'skipped_ticks': Ticks skipped because the loop fell a period behind
+                - 'superseded': Observations dropped because a newer one had arrived
+                - 'stale': Ticks skipped because the observation was older than max_age
+                - 'missing': Ticks skipped because no observation arrived within max_wait
+                - 'failed_fetches': Observation fetches that raised an error
+                - 'lead': Current fetch lead in seconds
+                - 'period': 'target', 'mean', 'std' (the period jitter) and 'max_error', the
+                  largest deviation of a tick interval from the target, in seconds
+                - 'phases': For each of RUNNER_PHASES, 'count', 'sum', 'mean', 'p50', 'p95'
+                  and 'p99' in seconds (quantiles are bucket upper bounds)
+                - 'commands': The command queue counters, see CommandQueue.stats
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['lead'] = self.lead
+            count, total, squares, max_error = self._periods
+            mean = total / count if count else None
+            std = math.sqrt(max(0.0, squares / count - mean * mean)) if count else None
+            stats['period'] = {'target': self.period, 'mean': mean, 'std': std, 'max_error': max_error}
+            stats['phases'] = {phase: histogram.summary() for phase, histogram in self._phases.items()
+                               if histogram.count}
+        stats['commands'] = self.commands.stats()
+        return stats
+
+    def close(self):
+        """
+        Send the queued commands and stop the worker threads. The robot itself is left open
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self._stop.set()
+        self._fetchers.shutdown(wait=True)
+        self._requests.shutdown(wait=True)
+        self.commands.close()
@@ -0,0 +1,242 @@
+import heapq
+import itertools
+import threading
+import time
+from requests import exceptions
+
+# Request priorities, lower is served first: motion commands, then states, then images
+PRIORITY_COMMAND = 0
+PRIORITY_STATE = 1
+PRIORITY_IMAGE = 2
+
+_PRIORITIES = {'/getState': PRIORITY_STATE, '/getImageTop': PRIORITY_IMAGE, '/getImageBase': PRIORITY_IMAGE}
+
+
+def request_priority(label):
+    """
+    Get the scheduling priority of an endpoint
+
+    Args:
+        label (str): Endpoint label, e.g. '/getImageTop' or '/gcode'
+
+    Returns:
+        priority (int): PRIORITY_STATE, PRIORITY_IMAGE, or PRIORITY_COMMAND for everything else
+    """
+    return _PRIORITIES.get(label, PRIORITY_COMMAND)
+
+
+class _Limit:
+    """
+    An AIMD concurrency limit and the requests currently admitted under it
+    """
+    __slots__ = ('value', 'minimum', 'maximum', 'in_flight', 'last_decrease')
+
+    def __init__(self, initial, minimum, maximum):
+        self.value = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.last_decrease = 0.0
+
+    @property
+    def capacity(self):
+        return max(1, int(self.value))
+
+    def feedback(self, congested, started, increase, decrease):
+        """
+        Grow the limit additively on a healthy response, shrink it multiplicatively on congestion
+
+        Only requests sent after the last decrease can shrink the limit again, so one burst
+        of slow responses counts as a single congestion event.
+
+        Returns:
+            decreased (bool): True if the limit was decreased
+        """
+        if not congested:
+            self.value = min(self.maximum, self.value + increase / self.value)
+            return False
+        if started <= self.last_decrease:
+            return False
+        self.value = max(self.minimum, self.value * decrease)
+        self.last_decrease = time.monotonic()
+        return True
+
+
+class _Waiter:
+    __slots__ = ('priority', 'sequence', 'robot', 'granted', 'event')
+
+    def __init__(self, priority, sequence, robot):
+        self.priority = priority
+        self.sequence = sequence
+        self.robot = robot
+        self.granted = False
+        self.event = threading.Event()
+
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class RequestScheduler:
+    """
+    Adaptive admission control for requests to one API gateway
+
+    Limits the requests in flight per robot and in total, and adapts both limits with
+    AIMD: every healthy response raises a limit by about `increase` per round of requests,
+    and an error or a response slower than `latency_tolerance` times the fastest recent
+    latency of its endpoint cuts it by the factor `decrease`. Waiting requests are admitted
+    by priority: motion commands first, then get_state, then images. Motion commands may
+    also use `command_reserve` slots above the total limit and `robot_command_reserve`
+    slots above their robot's limit, so neither bulk image fetches across the fleet nor a
+    robot's own image polling delays them for long.
+
+    Share one scheduler between all robots behind the same gateway.
+
+    Args:
+        initial (int): Initial limit of requests in flight in total
+        min_limit (int): Lower bound of the total limit
+        max_limit (int): Upper bound of the total limit
+        per_robot (int): Initial limit of requests in flight per robot
+        max_per_robot (int): Upper bound of the per-robot limits
+        increase (float): Additive increase of a limit per round of healthy responses
+        decrease (float): Multiplicative decrease of a limit on congestion
+        latency_tolerance (float): Responses slower than this many times the endpoint's
+            baseline latency count as congestion
+        latency_slack (float): Seconds added to the congestion threshold, so that very fast
+            endpoints do not react to small jitter
+        command_reserve (int): Extra slots above the total limit usable by motion commands
+        robot_command_reserve (int): Extra slots above each robot's limit usable by its
+            motion commands
+        queue_timeout (float, optional): Maximum seconds a request waits for admission
+            before failing with requests.exceptions.Timeout
+    """
+
+    def __init__(self, initial=8, min_limit=1, max_limit=256, per_robot=2, max_per_robot=16,
+                 increase=1.0, decrease=0.7, latency_tolerance=2.0, latency_slack=0.005,
+                 command_reserve=2, robot_command_reserve=1, queue_timeout=None):
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.latency_slack = latency_slack
+        self.command_reserve = command_reserve
+        self.robot_command_reserve = robot_command_reserve
+        self.queue_timeout = queue_timeout
+        self.per_robot = per_robot
+        self.max_per_robot = max_per_robot
+        self.congestion_events = 0
+        self._total = _Limit(initial, min_limit, max_limit)
+        self._robots = {}
+        self._baselines = {}
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def _robot_limit(self, robot):
+        limit = self._robots.get(robot)
+        if limit is None:
+            limit = self._robots[robot] = _Limit(self.per_robot, 1, self.max_per_robot)
+        return limit
+
+    def _admissible(self, waiter):
+        robot = self._robot_limit(waiter.robot)
+        total, per_robot = self._total.capacity, robot.capacity
+        if waiter.priority == PRIORITY_COMMAND:
+            total += self.command_reserve
+            per_robot += self.robot_command_reserve
+        return self._total.in_flight < total and robot.in_flight < per_robot
+
+    def _dispatch(self):
+        """
+        Admit waiting requests in priority order while the limits allow
+        """
+        admitted = False
+        for waiter in sorted(self._waiters):
+            if self._total.in_flight >= self._total.capacity + self.command_reserve:
+                break
+            if self._admissible(waiter):
+                waiter.granted = True
+                self._total.in_flight += 1
+                self._robot_limit(waiter.robot).in_flight += 1
+                waiter.event.set()
+                admitted = True
+        if admitted:
+            self._waiters = [waiter for waiter in self._waiters if not waiter.granted]
+            heapq.heapify(self._waiters)
+
+    def acquire(self, robot, priority=PRIORITY_COMMAND):
+        """
+        Wait until a request of a robot may be sent
+
+        Args:
+            robot (str): Name of the robot
+            priority (int): Priority of the request, see request_priority
+
+        Returns:
+            started (float): monotonic() time of admission, to pass to release()
+        """
+        with self._lock:
+            waiter = _Waiter(priority, next(self._sequence), robot)
+            heapq.heappush(self._waiters, waiter)
+            self._dispatch()
+        if not waiter.event.wait(self.queue_timeout):
+            with self._lock:
+                if not waiter.granted:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+                    raise exceptions.Timeout(f'Request of {robot} not admitted within {self.queue_timeout} s')
+        return time.monotonic()
+
+    def release(self, robot, label, started, error=None):
+        """
+        Report the outcome of an admitted request and admit waiting ones
+
+        Args:
+            robot (str): Name of the robot
+            label (str): Endpoint label of the request
+            started (float): The value returned by acquire()
+            error (Exception, optional): The error the request failed with
+
+        Returns:
+            None
+        """
+        latency = time.monotonic() - started
+        with self._lock:
+            self._total.in_flight -= 1
+            robot_limit = self._robot_limit(robot)
+            robot_limit.in_flight -= 1
+
+            congested = error is not None
+            if error is None:
+                baseline = self._baselines.get(label)
+                # Let the baseline drift up slowly so that it follows lasting changes
+                baseline = latency if baseline is None else min(baseline * 1.01, latency)
+                self._baselines[label] = baseline
+                congested = latency > baseline * self.latency_tolerance + self.latency_slack
+            if self._total.feedback(congested, started, self.increase, self.decrease):
+                self.congestion_events += 1
+            robot_limit.feedback(congested, started, self.increase, self.decrease)
+            self._dispatch()
+
+    def stats(self):
+        """
+        Get the current limits and queue lengths
+
+        Args:
+            None
+
+        Returns:
+            stats (dict):
+                - 'limit': Current limit of requests in flight in total
+                - 'in_flight': Requests in flight in total
+                - 'waiting': Requests waiting for admission
+                - 'congestion_events': Number of times the total limit was decreased
+                - 'robots': For each robot, its 'limit' and 'in_flight'
+        """
+        with self._lock:
+            return {
+                'limit': self._total.value,
+                'in_flight': self._total.in_flight,
+                'waiting': len(self._waiters),
+                'congestion_events': self.congestion_events,
+                'robots': {name: {'limit': limit.value, 'in_flight': limit.in_flight}
+                           for name, limit in self._robots.items()},
+            }
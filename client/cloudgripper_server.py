@@ -0,0 +1,284 @@
+import argparse
+import base64
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from client.cloudgripper_control import STEP_SIZE
+from client.cloudgripper_observation import STATE_FIELDS
+
+_ROUTE = re.compile(r'^/(?P<robot>robot\d+)/api/v1\.1/robot/(?P<command>[A-Za-z_]+)(?P<args>(?:/[^/]+)*)$')
+
+
+def synthetic_frames(width, height, count=8, quality=80, seed=0):
+    """
+    Render JPEG frames with the texture and size of real camera images
+
+    Args:
+        width (int): Frame width in pixels
+        height (int): Frame height in pixels
+        count (int): Number of distinct frames
+        quality (int): JPEG quality
+        seed (int): Seed of the random texture
+
+    Returns:
+        frames (list of str): Base64 encoded JPEG frames, as served by the API
+    """
+    rng = np.random.default_rng(seed)
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+    background = np.stack([90 + 40 * xs / width, 110 + 30 * ys / height, 80 + 20 * (xs + ys) / (width + height)], axis=-1)
+    frames = []
+    for i in range(count):
+        image = background + rng.normal(0, 6, size=background.shape)
+        for _ in range(6):
+            x0, y0 = int(rng.integers(0, width - width // 8)), int(rng.integers(0, height - height // 8))
+            w, h = int(rng.integers(width // 20, width // 8)), int(rng.integers(height // 20, height // 8))
+            image[y0:y0 + h, x0:x0 + w] = rng.integers(0, 255, size=3)
+        # Gripper marker moving across the frames
+        cx, cy = int(width * (0.2 + 0.6 * i / max(1, count - 1))), height // 2
+        cv2.circle(image, (cx, cy), max(4, width // 40), (40, 40, 200), -1)
+        image = np.clip(image, 0, 255).astype(np.uint8)
+        jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1]
+        frames.append(base64.b64encode(jpeg.tobytes()).decode('ascii'))
+    return frames
+
+
+class StandInServer:
+    """
+    A local stand-in for the CloudGripper API
+
+    Serves the /robotN/api/v1.1/robot routes that GripperRobot calls, with per-robot
+    state, realistic base64 JPEG frames and configurable latency, jitter and failures.
+    Point a robot at it with GripperRobot(name, token, base_url=server.url).
+
+    Args:
+        host (str): Address to listen on
+        port (int): Port to listen on, 0 picks a free port
+        latency (float): Mean added response latency in seconds
+        jitter (float): Standard deviation of the added latency in seconds
+        failure_rate (float): Probability of answering with HTTP 503 and a non-JSON body
+        drop_rate (float): Probability of closing the connection without answering
+        image_latency (float): Extra latency of the image endpoints in seconds
+        frames (int): Number of distinct frames served per camera
+        quality (int): JPEG quality of the frames
+        token (str, optional): Required apiKey header. None accepts any key
+        seed (int): Seed of the latency, failure and frame generators
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, failure_rate=0.0, drop_rate=0.0,
+                 image_latency=0.0, frames=8, quality=80, token=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.image_latency = image_latency
+        self.token = token
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._states = {}
+        self._frames = {
+            'getImageTop': synthetic_frames(1280, 720, frames, quality, seed),
+            'getImageBase': synthetic_frames(640, 480, frames, quality, seed + 1),
+        }
+        self._frame_index = 0
+
+        server = self
+
+        class Handler(_Handler):
+            stand_in = server
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL to pass as GripperRobot(base_url=...)"""
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """
+        Serve requests on a background thread
+
+        Args:
+            None
+
+        Returns:
+            server (StandInServer): The server itself
+        """
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True,
+                                        name='cloudgripper-stand-in')
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """
+        Serve requests on the calling thread until interrupted
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self._httpd.serve_forever()
+
+    def stop(self):
+        """
+        Stop serving and close the listening socket
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _draw(self):
+        """
+        Draw the added latency and the failure mode of a request
+        """
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self._random.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+            roll = self._random.random()
+        if roll < self.drop_rate:
+            return delay, 'drop'
+        if roll < self.drop_rate + self.failure_rate:
+            return delay, 'fail'
+        return delay, None
+
+    def handle(self, robot, command, args):
+        """
+        Apply a command to a robot's state and build the JSON response
+
+        Args:
+            robot (str): The name of the robot
+            command (str): The endpoint name, e.g. 'gcode'
+            args (list of str): The path arguments of the command
+
+        Returns:
+            response (dict): The response body, None for an unknown command
+        """
+        now = time.time()
+        with self._lock:
+            state = self._states.get(robot)
+            if state is None:
+                state = self._states[robot] = dict.fromkeys(STATE_FIELDS, 0.0)
+                state.update(x_norm=0.5, y_norm=0.5, z_norm=0.5, claw_norm=1.0)
+            if command == 'getState':
+                return {'state': dict(state), 'timestamp': now}
+            if command in self._frames:
+                frames = self._frames[command]
+                self._frame_index += 1
+                return {'data': frames[self._frame_index % len(frames)], 'time': now}
+
+            steps = {'moveUp': ('y_norm', STEP_SIZE), 'moveDown': ('y_norm', -STEP_SIZE),
+                     'moveLeft': ('x_norm', -STEP_SIZE), 'moveRight': ('x_norm', STEP_SIZE)}
+            try:
+                if command in steps:
+                    field, delta = steps[command]
+                    state[field] = min(1.0, max(0.0, state[field] + delta))
+                elif command == 'gcode':
+                    state['x_norm'], state['y_norm'] = float(args[0]), float(args[1])
+                elif command == 'up_down':
+                    state['z_norm'] = float(args[0])
+                elif command == 'rotate':
+                    state['rotation'] = float(args[0])
+                elif command == 'grip':
+                    state['claw_norm'] = float(args[0])
+                elif command != 'calibrate':
+                    return None
+            except (IndexError, ValueError):
+                return None
+            return {'time': now}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    stand_in = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.stand_in
+        route = _ROUTE.match(self.path)
+        if route is None:
+            self._send(404, b'Not Found', 'text/plain')
+            return
+        if server.token is not None and self.headers.get('apiKey') != server.token:
+            self._send(401, b'Unauthorized', 'text/plain')
+            return
+
+        delay, failure = server._draw()
+        command = route.group('command')
+        if command in ('getImageTop', 'getImageBase'):
+            delay += server.image_latency
+        if delay:
+            time.sleep(delay)
+        if failure == 'drop':
+            self.close_connection = True
+            return
+        if failure == 'fail':
+            self._send(503, b'Service Unavailable', 'text/plain')
+            return
+
+        args = [arg for arg in route.group('args').split('/') if arg]
+        response = server.handle(route.group('robot'), command, args)
+        if response is None:
+            self._send(404, b'Not Found', 'text/plain')
+            return
+        self._send(200, json.dumps(response).encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in CloudGripper API server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='mean added latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='standard deviation of the latency in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='probability of an HTTP 503')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='probability of a dropped connection')
+    parser.add_argument('--image-latency', type=float, default=0.0, help='extra latency of image endpoints')
+    parser.add_argument('--token', default=None, help='required apiKey header')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = StandInServer(args.host, args.port, args.latency, args.jitter, args.failure_rate, args.drop_rate,
+                           args.image_latency, token=args.token, seed=args.seed)
+    print(f'Serving the CloudGripper API on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
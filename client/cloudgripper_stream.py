@@ -0,0 +1,294 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+CAMERAS = {'top': 'getImageTop', 'base': 'getImageBase'}
+POLICIES = ('drop_oldest', 'drop_newest')
+
+
+class _CameraWorker:
+    """
+    Background fetch loop and ring buffer of a single camera
+    """
+
+    def __init__(self, stream, camera):
+        self.stream = stream
+        self.camera = camera
+        self.fetch = getattr(stream.robot, CAMERAS[camera])
+        self.buffer = deque()
+        self.latest = None
+        self.condition = threading.Condition()
+        self.thread = None
+
+        self.frames = 0
+        self.dropped = 0
+        self.errors = 0
+        self.arrivals = deque(maxlen=stream.stats_window)
+        self.fetch_times = deque(maxlen=stream.stats_window)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name=f'cloudgripper-stream-{self.camera}')
+        self.thread.start()
+
+    def run(self):
+        stream = self.stream
+        while not stream._stopped.is_set():
+            started = time.perf_counter()
+            try:
+                # Decode through the robot, so its frame cache, decode pool and metrics apply
+                if stream.decode:
+                    image, timestamp = self.fetch(reduce=stream.reduce, grayscale=stream.grayscale)
+                else:
+                    image, timestamp = self.fetch(raw=True)
+            except Exception as e:
+                # Keep polling: a bad frame or a failing robot must not end the stream
+                print('Stream error:', e)
+                image = None
+            if image is None:
+                with self.condition:
+                    self.errors += 1
+                stream._stopped.wait(stream.retry_delay)
+                continue
+            fetched = time.perf_counter()
+
+            with self.condition:
+                self.frames += 1
+                self.arrivals.append(fetched)
+                self.fetch_times.append(fetched - started)
+                frame = (image, timestamp)
+                # latest() always sees the newest frame, the policy only decides what is buffered
+                self.latest = frame
+                if len(self.buffer) < stream.buffer_size:
+                    self.buffer.append(frame)
+                elif stream.policy == 'drop_oldest':
+                    self.buffer.popleft()
+                    self.buffer.append(frame)
+                    self.dropped += 1
+                else:
+                    self.dropped += 1
+                self.condition.notify_all()
+
+            if stream.max_fps:
+                remaining = 1.0 / stream.max_fps - (time.perf_counter() - started)
+                if remaining > 0:
+                    stream._stopped.wait(remaining)
+
+    def pop(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while not self.buffer:
+                if self.stream._stopped.is_set():
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+            return self.buffer.popleft()
+
+    def stats(self):
+        with self.condition:
+            arrivals = list(self.arrivals)
+            fetch_times = list(self.fetch_times)
+            stats = {'frames': self.frames, 'dropped': self.dropped, 'errors': self.errors,
+                     'buffered': len(self.buffer)}
+        if len(arrivals) > 1 and arrivals[-1] > arrivals[0]:
+            stats['fps'] = (len(arrivals) - 1) / (arrivals[-1] - arrivals[0])
+        else:
+            stats['fps'] = 0.0
+        stats['fetch_time_mean'] = sum(fetch_times) / len(fetch_times) if fetch_times else None
+        stats['fetch_time_max'] = max(fetch_times) if fetch_times else None
+        return stats
+
+
+class CameraStream:
+    """
+    Fetch camera frames continuously on background threads
+
+    Each camera gets its own worker that fetches and decodes frames into a bounded ring
+    buffer, so control code can read the most recent frame without waiting on the
+    network. Frames are (image, timestamp) tuples as returned by getImageTop/getImageBase,
+    which also decode them, so the robot's frame cache, decode pool and metrics apply.
+
+    Works with any robot exposing the GripperRobot image API (GripperRobot, GripperRobotMock).
+
+    Args:
+        robot (GripperRobot): The robot to stream from
+        camera (str): 'top', 'base' or 'both'
+        buffer_size (int): Number of frames kept per camera
+        policy (str): What to do when the buffer is full: 'drop_oldest' keeps the newest
+            frames, 'drop_newest' keeps the buffered frames and discards new ones
+        decode (bool): Decode frames to numpy arrays. If False, frames hold the JPEG bytes
+        reduce (int): Downscale factor applied while decoding (1, 2, 4 or 8)
+        grayscale (bool): Decode to single-channel grayscale images
+        max_fps (float, optional): Upper bound on the fetch rate of each camera
+        retry_delay (float): Seconds to wait after a failed fetch
+        stats_window (int): Number of recent frames the statistics are computed over
+    """
+
+    def __init__(self, robot, camera='top', buffer_size=4, policy='drop_oldest', decode=True,
+                 reduce=1, grayscale=False, max_fps=None, retry_delay=0.1, stats_window=100):
+        if camera == 'both':
+            cameras = ['top', 'base']
+        elif camera in CAMERAS:
+            cameras = [camera]
+        else:
+            raise ValueError(f"Unknown camera '{camera}', expected 'top', 'base' or 'both'")
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy '{policy}', expected one of {POLICIES}")
+        if buffer_size < 1:
+            raise ValueError("buffer_size must be at least 1")
+
+        self.robot = robot
+        self.camera = camera
+        self.buffer_size = buffer_size
+        self.policy = policy
+        self.decode = decode
+        self.reduce = reduce
+        self.grayscale = grayscale
+        self.max_fps = max_fps
+        self.retry_delay = retry_delay
+        self.stats_window = stats_window
+        self._stopped = threading.Event()
+        self._workers = {name: _CameraWorker(self, name) for name in cameras}
+        self._started = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """
+        Start the background workers
+
+        Args:
+            None
+
+        Returns:
+            stream (CameraStream): The stream itself
+        """
+        if not self._started:
+            self._started = True
+            for worker in self._workers.values():
+                worker.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stop the background workers and wake up blocked readers
+
+        Args:
+            timeout (float, optional): Seconds to wait for each worker to finish its current fetch
+
+        Returns:
+            None
+        """
+        self._stopped.set()
+        for worker in self._workers.values():
+            with worker.condition:
+                worker.condition.notify_all()
+            if worker.thread is not None:
+                worker.thread.join(timeout)
+
+    @property
+    def running(self):
+        """True while the workers are fetching frames"""
+        return self._started and not self._stopped.is_set()
+
+    def latest(self, camera=None):
+        """
+        Get the most recent frame without waiting or consuming it
+
+        Args:
+            camera (str, optional): 'top' or 'base'. Required only to pick one camera of a 'both' stream
+
+        Returns:
+            frame (tuple): (image, timestamp) of the newest frame, or None if no frame has
+                arrived yet. For a 'both' stream without `camera`, a dict of frames by camera
+        """
+        if camera is None and len(self._workers) > 1:
+            return {name: worker.latest for name, worker in self._workers.items()}
+        return self._worker(camera).latest
+
+    def next(self, camera=None, timeout=None):
+        """
+        Take the oldest buffered frame, waiting for one to arrive if the buffer is empty
+
+        Args:
+            camera (str, optional): 'top' or 'base'. Required only to pick one camera of a 'both' stream
+            timeout (float, optional): Maximum number of seconds to wait
+
+        Returns:
+            frame (tuple): (image, timestamp), or None if the timeout expired or the stream
+                was stopped. For a 'both' stream without `camera`, a dict with one frame per camera
+        """
+        if camera is None and len(self._workers) > 1:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            frames = {}
+            for name, worker in self._workers.items():
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                frame = worker.pop(remaining)
+                if frame is None:
+                    return None
+                frames[name] = frame
+            return frames
+        return self._worker(camera).pop(timeout)
+
+    def frames(self, camera=None, timeout=None):
+        """
+        Iterate over frames as they arrive until the stream is stopped
+
+        Args:
+            camera (str, optional): 'top' or 'base'. Required only to pick one camera of a 'both' stream
+            timeout (float, optional): Stop iterating if no frame arrives within this many seconds
+
+        Yields:
+            frame (tuple): (image, timestamp), or a dict of frames for a 'both' stream
+        """
+        while True:
+            frame = self.next(camera, timeout)
+            if frame is None:
+                return
+            yield frame
+
+    def __iter__(self):
+        return self.frames()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        frame = await asyncio.get_running_loop().run_in_executor(None, self.next)
+        if frame is None:
+            raise StopAsyncIteration
+        return frame
+
+    def stats(self):
+        """
+        Get per-camera stream statistics
+
+        Args:
+            None
+
+        Returns:
+            stats (dict): For each camera:
+                - 'frames': Number of frames fetched
+                - 'dropped': Number of frames discarded because the buffer was full
+                - 'errors': Number of failed fetches and decodes
+                - 'buffered': Number of frames currently in the buffer
+                - 'fps': Recent fetch rate in frames per second
+                - 'fetch_time_mean', 'fetch_time_max': Recent time per frame in seconds, request
+                  and decode. The robot's ClientMetrics, if any, time the decode phase separately
+        """
+        return {name: worker.stats() for name, worker in self._workers.items()}
+
+    def _worker(self, camera):
+        if camera is None:
+            camera = next(iter(self._workers))
+        try:
+            return self._workers[camera]
+        except KeyError:
+            raise ValueError(f"Camera '{camera}' is not part of this stream")
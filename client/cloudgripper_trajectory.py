@@ -0,0 +1,137 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Trajectory axes -> (robot method, attributes the robot stores its last commanded target in)
+AXES = {
+    'xy': ('move_xy', ('robotPositionX', 'robotPositionY')),
+    'z': ('move_z', ('zaxisAngle',)),
+    'rotation': ('rotate', ('rotationAngle',)),
+    'gripper': ('move_gripper', ('gripperAngle',)),
+}
+
+WAYPOINT_FIELDS = ('x', 'y', 'z', 'rotation', 'gripper')
+
+
+def _as_waypoint(waypoint):
+    """
+    Normalize a waypoint to a dict of the WAYPOINT_FIELDS, None for axes to leave alone
+    """
+    if isinstance(waypoint, dict):
+        unknown = set(waypoint) - set(WAYPOINT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown waypoint fields {sorted(unknown)}")
+        return {field: waypoint.get(field) for field in WAYPOINT_FIELDS}
+    if len(waypoint) > len(WAYPOINT_FIELDS):
+        raise ValueError(f"Waypoint has {len(waypoint)} values, expected at most {len(WAYPOINT_FIELDS)}")
+    values = list(waypoint) + [None] * (len(WAYPOINT_FIELDS) - len(waypoint))
+    return dict(zip(WAYPOINT_FIELDS, values))
+
+
+def _targets(waypoint):
+    """
+    Split a waypoint into per-axis command arguments
+    """
+    targets = {}
+    if waypoint['x'] is not None or waypoint['y'] is not None:
+        if waypoint['x'] is None or waypoint['y'] is None:
+            raise ValueError("A waypoint must set both x and y, or neither")
+        targets['xy'] = (waypoint['x'], waypoint['y'])
+    for axis in ('z', 'rotation', 'gripper'):
+        if waypoint[axis] is not None:
+            targets[axis] = (waypoint[axis],)
+    return targets
+
+
+def _changed(previous, target, tolerance):
+    if previous is None or None in previous:
+        return True
+    return any(abs(a - b) > tolerance for a, b in zip(previous, target))
+
+
+def execute_trajectory(robot, waypoints, rate_hz=None, max_in_flight=4, skip_unchanged=True, tolerance=1e-6):
+    """
+    Send a sequence of waypoints to a robot, pipelining the commands
+
+    Each axis (xy, z, rotation, gripper) has its own lane: commands on one axis are sent in
+    order, while different axes and consecutive waypoints are in flight at the same time
+    over the connection pool. Waypoints are released at `rate_hz`, and at most
+    `max_in_flight` waypoints may be waiting for responses at once.
+
+    Args:
+        robot (GripperRobot): The robot to move
+        waypoints (iterable): Waypoints as (x, y, z, rotation, gripper) tuples or dicts with
+            those keys. Trailing values may be left out and None leaves an axis unchanged
+        rate_hz (float, optional): Rate at which waypoints are released. None sends them as
+            fast as the pipeline allows
+        max_in_flight (int): Maximum number of waypoints with outstanding commands
+        skip_unchanged (bool): Skip commands whose target equals the last target the robot
+            acknowledged. After a failed command the axis is sent again
+        tolerance (float): Targets closer than this to the last acknowledged target are unchanged
+
+    Returns:
+        report (list of dict): Timing of each waypoint:
+            - 'index': Position of the waypoint in the trajectory
+            - 'axes': Axes a command was sent for
+            - 'scheduled': Release time relative to the start of the trajectory in seconds
+            - 'sent': Time the waypoint was released relative to the start in seconds
+            - 'completed': Time the last response arrived relative to the start in seconds
+            - 'latency': 'completed' - 'sent' in seconds
+            - 'timestamps': Command timestamp returned for each axis (None if it failed)
+            - 'ok': True if every command succeeded
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
+    period = 1.0 / rate_hz if rate_hz else 0.0
+    last = {axis: tuple(getattr(robot, attr, None) for attr in attrs)
+            for axis, (_, attrs) in AXES.items()}
+    lanes = {axis: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'cloudgripper-{axis}')
+             for axis in AXES}
+    start = time.perf_counter()
+
+    def send(axis, target):
+        # Runs on the axis' lane, after the previous command of the axis has finished
+        if skip_unchanged and not _changed(last[axis], target, tolerance):
+            return None
+        timestamp = getattr(robot, AXES[axis][0])(*target)
+        if timestamp is not None:
+            # A failed command leaves the axis unconfirmed, so the next waypoint resends it
+            last[axis] = target
+        return timestamp, time.perf_counter() - start
+
+    reports, pending = [], []
+    try:
+        for index, waypoint in enumerate(waypoints):
+            targets = _targets(_as_waypoint(waypoint))
+            scheduled = index * period
+            delay = scheduled - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+            while len(pending) >= max_in_flight:
+                _complete(*pending.pop(0))
+
+            report = {'index': index, 'axes': [], 'scheduled': scheduled,
+                      'sent': time.perf_counter() - start, 'timestamps': {}}
+            futures = {axis: lanes[axis].submit(send, axis, target) for axis, target in targets.items()}
+            reports.append(report)
+            pending.append((report, futures))
+        for report, futures in pending:
+            _complete(report, futures)
+    finally:
+        for lane in lanes.values():
+            lane.shutdown(wait=True)
+    return reports
+
+
+def _complete(report, futures):
+    completed = report['sent']
+    for axis, future in futures.items():
+        result = future.result()
+        if result is None:
+            continue
+        timestamp, finished = result
+        report['axes'].append(axis)
+        report['timestamps'][axis] = timestamp
+        completed = max(completed, finished)
+    report['completed'] = completed
+    report['latency'] = completed - report['sent']
+    report['ok'] = all(timestamp is not None for timestamp in report['timestamps'].values())
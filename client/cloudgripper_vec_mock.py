@@ -0,0 +1,236 @@
+import time
+import numpy as np
+
+from client.cloudgripper_client_mock import DEFAULT_SPEEDS, TOP_SHAPE, BASE_SHAPE, _draw_box, _draw_disc
+from client.cloudgripper_observation import STATE_FIELDS
+
+# Columns of the position and target arrays
+AXES = ('x', 'y', 'z', 'rotation', 'claw')
+_X, _Y, _Z, _ROTATION, _CLAW = range(len(AXES))
+
+
+class VectorizedGripperMock:
+    """
+    Many mock robots simulated together in NumPy arrays
+
+    Holds the positions and targets of all robots in (num_robots, 5) arrays and applies a
+    batch of actions to every robot in one call. The kinematics, state fields, currents
+    and camera geometry follow GripperRobotMock, but time is simulated: advance(dt)
+    moves every axis towards its target for `dt` seconds.
+
+    Every call fails independently per robot with probability `failure_rate`, like the
+    calls of GripperRobotMock: a failed command is not applied, and a failed state or
+    image read is reported through the returned `ok` mask (with NaN rows and timestamps).
+
+    Returned arrays are preallocated buffers reused by the next call of the same kind;
+    copy them to keep them.
+
+    Args:
+        num_robots (int): Number of simulated robots
+        speeds (dict, optional): Axis speeds overriding DEFAULT_SPEEDS
+        failure_rate (float): Probability of each robot's call failing
+        seed (int, optional): Seed of the failure draws
+    """
+
+    def __init__(self, num_robots, speeds=None, failure_rate=0.01, seed=None):
+        speeds = dict(DEFAULT_SPEEDS, **(speeds or {}))
+        self.num_robots = num_robots
+        self.failure_rate = failure_rate
+        self.speeds = np.array([speeds[axis] for axis in AXES], dtype=np.float64)
+        self.time = time.time()
+        self._rng = np.random.default_rng(seed)
+
+        self.positions = np.empty((num_robots, len(AXES)), dtype=np.float64)
+        self.positions[:] = (0.5, 0.5, 1.0, 0.0, 1.0)
+        self.targets = self.positions.copy()
+        self._moving = np.zeros((num_robots, len(AXES)), dtype=bool)
+        self._states = np.empty((num_robots, len(STATE_FIELDS)), dtype=np.float64)
+        self._timestamps = np.empty(num_robots, dtype=np.float64)
+        self._images = {}
+
+    def reset(self, positions=None):
+        """
+        Put every robot at rest
+
+        Args:
+            positions (numpy.ndarray, optional): (num_robots, 5) positions in AXES order.
+                Defaults to the home position
+
+        Returns:
+            None
+        """
+        if positions is None:
+            self.positions[:] = (0.5, 0.5, 1.0, 0.0, 1.0)
+        else:
+            self.positions[:] = positions
+        self.targets[:] = self.positions
+        self._moving[:] = False
+
+    def _succeeded(self, mask=None):
+        ok = self._rng.random(self.num_robots) > self.failure_rate
+        if mask is not None:
+            ok &= mask
+        return ok
+
+    def apply(self, xy=None, z=None, rotation=None, gripper=None, mask=None):
+        """
+        Send a batch of commands, one per robot and axis
+
+        NaN entries leave the axis of that robot unchanged.
+
+        Args:
+            xy (numpy.ndarray, optional): (num_robots, 2) normalized x, y targets
+            z (numpy.ndarray, optional): (num_robots,) normalized z targets
+            rotation (numpy.ndarray, optional): (num_robots,) rotation targets in degrees
+            gripper (numpy.ndarray, optional): (num_robots,) gripper targets (0 closed, 1 open)
+            mask (numpy.ndarray, optional): (num_robots,) bool, robots to command. Defaults to all
+
+        Returns:
+            ok (numpy.ndarray): (num_robots,) bool, robots whose commands were applied
+        """
+        ok = self._succeeded(mask)
+        commands = []
+        if xy is not None:
+            xy = np.asarray(xy, dtype=np.float64)
+            commands += [(_X, xy[:, 0]), (_Y, xy[:, 1])]
+        for column, values in ((_Z, z), (_ROTATION, rotation), (_CLAW, gripper)):
+            if values is not None:
+                commands.append((column, np.asarray(values, dtype=np.float64)))
+        for column, values in commands:
+            update = ok & ~np.isnan(values)
+            self.targets[update, column] = values[update]
+        return ok
+
+    def advance(self, dt):
+        """
+        Move every axis towards its target for `dt` simulated seconds
+
+        Args:
+            dt (float): Simulated time step in seconds
+
+        Returns:
+            None
+        """
+        delta = self.targets - self.positions
+        reach = self.speeds * dt
+        np.greater(np.abs(delta), reach, out=self._moving)
+        self.positions += np.clip(delta, -reach, reach)
+        self.time += dt
+
+    def get_state(self):
+        """
+        Get the state of every robot
+
+        Returns:
+            states (numpy.ndarray): (num_robots, 8) float64 in STATE_FIELDS order, NaN rows
+                for failed reads
+            timestamps (numpy.ndarray): (num_robots,) simulated timestamps, NaN for failed reads
+            ok (numpy.ndarray): (num_robots,) bool, robots whose read succeeded
+        """
+        ok = self._succeeded()
+        states = self._states
+        states[:, 0:5] = self.positions
+        states[:, 5] = np.where(self._moving[:, _Z], 0.4, 0.05)
+        states[:, 6] = np.where(self._moving[:, _ROTATION], 0.3, 0.03)
+        claw_current = np.where(self.positions[:, _CLAW] < 0.05, 0.15, 0.02)
+        states[:, 7] = np.where(self._moving[:, _CLAW], 0.3, claw_current)
+        states[~ok] = np.nan
+        self._timestamps[:] = self.time
+        self._timestamps[~ok] = np.nan
+        return states, self._timestamps, ok
+
+    def step(self, xy=None, z=None, rotation=None, gripper=None, dt=0.1):
+        """
+        Apply a batch of actions, advance the simulation and read the states
+
+        Args:
+            xy, z, rotation, gripper: Actions, see apply()
+            dt (float): Simulated time step in seconds
+
+        Returns:
+            states (numpy.ndarray): (num_robots, 8) states, see get_state()
+            timestamps (numpy.ndarray): (num_robots,) timestamps
+            ok (numpy.ndarray): (num_robots,) bool, robots whose command and read both succeeded
+        """
+        applied = self.apply(xy, z, rotation, gripper)
+        self.advance(dt)
+        states, timestamps, ok = self.get_state()
+        return states, timestamps, ok & applied
+
+    def _buffers(self, camera, reduce):
+        key = (camera, reduce)
+        buffers = self._images.get(key)
+        if buffers is None:
+            height, width = TOP_SHAPE if camera == 'top' else BASE_SHAPE
+            height, width = height // reduce, width // reduce
+            background = np.empty((height, width, 3), dtype=np.uint8)
+            if camera == 'top':
+                background[:] = (70, 90, 100)
+                _draw_box(background, 160 / reduce, 60 / reduce, 1120 / reduce, 660 / reduce, (150, 160, 165))
+            else:
+                background[:] = (110, 100, 90)
+                _draw_box(background, 0, 400 / reduce, width, height, (60, 70, 80))
+            images = np.empty((self.num_robots, height, width, 3), dtype=np.uint8)
+            buffers = self._images[key] = (background, images)
+        return buffers
+
+    def get_images(self, camera='top', reduce=1):
+        """
+        Render the camera images of every robot into a preallocated batch
+
+        The static background is rendered once per camera and copied into the batch, and
+        the gripper geometry of all robots is computed in one pass before drawing.
+
+        Args:
+            camera (str): 'top' or 'base'
+            reduce (int): Downscale factor of the images (1, 2, 4 or 8)
+
+        Returns:
+            images (numpy.ndarray): (num_robots, height, width, 3) uint8 BGR images, black
+                for failed reads
+            timestamps (numpy.ndarray): (num_robots,) timestamps, NaN for failed reads
+            ok (numpy.ndarray): (num_robots,) bool, robots whose read succeeded
+        """
+        if camera not in ('top', 'base'):
+            raise ValueError(f"Unknown camera '{camera}', expected 'top' or 'base'")
+        if reduce not in (1, 2, 4, 8):
+            raise ValueError(f"reduce must be 1, 2, 4 or 8, got {reduce}")
+        ok = self._succeeded()
+        background, images = self._buffers(camera, reduce)
+        images[:] = background
+        if camera == 'top':
+            self._render_top(images, reduce, ok)
+        else:
+            self._render_base(images, reduce, ok)
+        images[~ok] = 0
+        timestamps = np.where(ok, self.time, np.nan)
+        return images, timestamps, ok
+
+    def _render_top(self, images, reduce, ok):
+        p = self.positions
+        cx = (160 + p[:, _X] * 960) / reduce
+        cy = (660 - p[:, _Y] * 600) / reduce
+        radius = (18 + 22 * p[:, _Z]) / reduce
+        angle = np.radians(p[:, _ROTATION])
+        opening = radius * (0.6 + 1.2 * p[:, _CLAW])
+        jaw_x = cx[:, None] + np.array((-1, 1)) * (opening * np.cos(angle))[:, None]
+        jaw_y = cy[:, None] - np.array((-1, 1)) * (opening * np.sin(angle))[:, None]
+        for i in np.flatnonzero(ok):
+            image = images[i]
+            _draw_disc(image, cx[i], cy[i], radius[i], (40, 40, 40))
+            for side in range(2):
+                _draw_disc(image, jaw_x[i, side], jaw_y[i, side], radius[i] * 0.35, (30, 30, 200))
+
+    def _render_base(self, images, reduce, ok):
+        p = self.positions
+        cx = (80 + p[:, _X] * 480) / reduce
+        bottom = (400 - p[:, _Z] * 300) / reduce
+        opening = (4 + 22 * p[:, _CLAW]) / reduce
+        r = 1 / reduce
+        for i in np.flatnonzero(ok):
+            image = images[i]
+            _draw_box(image, cx[i] - 6 * r, 0, cx[i] + 6 * r, bottom[i] - 20 * r, (50, 50, 50))
+            _draw_box(image, cx[i] - 30 * r, bottom[i] - 20 * r, cx[i] + 30 * r, bottom[i] - 8 * r, (40, 40, 40))
+            for side in (-1, 1):
+                jaw = cx[i] + side * opening[i]
+                _draw_box(image, jaw - 4 * r, bottom[i] - 8 * r, jaw + 4 * r, bottom[i] + 20 * r, (30, 30, 200))
@@ -0,0 +1,231 @@
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from client.cloudgripper_client import decode_image
+
+_STOP = object()
+
+
+def index_path(path):
+    """
+    Get the path of the timestamp index written next to a video
+
+    Args:
+        path (str): Path of the video file
+
+    Returns:
+        index_path (str): Path of the sidecar index
+    """
+    return path + '.timestamps.csv'
+
+
+class VideoSink:
+    """
+    Encode camera frames to a video file on a background thread
+
+    write() only queues a copy of the frame, so the control loop never waits for the
+    encoder and may reuse its image buffers right away. When the bounded queue is full the
+    frame is dropped and counted instead. write() may be called from several threads. The first frame
+    fixes the video size; later frames of another size are resized to it. Every encoded
+    frame's API timestamp is appended to a sidecar CSV index (frame,timestamp), see
+    VideoReader for frame-accurate seeking.
+
+    Args:
+        path (str): The video file, e.g. 'top.mp4'
+        fps (float): Frame rate stored in the video. The true capture times are in the index
+        fourcc (str): Four-character code of the codec, e.g. 'mp4v', 'avc1' or 'MJPG'
+        queue_size (int): Maximum number of frames waiting for the encoder
+    """
+
+    def __init__(self, path, fps=10.0, fourcc='mp4v', queue_size=32):
+        self.path = path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.written = 0
+        self.dropped = 0
+        self.error = None
+        self.frame_size = None
+
+        self._writer = None
+        self._index = open(index_path(path), 'w')
+        self._index.write('frame,timestamp\n')
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name='cloudgripper-video')
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, image, timestamp=None):
+        """
+        Queue a frame for encoding without blocking
+
+        Args:
+            image (numpy.ndarray or bytes): A BGR or grayscale image, or JPEG bytes from
+                getImageTop(raw=True). None (a failed camera call) is ignored
+            timestamp (float, optional): The API timestamp of the frame, defaults to now
+
+        Returns:
+            queued (bool): True if the frame was queued, False if it was dropped or None
+        """
+        if self.error is not None:
+            raise RuntimeError("The video encoder failed") from self.error
+        if self._closed:
+            raise RuntimeError("VideoSink is closed")
+        if image is None:
+            return False
+        if self._queue.full():
+            self._drop()
+            return False
+        if isinstance(image, np.ndarray):
+            # The encoder runs later, the caller may overwrite its array (e.g. an out= buffer) meanwhile
+            image = image.copy()
+        try:
+            self._queue.put_nowait((image, time.time() if timestamp is None else timestamp))
+            return True
+        except queue.Full:
+            self._drop()
+            return False
+
+    def _drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def stats(self):
+        """
+        Get the sink counters
+
+        Args:
+            None
+
+        Returns:
+            stats (dict): 'written' and 'dropped' frames, and 'queued' frames waiting for the encoder
+        """
+        return {'written': self.written, 'dropped': self.dropped, 'queued': self._queue.qsize()}
+
+    def close(self):
+        """
+        Encode the queued frames and finalize the video and its index
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self.error is not None:
+            raise RuntimeError("The video encoder failed") from self.error
+
+    def _open(self, image):
+        height, width = image.shape[:2]
+        self.frame_size = (width, height)
+        self._writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps,
+                                       self.frame_size)
+        if not self._writer.isOpened():
+            raise RuntimeError(f"Could not open a '{self.fourcc}' video writer for {self.path}")
+
+    def _encode(self, image, timestamp):
+        if not isinstance(image, np.ndarray):
+            image = decode_image(image)
+            if image is None:
+                return
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        if self._writer is None:
+            self._open(image)
+        if (image.shape[1], image.shape[0]) != self.frame_size:
+            image = cv2.resize(image, self.frame_size, interpolation=cv2.INTER_AREA)
+        self._writer.write(image)
+        self._index.write(f'{self.written},{float(timestamp)!r}\n')
+        self.written += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self._encode(*item)
+            except Exception as e:
+                self.error = e
+        if self._writer is not None:
+            self._writer.release()
+        self._index.close()
+
+
+class VideoReader:
+    """
+    Read a video written by VideoSink, seeking by API timestamp
+
+    Args:
+        path (str): The video file
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(index_path(path)):
+            raise FileNotFoundError(f"No timestamp index for {path}")
+        self.path = path
+        index = np.loadtxt(index_path(path), delimiter=',', skiprows=1, ndmin=2)
+        self.timestamps = index[:, 1] if len(index) else np.empty(0)
+        self._capture = cv2.VideoCapture(path)
+        self._position = 0
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._capture.release()
+
+    def frame_at(self, timestamp):
+        """
+        Get the index of the last frame captured at or before a timestamp
+
+        Args:
+            timestamp (float): Time in seconds since the epoch
+
+        Returns:
+            index (int): The frame index, -1 if the video starts after the timestamp
+        """
+        return int(np.searchsorted(self.timestamps, timestamp, side='right')) - 1
+
+    def read(self, index):
+        """
+        Decode one frame
+
+        Args:
+            index (int): The frame index
+
+        Returns:
+            image (numpy.ndarray): The BGR frame, None if it could not be read
+            timestamp (float): The API timestamp of the frame
+        """
+        if not 0 <= index < len(self.timestamps):
+            raise IndexError(f"Frame {index} out of range for {len(self.timestamps)} frames")
+        if index != self._position:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ok, image = self._capture.read()
+        self._position = index + 1
+        return (image if ok else None), float(self.timestamps[index])